@@ -0,0 +1,90 @@
+"""
+Mesure du débit (lignes/s) du tokenizer, du backplot et de MPFParser.
+
+Usage (depuis le dossier du workbench) :
+  python -m Backplot.Benchmark            # programme synthétique
+  python -m Backplot.Benchmark prog.MPF   # programme réel
+"""
+import math
+import sys
+import time
+
+import numpy as np
+
+from Backplot.Interpreter import BackplotInterpreter
+from Backplot.SpatialIndex import SegmentGrid
+from Backplot.Tokenizer import tokenize
+
+
+def synthetic_program(n_lines=100000):
+    """Spirale de poche : lignes G1 et arcs G3 (tangents au cercle courant)"""
+    lines = ["; programme de test", "T1 S1200", "G0 X5 Y0 Z10", "G1 Z-1 F300"]
+    i = 1
+    while len(lines) < n_lines:
+        a = i * 0.01
+        r = 5 + a / 20
+        x, y = r * math.cos(a), r * math.sin(a)
+        if i % 10 == 0:
+            # arc de centre l'origine depuis le point précédent (rayon du point d'arrivée)
+            px, py = r * math.cos(a - 0.01), r * math.sin(a - 0.01)
+            lines.append("G1 X{:.4f} Y{:.4f}".format(px, py))
+            lines.append("G3 X{:.4f} Y{:.4f} I{:.4f} J{:.4f}".format(x, y, -px, -py))
+        else:
+            lines.append("G1 X{:.4f} Y{:.4f}".format(x, y))
+        i += 1
+    lines.append("M30")
+    return "\n".join(lines)
+
+
+def measure(fn, content, repeat=3):
+    """Meilleur temps sur repeat exécutions"""
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(content)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(content):
+    from MPFParser import MPFParser
+
+    n = content.count("\n") + 1
+    paths = [
+        ("tokenize", tokenize),
+        ("backplot", lambda c: BackplotInterpreter().run(c)),
+        ("MPFParser", lambda c: MPFParser(c).parse()),
+    ]
+    results = {}
+    for name, fn in paths:
+        t = measure(fn, content)
+        results[name] = n / t if t > 0 else math.inf
+        print("{:<10} {:>9} lignes  {:8.3f} s  {:>12,.0f} lignes/s".format(name, n, t, results[name]))
+    pick(BackplotInterpreter().run(content))
+    return results
+
+
+def pick(store, n_queries=1000):
+    """Temps de construction de l'index spatial et temps moyen d'une requête de survol"""
+    p0, p1 = store.endpoints()
+    t0 = time.perf_counter()
+    grid = SegmentGrid(p0, p1)
+    build = time.perf_counter() - t0
+
+    rng = np.random.default_rng(0)
+    targets = p0[rng.integers(0, len(p0), n_queries)]
+    directions = rng.normal(size=(n_queries, 3))
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    t0 = time.perf_counter()
+    for target, direction in zip(targets, directions):
+        grid.query(target - 1000 * direction, direction, 0.1)
+    query = (time.perf_counter() - t0) / n_queries
+    print("{:<10} {:>9} segments {:8.3f} s  {:>12.3f} ms/requête".format("pick", len(store), build, query * 1000))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r") as file:
+            run(file.read())
+    else:
+        run(synthetic_program())
@@ -0,0 +1,106 @@
+"""
+Cache LRU des backplots, partagé par tout le processus.
+
+Une opération liée (LinkedObject), un document rouvert ou une simulation
+relancée sur le même programme retrouvent le parcours déjà discrétisé au
+lieu de réinterpréter le G-code. La clé est une empreinte du texte et des
+réglages de discrétisation ; la taille totale est bornée par max_bytes.
+
+  key = BackplotCache.key(gcode_text, tolerance, coarse_tolerance)
+  entry = backplot_cache.get(key)        # CachedBackplot ou None
+  backplot_cache.put(key, CachedBackplot(store, coarse_store, text_lines, warnings))
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 256  # Mo
+
+
+class CachedBackplot:
+    """Parcours discrétisé (stores en lecture seule) et informations associées au texte"""
+    def __init__(self, store, coarse_store, text_lines, warnings, line_index=None):
+        self.store = store
+        self.coarse_store = coarse_store
+        self.text_lines = text_lines
+        self.warnings = list(warnings)
+        self.line_index = line_index
+
+    @property
+    def nbytes(self):
+        n = self.store.nbytes + sum(len(l) for l in self.text_lines) + 8 * len(self.text_lines)
+        if self.coarse_store is not None:
+            n += self.coarse_store.nbytes
+        if self.line_index is not None:
+            n += self.line_index.order.nbytes + self.line_index.offsets.nbytes
+        return n
+
+
+class BackplotCache:
+    """LRU borné en mémoire, utilisable depuis plusieurs threads"""
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE << 20):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(gcode_text, tolerance, coarse_tolerance=None):
+        digest = hashlib.sha1(gcode_text.encode("utf-8", "surrogatepass")).hexdigest()
+        coarse = None if coarse_tolerance is None else float(coarse_tolerance)
+        return digest, float(tolerance), coarse
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        size = entry.nbytes
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            if size > self.max_bytes:
+                # plus grand que tout le cache : ne pas vider le cache pour lui
+                return
+            self._entries[key] = entry
+            self.nbytes += size
+            self._evict()
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.nbytes -= entry.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Compteurs pour le diagnostic : entrées, octets, succès, échecs"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.nbytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+# cache du processus, partagé par tous les view providers
+backplot_cache = BackplotCache()
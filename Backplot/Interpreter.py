@@ -0,0 +1,527 @@
+"""
+Interprétation d'un programme G-code pour le backplot.
+
+Ne dépend ni de FreeCAD ni de coin : les mouvements sont enregistrés dans une
+MoveTable puis discrétisés (Backplot.Tessellation) dans un SegmentStore que le
+view provider, le picking et GcodeAnimator lisent directement.
+"""
+import math
+from enum import Enum
+
+from Backplot.SegmentStore import MOTION_FEED, MOTION_RAPID
+from Backplot.Tessellation import DEFAULT_CHORD_TOLERANCE, MoveTable, TessellatedPath
+from Backplot.Tokenizer import tokenize
+
+
+class comp(Enum):
+    G40 = 0
+    G41 = 1
+    G42 = 2
+
+class absinc(Enum):
+    G90 = 0
+    G91 = 1
+
+
+class memory():
+    def __init__(self):
+        #labels tableau de string et int
+        self.labels = {}
+        self.variables = {}
+        self.current_cycle = None
+        self.absincMode = absinc.G90
+
+    def addLabel(self, key, value):
+        self.labels[key]= value
+
+
+def centers_from_radius(p0, p1, R):
+    """compute circle centers from radius R (returns one center that matches direction if requested)"""
+    (x1, y1) = (p0[0], p0[1])
+    (x2, y2) = (p1[0], p1[1])
+    dx = x2 - x1
+    dy = y2 - y1
+    d2 = dx*dx + dy*dy
+    if d2 == 0.0:
+        return None  # identical points
+    d = math.sqrt(d2)
+    if d > 2.0 * R + 1e-12:
+        return None  # impossible with given radius
+    # midpoint
+    mx = (x1 + x2) / 2.0
+    my = (y1 + y2) / 2.0
+    # distance from midpoint to center
+    h = math.sqrt(max(R*R - (d/2.0)*(d/2.0), 0.0))
+    ux = -dy / d
+    uy = dx / d
+    c1 = (mx + ux * h, my + uy * h)
+    c2 = (mx - ux * h, my - uy * h)
+    return c1, c2
+
+
+# représentation intermédiaire : une instruction par ligne non vide, compilée à sa première exécution
+OP_NOP = 0          # commentaire
+OP_LABEL = 1        # (nom,)
+OP_REPEAT = 2       # (label de début, label de fin ou None, nombre de répétitions "P=..." ou None)
+OP_END = 3          # M30
+OP_VARIABLE = 4     # (nom, valeur) ou None si l'affectation est invalide
+OP_LINEAR = 5       # (type de mouvement, mots)
+OP_ARC = 6          # (sens trigo, mots)
+OP_COMP = 7         # (comp,)
+OP_ABSINC = 8       # (absinc,)
+OP_CYCLE_OFF = 9
+OP_CYCLE = 10       # (paramètres du cycle,)
+OP_IGNORED = 11     # (mots, texte)
+
+
+def parse_xyz(words, prev, absinc_mode=absinc.G90):
+    """helper to compute the X Y Z target of a line from its words"""
+    x, y, z = prev
+    if absinc_mode == absinc.G90:
+        return (words.get("X", x), words.get("Y", y), words.get("Z", z))
+    return (x + words.get("X", 0.0), y + words.get("Y", 0.0), z + words.get("Z", 0.0))
+
+
+def parse_ijr(words):
+    """helper to read I/J/R (center offsets or radius)"""
+    return words.get("I"), words.get("J"), words.get("R")
+
+
+class BackplotCancelled(Exception):
+    """Évaluation abandonnée : une demande plus récente l'a rendue inutile"""
+    pass
+
+
+class checkpoint():
+    """État modal de l'interpréteur avant une ligne du programme principal (hors REPEAT)"""
+    def __init__(self, interpreter):
+        mem = interpreter.mem
+        self.line = interpreter.line
+        self.cur = interpreter.cur
+        self.comp_mode = interpreter.comp_mode
+        self.absinc_mode = interpreter.absinc_mode
+        self.current_cycle = dict(mem.current_cycle) if mem.current_cycle is not None else None
+        self.absincMode = mem.absincMode
+        self.variables = dict(mem.variables)
+        self.labels = dict(mem.labels)
+        self.n_moves = len(interpreter.moves)
+        self.n_warnings = len(interpreter.warnings)
+
+    def restore(self, interpreter):
+        mem = memory()
+        mem.current_cycle = dict(self.current_cycle) if self.current_cycle is not None else None
+        mem.absincMode = self.absincMode
+        mem.variables = dict(self.variables)
+        mem.labels = dict(self.labels)
+        interpreter.mem = mem
+        interpreter.line = self.line
+        interpreter.cur = self.cur
+        interpreter.comp_mode = self.comp_mode
+        interpreter.absinc_mode = self.absinc_mode
+        interpreter.moves.truncate(self.n_moves)
+        # les avertissements des lignes avant le checkpoint restent valables
+        del interpreter.warnings[self.n_warnings:]
+
+
+class BackplotInterpreter:
+    """
+    Rejoue un programme G-code (G0/G1/G2/G3, G81/G83, G90/G91, labels, REPEAT, variables R)
+    et enregistre chaque mouvement dans une MoveTable, discrétisée dans un SegmentStore
+    avec un écart de corde <= tolerance.
+    L'état modal est sauvegardé toutes les checkpoint_every lignes : après une
+    modification du texte, update() ne réévalue que depuis le dernier checkpoint
+    précédant la première ligne modifiée.
+    Usage:
+      interpreter = BackplotInterpreter()
+      store = interpreter.run(gcode_text)
+      first_segment, first_vertex = interpreter.update(new_gcode_text)
+    """
+    def __init__(self, store=None, checkpoint_every=500, tolerance=DEFAULT_CHORD_TOLERANCE):
+        self.moves = MoveTable()
+        self.path = TessellatedPath(tolerance, store)
+        self.store = self.path.store
+        self.first_move = 0
+        self.checkpoint_every = max(int(checkpoint_every), 1)
+        self.checkpoints = []
+        self.text_lines = None
+        self.warnings = []
+        # callable testé à chaque checkpoint : True -> BackplotCancelled
+        self.cancelled = None
+
+    def _load(self, gcode_text, text_lines):
+        self.text_lines = text_lines
+        # (numéro de ligne source, texte) des lignes non vides
+        self.lines = [(i, l.strip()) for i, l in enumerate(text_lines) if l.strip()]
+        # mots adresse de tout le programme, découpés en une passe
+        self.program = tokenize(gcode_text)
+        self.ops = [None] * len(self.lines)
+
+    def run(self, gcode_text, cancelled=None):
+        self.cancelled = cancelled
+        self._load(gcode_text, gcode_text.splitlines())
+        self.warnings = []
+        self.moves.clear()
+        self.path.invalidate(0)
+        self.first_move = 0
+        self.checkpoints = []
+
+        # current position (start at origin)
+        self.cur = (0.0, 0.0, 0.0)
+        self.comp_mode = comp.G40  # default cutter compensation off
+        self.absinc_mode = absinc.G90  # default absolute mode
+        self.mem = memory()
+        # déplacements calculés en absolu (G90, cycles) : une passe qui en contient n'est pas translatable
+        self.absolute_moves = 0
+        self.line = 0
+        self.src_line = 0
+        self.next_checkpoint = 0
+
+        self.processGcode()
+        self.path.build(self.moves, 0)
+        return self.store
+
+    def set_tolerance(self, tolerance):
+        """Change l'écart de corde et rediscrétise tous les mouvements (sans réinterpréter)"""
+        self.path.set_tolerance(tolerance)
+        self.first_move = 0
+        return self.path.build(self.moves, 0)
+
+    def first_changed_line(self, text_lines):
+        """Première ligne source qui diffère du texte évalué précédemment (None si identique)"""
+        old = self.text_lines
+        for i, (a, b) in enumerate(zip(old, text_lines)):
+            if a != b:
+                return i
+        if len(old) != len(text_lines):
+            return min(len(old), len(text_lines))
+        return None
+
+    def update(self, gcode_text, cancelled=None):
+        """
+        Réévalue le programme après une modification du texte.
+        Retourne (premier segment, premier sommet) réécrits dans le store,
+        ou None si le texte n'a pas changé.
+        cancelled : callable testé régulièrement, l'évaluation lève BackplotCancelled s'il retourne True.
+        """
+        text_lines = gcode_text.splitlines()
+        if self.text_lines is None or not self.checkpoints:
+            self.run(gcode_text, cancelled)
+            return 0, 0
+        changed = self.first_changed_line(text_lines)
+        if changed is None:
+            return None
+
+        # dernier checkpoint dont la ligne n'est pas après la première modification
+        k = 0
+        for i, cp in enumerate(self.checkpoints):
+            if self.lines[cp.line][0] > changed:
+                break
+            k = i
+        cp = self.checkpoints[k]
+        del self.checkpoints[k + 1:]
+
+        self.cancelled = cancelled
+        self._load(gcode_text, text_lines)
+        cp.restore(self)
+        # les mouvements après le checkpoint vont changer : la discrétisation n'est plus valide au-delà
+        self.path.invalidate(cp.n_moves)
+        self.first_move = cp.n_moves
+        self.src_line = self.lines[cp.line][0] if cp.line < len(self.lines) else 0
+        self.next_checkpoint = cp.line + self.checkpoint_every
+
+        self.processGcode()
+        return self.path.build(self.moves, cp.n_moves)
+
+    def append_segment(self, kind, a, b):
+        self.moves.add_line(a, b, kind, self.src_line)
+
+    def executeCycle(self):
+        new = self.cur
+
+        if self.mem.current_cycle["type"] == 81:
+
+            new = (new[0], new[1], self.mem.current_cycle["Z"])
+            self.append_segment(MOTION_FEED, self.cur, new)
+            self.cur = new
+            new = (new[0], new[1], self.mem.current_cycle["R"])
+            self.append_segment(MOTION_RAPID, self.cur, new)
+            self.cur = new
+
+        elif self.mem.current_cycle["type"] == 83:
+            start_z = self.cur[-1]
+            final_Z = self.mem.current_cycle["Z"]
+            done = start_z
+            prisePasse = self.mem.current_cycle["Q"]
+            while done > final_Z:
+                done = done-prisePasse
+                if done < final_Z:
+                    prisePasse = final_Z
+                new = (new[0], new[1], done)
+                self.append_segment(MOTION_FEED, self.cur, new)
+                self.cur = new
+                new = (new[0], new[1], self.mem.current_cycle["R"])
+                self.append_segment(MOTION_RAPID, self.cur, new)
+                self.cur = new
+
+        else:
+            raise ValueError()
+
+    def arc(self, words, is_ccw):
+        # Circular interpolation. Prefer I/J (center offsets). If only R given, compute center(s).
+        end = parse_xyz(words, self.cur, self.absinc_mode)
+        I, J, R = parse_ijr(words)
+
+        # same XY endpoint: full circle with I/J, nothing to draw otherwise
+        if (end[0], end[1]) == (self.cur[0], self.cur[1]) and I is None and J is None:
+            # nothing to do if no movement in XY
+            self.cur = (end[0], end[1], end[2])
+            return
+
+        center = None
+        radius = None
+        if I is not None or J is not None:
+            # center relative to start
+            i_val = I or 0.0
+            j_val = J or 0.0
+            cx = self.cur[0] + i_val
+            cy = self.cur[1] + j_val
+            center = (cx, cy)
+            radius = math.hypot(self.cur[0] - cx, self.cur[1] - cy)
+        elif R is not None:
+            # compute possible centers from R
+            cs = centers_from_radius(self.cur, end, R)
+            if cs is None:
+                # fallback to linear if impossible
+                self.append_segment(MOTION_FEED, self.cur, end)
+                self.cur = end
+                return
+            # choose center that yields correct direction (G2 cw => negative sweep)
+            c1, c2 = cs
+            # compute sweeps for both centers
+            def compute_sweep(c):
+                sx = math.atan2(self.cur[1]-c[1], self.cur[0]-c[0])
+                ex = math.atan2(end[1]-c[1], end[0]-c[0])
+                return ex - sx
+            # normalize sweeps
+            def norm_sweep(s):
+                if is_ccw:
+                    if s <= 0:
+                        s += 2*math.pi
+                else:
+                    if s >= 0:
+                        s -= 2*math.pi
+                return s
+            ns1 = norm_sweep(compute_sweep(c1))
+            ns2 = norm_sweep(compute_sweep(c2))
+            # choose the center with smaller absolute normalized sweep
+            center = c1 if abs(ns1) <= abs(ns2) else c2
+            radius = R
+        else:
+            # no center info -> fallback to linear
+            self.append_segment(MOTION_FEED, self.cur, end)
+            self.cur = end
+            return
+
+        # now we have center and radius
+        cx, cy = center
+
+        r = radius
+        if r <= 1e-12:
+            self.append_segment(MOTION_FEED, self.cur, end)
+            self.cur = end
+            return
+
+        # compute start and end angles
+        start_ang = math.atan2(self.cur[1] - cy, self.cur[0] - cx)
+        end_ang = math.atan2(end[1] - cy, end[0] - cx)
+        # compute sweep based on direction
+        sweep = end_ang - start_ang
+        if is_ccw:
+            if sweep <= 0:
+                sweep += 2 * math.pi
+        else:
+            if sweep >= 0:
+                sweep -= 2 * math.pi
+
+        # discrétisation différée : tous les arcs sont découpés ensemble par TessellatedPath
+        self.moves.add_arc(self.cur, end, center, r, start_ang, sweep, self.src_line)
+        self.cur = end
+
+    def repeat_count(self, value):
+        n_times = value.removeprefix("P=")
+        if n_times.isdigit():
+            return int(n_times)
+        if n_times.startswith("R"):
+            var_name = "R{}".format(n_times[1:])
+            if var_name in self.mem.variables:
+                return int(self.mem.variables[var_name])
+            raise Exception("Variable {} not defined for REPEAT".format(var_name))
+        return 1
+
+    def compile(self, index):
+        """Instruction de la ligne self.lines[index] (mots adresse décodés une seule fois)"""
+        src_line, ln = self.lines[index]
+        words = self.program.words(src_line)
+        g = words.get("G")
+
+        if g is None:
+            # lines without G word: comments, labels, REPEAT, variables, M codes
+            up = ln.upper()
+            if up.startswith("(") or up.startswith(";"):
+                return (OP_NOP,)
+            if up[0].isalpha() and up.endswith(":"):
+                return (OP_LABEL, up[:-1])
+            if up.startswith("REPEAT"):
+                parts = up.split()
+                if len(parts) == 2:  # REPEAT Start
+                    return (OP_REPEAT, parts[1], None, None)
+                if len(parts) == 3:  # REPEAT Start P=
+                    return (OP_REPEAT, parts[1], None, parts[2])
+                if len(parts) == 4:  # REPEAT Start End P=
+                    return (OP_REPEAT, parts[1], parts[2], parts[3])
+                return (OP_REPEAT, None, None, None)
+            if up.startswith("M") and words.get("M") == 30:
+                return (OP_END,)
+            if up.startswith("R") and "=" in up:
+                try:
+                    number = int(up[1:up.index("=")])
+                    value = float(up[up.index("=")+1:])
+                    return (OP_VARIABLE, "R{}".format(number), value)
+                except ValueError:
+                    return (OP_VARIABLE, None, None)
+
+        # consider only movement commands G0/G00 and G1/G01
+        if g == 0:
+            return (OP_LINEAR, MOTION_RAPID, words)
+        if g == 1:
+            return (OP_LINEAR, MOTION_FEED, words)
+        if g == 2 or g == 3:
+            return (OP_ARC, g == 3, words)
+        if g == 40:
+            return (OP_COMP, comp.G40)
+        if g == 41:
+            return (OP_COMP, comp.G41)
+        if g == 42:
+            return (OP_COMP, comp.G42)
+        if g == 80:
+            return (OP_CYCLE_OFF,)
+        if g == 81:
+            return (OP_CYCLE, {"type":81,"Z":words["Z"],"R":words["R"]})
+        if g == 83:
+            if words["Q"] <= 0: raise ValueError()
+            return (OP_CYCLE, {"type":83,"Z":words["Z"],"R":words["R"],"Q":words["Q"]})
+        if g == 90:
+            return (OP_ABSINC, absinc.G90)
+        if g == 91:
+            return (OP_ABSINC, absinc.G91)
+        # other lines may still change position if they contain coords
+        return (OP_IGNORED, words, ln)
+
+    def processGcode(self):
+        """Exécute le programme principal à partir de self.line"""
+        while self.line < len(self.lines):
+            if self.line >= self.next_checkpoint:
+                if self.cancelled is not None and self.cancelled():
+                    raise BackplotCancelled()
+                self.checkpoints.append(checkpoint(self))
+                self.next_checkpoint = self.line + self.checkpoint_every
+
+            index = self.line
+            self.line += 1
+            if not self.execute(index):
+                break
+
+    def execute(self, index):
+        """Exécute la ligne self.lines[index] ; retourne False en fin de programme (M30)"""
+        op = self.ops[index]
+        if op is None:
+            op = self.ops[index] = self.compile(index)
+        self.src_line = self.lines[index][0]
+        code = op[0]
+
+        if code == OP_LINEAR:
+            if self.absinc_mode == absinc.G90:
+                self.absolute_moves += 1
+            new = parse_xyz(op[2], self.cur, self.absinc_mode)
+            self.append_segment(op[1], self.cur, new)
+            self.cur = new
+            if self.mem.current_cycle is not None:
+                self.executeCycle()
+        elif code == OP_ARC:
+            if self.absinc_mode == absinc.G90:
+                self.absolute_moves += 1
+            self.arc(op[2], op[1])
+        elif code == OP_LABEL:
+            # label declaration, store label with the index of the next line
+            self.mem.addLabel(op[1], index + 1)
+        elif code == OP_REPEAT:
+            return self.repeat(op, index)
+        elif code == OP_END:
+            return False
+        elif code == OP_VARIABLE:
+            if op[1] is not None:
+                self.mem.variables[op[1]] = op[2]
+        elif code == OP_COMP:
+            self.comp_mode = op[1]
+        elif code == OP_ABSINC:
+            self.absinc_mode = op[1]
+        elif code == OP_CYCLE_OFF:
+            self.mem.current_cycle = None
+        elif code == OP_CYCLE:
+            self.mem.current_cycle = dict(op[1])
+            self.executeCycle()
+        elif code == OP_IGNORED:
+            words = op[1]
+            self.warnings.append("Ignoring line: {}".format(op[2]))
+            if "X" in words or "Y" in words or "Z" in words:
+                self.absolute_moves += 1
+                self.cur = parse_xyz(words, self.cur)
+                if self.mem.current_cycle is not None:
+                    self.executeCycle()
+        return True
+
+    def modal_state(self):
+        """État dont dépend l'exécution d'une ligne (hors position courante)"""
+        mem = self.mem
+        return (self.absinc_mode, self.comp_mode, mem.current_cycle, dict(mem.variables), dict(mem.labels))
+
+    def repeat(self, op, index):
+        """
+        REPEAT : rejoue les instructions déjà compilées du corps, sans récursion par passe.
+        Si une passe laisse l'état modal inchangé et ne contient que des déplacements
+        relatifs (ou revient à son point de départ), les passes suivantes sont des copies
+        translatées des mouvements de la première.
+        Retourne False si le corps contient la fin de programme.
+        """
+        _, label_begin, label_end, count = op
+        n_times = self.repeat_count(count) if count is not None else 1
+        if label_begin is None or label_begin not in self.mem.labels:
+            raise Exception("REPEAT label {} not found".format(label_begin))
+
+        start = self.mem.labels[label_begin]
+        # process from start until we reach the label_end or the REPEAT line itself
+        if label_end is not None and label_end in self.mem.labels:
+            stop = self.mem.labels[label_end] - 1
+        else:
+            stop = index
+
+        done = 0
+        while done < n_times:
+            state = self.modal_state()
+            cur = self.cur
+            first_move = len(self.moves)
+            absolute_moves = self.absolute_moves
+            for i in range(start, stop):
+                if not self.execute(i):
+                    return False
+            done += 1
+            if done == n_times or self.modal_state() != state:
+                continue
+            delta = (self.cur[0] - cur[0], self.cur[1] - cur[1], self.cur[2] - cur[2])
+            if absolute_moves == self.absolute_moves or delta == (0.0, 0.0, 0.0):
+                self.moves.replay(first_move, len(self.moves), delta, n_times - done)
+                if len(self.moves) > first_move:
+                    self.cur = self.moves.end[-1]
+                break
+        self.src_line = self.lines[index][0]
+        return True
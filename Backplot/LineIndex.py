@@ -0,0 +1,45 @@
+"""
+Index croisé ligne source <-> segments du backplot.
+
+  segment -> ligne   : store.lines[segment]                       O(1)
+  ligne(s) -> segments : LineIndex.segments(first, last)          O(1) + taille du résultat
+
+Les segments d'une même ligne ne sont pas forcément contigus (corps de
+REPEAT) : l'index est une table CSR (segments triés par ligne source).
+"""
+import numpy as np
+
+
+class LineIndex:
+    def __init__(self, lines, n_lines=None):
+        lines = np.asarray(lines, dtype=np.int32)
+        if n_lines is None:
+            n_lines = int(lines.max()) + 1 if len(lines) else 0
+        self.n_lines = int(n_lines)
+        self.lines = lines
+        # tri stable : les segments d'une ligne restent dans l'ordre du programme
+        self.order = np.argsort(lines, kind="stable").astype(np.int32)
+        self.offsets = np.zeros(self.n_lines + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lines, minlength=self.n_lines)[:self.n_lines], out=self.offsets[1:])
+
+    def line_of(self, segment):
+        """Ligne source (0-based) du segment"""
+        return int(self.lines[segment])
+
+    def segments(self, first, last=None):
+        """Segments (ordre programme pour une ligne) des lignes first à last incluses"""
+        if last is None:
+            last = first
+        first = min(max(int(first), 0), self.n_lines)
+        last = min(max(int(last), first - 1), self.n_lines - 1)
+        return self.order[self.offsets[first]:self.offsets[last + 1]]
+
+    def ranges(self, first, last=None):
+        """Plages contiguës [début, fin) des segments des lignes first à last : tableau (k, 2)"""
+        seg = np.sort(self.segments(first, last))
+        if len(seg) == 0:
+            return np.empty((0, 2), dtype=np.int64)
+        cut = np.flatnonzero(np.diff(seg) != 1) + 1
+        starts = np.concatenate(([seg[0]], seg[cut]))
+        stops = np.concatenate((seg[cut - 1], [seg[-1]])) + 1
+        return np.stack((starts, stops), axis=1).astype(np.int64)
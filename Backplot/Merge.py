@@ -0,0 +1,54 @@
+"""
+Fusion des backplots de plusieurs opérations en un seul jeu de lignes.
+
+Un projet de plusieurs dizaines d'opérations est dessiné avec un seul
+SoVertexProperty et un seul SoIndexedLineSet : chaque segment est une
+"part" du line set, coloré par materialIndex (2 * opération + type de
+mouvement) avec une liaison PER_PART_INDEXED.
+"""
+import numpy as np
+
+
+class MergedBackplot:
+    """
+    vertices       : float32 (n, 3)      sommets de toutes les opérations, bout à bout
+    coord_index    : int32 (3 * k,)      [s, s + 1, -1] par segment
+    material_index : int32 (k,)          2 * indice de l'opération + type de mouvement
+    seg_offsets    : int64 (ops + 1,)    premier segment de chaque opération
+    """
+    def __init__(self, stores):
+        stores = list(stores)
+        n_vertices = np.array([s.n_vertices for s in stores], dtype=np.int64)
+        n_segments = np.array([s.n_segments for s in stores], dtype=np.int64)
+        vtx_offsets = np.concatenate(([0], np.cumsum(n_vertices)))
+        self.seg_offsets = np.concatenate(([0], np.cumsum(n_segments)))
+        self.n_ops = len(stores)
+
+        total = int(self.seg_offsets[-1])
+        self.vertices = np.empty((int(vtx_offsets[-1]), 3), dtype=np.float32)
+        starts = np.empty(total, dtype=np.int64)
+        self.material_index = np.empty(total, dtype=np.int32)
+        for i, store in enumerate(stores):
+            a, b = self.seg_offsets[i], self.seg_offsets[i + 1]
+            self.vertices[vtx_offsets[i]:vtx_offsets[i + 1]] = store.vertices
+            starts[a:b] = store.starts + vtx_offsets[i]
+            self.material_index[a:b] = 2 * i + store.kinds.astype(np.int32)
+
+        idx = np.empty((total, 3), dtype=np.int32)
+        idx[:, 0] = starts
+        idx[:, 1] = starts + 1
+        idx[:, 2] = -1
+        self.coord_index = idx.ravel()
+
+    def __len__(self):
+        return len(self.material_index)
+
+    def operation_of(self, segment):
+        """Indice (dans stores) de l'opération d'un segment fusionné"""
+        return int(np.searchsorted(self.seg_offsets, segment, side="right")) - 1
+
+
+def packed_colors(colors):
+    """Couleurs (r, g, b) 0..1 -> entiers RGBA 0xRRGGBBAA pour SoVertexProperty.orderedRGBA"""
+    rgb = np.clip(np.round(np.asarray(colors, dtype=np.float64).reshape(-1, 3) * 255), 0, 255).astype(np.uint32)
+    return [int(v) for v in (rgb[:, 0] << 24) | (rgb[:, 1] << 16) | (rgb[:, 2] << 8) | 0xFF]
@@ -0,0 +1,176 @@
+"""
+Stockage colonnaire des segments du backplot.
+
+Tous les consommateurs (noeuds coin, picking, GcodeAnimator) lisent le même
+stockage : aucun tuple par segment n'est conservé.
+
+  xyz   : float32 (n_vertices, 3)  sommets partagés
+  start : int32   (n_segments,)    indice du premier sommet du segment (le second est start + 1)
+  kind  : uint8   (n_segments,)    type de mouvement (MOTION_RAPID, MOTION_FEED)
+  line  : int32   (n_segments,)    ligne source (0-based) dans le texte G-code
+"""
+import numpy as np
+
+MOTION_RAPID = 0
+MOTION_FEED = 1
+
+MOTION_NAMES = {
+    MOTION_RAPID: "rapid",
+    MOTION_FEED: "feed",
+}
+
+
+class SegmentStore:
+    """
+    Tableaux NumPy extensibles décrivant les segments d'un parcours d'outil.
+    Les ajouts sont accumulés dans des listes python et recopiés en bloc dans
+    les tableaux à la première lecture.
+    """
+
+    def __init__(self, capacity=1024):
+        capacity = max(int(capacity), 16)
+        self._xyz = np.empty((capacity + 1, 3), dtype=np.float32)
+        self._start = np.empty(capacity, dtype=np.int32)
+        self._kind = np.empty(capacity, dtype=np.uint8)
+        self._line = np.empty(capacity, dtype=np.int32)
+        self.n_vertices = 0
+        self.n_segments = 0
+        # ajouts pas encore recopiés dans les tableaux
+        self._new_xyz = []
+        self._new_seg = []
+        # dernier point ajouté (valeur python exacte, évite les écarts float32)
+        self._last = None
+
+    def __len__(self):
+        return self.n_segments
+
+    @property
+    def nbytes(self):
+        return self._xyz.nbytes + self._start.nbytes + self._kind.nbytes + self._line.nbytes
+
+    def clear(self):
+        self.n_vertices = 0
+        self.n_segments = 0
+        self._new_xyz = []
+        self._new_seg = []
+        self._last = None
+
+    def truncate(self, n_segments, n_vertices, last):
+        """Revient à un état antérieur (n_segments, n_vertices, dernier point) pour réécrire la suite"""
+        self._flush()
+        self.n_segments = n_segments
+        self.n_vertices = n_vertices
+        self._last = last
+
+    def copy(self):
+        """Copie indépendante (tableaux à la taille exacte), lisible pendant que l'original est modifié"""
+        self._flush()
+        other = SegmentStore(self.n_segments)
+        other.extend(self.vertices.copy(), self.starts.copy(), self.kinds, self.lines, self._last)
+        return other
+
+    def _reserve_vertices(self, n):
+        if n > len(self._xyz):
+            done = self.n_vertices - len(self._new_xyz)
+            new = np.empty((max(n, 2 * len(self._xyz)), 3), dtype=np.float32)
+            new[:done] = self._xyz[:done]
+            self._xyz = new
+
+    def _reserve_segments(self, n):
+        if n > len(self._start):
+            done = self.n_segments - len(self._new_seg)
+            size = max(n, 2 * len(self._start))
+            for name in ("_start", "_kind", "_line"):
+                old = getattr(self, name)
+                new = np.empty(size, dtype=old.dtype)
+                new[:done] = old[:done]
+                setattr(self, name, new)
+
+    def _flush(self):
+        """Recopie les ajouts en attente dans les tableaux"""
+        if self._new_xyz:
+            self._reserve_vertices(self.n_vertices)
+            self._xyz[self.n_vertices - len(self._new_xyz):self.n_vertices] = self._new_xyz
+            self._new_xyz = []
+        if self._new_seg:
+            self._reserve_segments(self.n_segments)
+            start, kind, line = zip(*self._new_seg)
+            first = self.n_segments - len(self._new_seg)
+            self._start[first:self.n_segments] = start
+            self._kind[first:self.n_segments] = kind
+            self._line[first:self.n_segments] = line
+            self._new_seg = []
+
+    def add(self, a, b, kind, line):
+        """Ajoute le segment a -> b. Le sommet a est partagé avec le segment précédent s'il est identique."""
+        if self._last is None or a != self._last:
+            self._new_xyz.append(a)
+            self.n_vertices += 1
+        self._new_xyz.append(b)
+        self.n_vertices += 1
+        self._last = b
+        self._new_seg.append((self.n_vertices - 2, kind, line))
+        self.n_segments += 1
+
+    def extend(self, xyz, start, kind, line, last):
+        """Ajoute un bloc de sommets et de segments (start relatif au premier sommet du bloc)"""
+        self._flush()
+        nv, ns = len(xyz), len(start)
+        self._reserve_vertices(self.n_vertices + nv)
+        self._reserve_segments(self.n_segments + ns)
+        self._xyz[self.n_vertices:self.n_vertices + nv] = xyz
+        self._start[self.n_segments:self.n_segments + ns] = start + self.n_vertices
+        self._kind[self.n_segments:self.n_segments + ns] = kind
+        self._line[self.n_segments:self.n_segments + ns] = line
+        self.n_vertices += nv
+        self.n_segments += ns
+        self._last = last
+
+    # --- vues en lecture -------------------------------------------------
+
+    @property
+    def vertices(self):
+        self._flush()
+        return self._xyz[:self.n_vertices]
+
+    @property
+    def starts(self):
+        self._flush()
+        return self._start[:self.n_segments]
+
+    @property
+    def kinds(self):
+        self._flush()
+        return self._kind[:self.n_segments]
+
+    @property
+    def lines(self):
+        self._flush()
+        return self._line[:self.n_segments]
+
+    def segment_ids(self, kind=None):
+        """Indices (ordre programme) des segments d'un type donné, ou de tous les segments"""
+        if kind is None:
+            return np.arange(self.n_segments, dtype=np.int32)
+        return np.flatnonzero(self.kinds == kind).astype(np.int32)
+
+    def endpoints(self, ids=None):
+        """Retourne (p0, p1) en float64, de forme (k, 3), pour les segments ids"""
+        xyz = self.vertices
+        s = self.starts if ids is None else self.starts[ids]
+        return xyz[s].astype(np.float64), xyz[s + 1].astype(np.float64)
+
+    def endpoint(self, seg):
+        """Retourne le segment seg sous forme de deux tuples (x, y, z)"""
+        xyz = self.vertices
+        s = int(self.starts[seg])
+        return tuple(float(v) for v in xyz[s]), tuple(float(v) for v in xyz[s + 1])
+
+    def line_set_index(self, kind, first=0):
+        """coordIndex d'un SoIndexedLineSet pour les segments d'un type à partir de first : [s, s+1, -1, ...]"""
+        s = self.starts[first:][self.kinds[first:] == kind]
+        idx = np.empty((len(s), 3), dtype=np.int32)
+        idx[:, 0] = s
+        idx[:, 1] = s + 1
+        idx[:, 2] = -1
+        return idx.ravel()
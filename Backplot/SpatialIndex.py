@@ -0,0 +1,201 @@
+"""
+Index spatial (grille uniforme) des segments du backplot pour le survol.
+
+La grille est construite une fois par évaluation du programme ; une requête
+ne teste que les segments des cellules traversées par le rayon de la souris :
+
+  index = SegmentGrid(*store.endpoints())
+  hit = index.query(origin, direction, radius)   # (segment, t, distance) ou None
+"""
+import numpy as np
+
+# segments visés par cellule (la grille est dimensionnée en conséquence)
+SEGMENTS_PER_CELL = 4
+MAX_CELLS = 1 << 21
+# au-delà de ce nombre de cellules par axe autour d'un échantillon, la requête teste tous les segments
+MAX_SPAN = 4
+
+
+def ray_segment_distance(origin, direction, p0, p1):
+    """
+    Distance entre le rayon origin + t * direction (t >= 0, direction unitaire)
+    et les segments p0 -> p1 (k, 3). Retourne (distance, t, s) avec s le paramètre sur le segment.
+    """
+    e = p1 - p0
+    w = origin - p0
+    b = e @ direction
+    c = np.einsum("ij,ij->i", e, e)
+    d = w @ direction
+    f = np.einsum("ij,ij->i", e, w)
+    denom = c - b * b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(denom > 1e-12, (f - b * d) / denom, 0.0)
+        s = np.clip(s, 0.0, 1.0)
+        t = np.maximum(s * b - d, 0.0)
+        s = np.where(c > 1e-12, np.clip((t * b + f) / c, 0.0, 1.0), 0.0)
+    diff = w + t[:, None] * direction - s[:, None] * e
+    return np.sqrt(np.einsum("ij,ij->i", diff, diff)), t, s
+
+
+class SegmentGrid:
+    """Grille uniforme : cellule -> segments (CSR), construite à partir des extrémités p0, p1 (k, 3)"""
+
+    def __init__(self, p0, p1, cell_size=None):
+        self.p0 = np.asarray(p0, dtype=np.float64)
+        self.p1 = np.asarray(p1, dtype=np.float64)
+        n = len(self.p0)
+        if n == 0:
+            self.lo = np.zeros(3)
+            self.cell = 1.0
+            self.dims = np.ones(3, dtype=np.int64)
+            self.offsets = np.zeros(2, dtype=np.int64)
+            self.items = np.empty(0, dtype=np.int64)
+            return
+
+        lo = np.minimum(self.p0.min(axis=0), self.p1.min(axis=0))
+        hi = np.maximum(self.p0.max(axis=0), self.p1.max(axis=0))
+        extent = hi - lo
+        extent = np.maximum(extent, max(extent.max() * 0.01, 1e-6))
+        if cell_size is None:
+            target = min(max(n / SEGMENTS_PER_CELL, 1.0), MAX_CELLS)
+            cell_size = (np.prod(extent) / target) ** (1.0 / 3.0)
+        self.cell = float(cell_size)
+        self.lo = lo - self.cell * 0.5
+        self.dims = np.maximum(np.ceil((extent + self.cell) / self.cell), 1).astype(np.int64)
+
+        # échantillons tous les cell/2 le long de chaque segment, inscrits dans les cellules
+        # de la boîte [échantillon +- cell/4] : tout point du segment est dans une cellule inscrite
+        length = np.linalg.norm(self.p1 - self.p0, axis=1)
+        n_samples = np.ceil(length / (self.cell * 0.5)).astype(np.int64) + 1
+        seg = np.repeat(np.arange(n), n_samples)
+        first = np.cumsum(n_samples) - n_samples
+        k = np.arange(len(seg)) - first[seg]
+        u = k / np.maximum(n_samples[seg] - 1, 1)
+        samples = self.p0[seg] + (self.p1[seg] - self.p0[seg]) * u[:, None]
+        cells, owner = self._box_cells(samples, self.cell * 0.25, seg)
+        key = np.unique(cells * n + owner)
+        cells, owner = key // n, key % n
+
+        self.items = owner
+        self.offsets = np.zeros(int(np.prod(self.dims)) + 1, dtype=np.int64)
+        np.add.at(self.offsets, cells + 1, 1)
+        np.cumsum(self.offsets, out=self.offsets)
+
+    def __len__(self):
+        return len(self.p0)
+
+    def _box_cells(self, centers, half, owner):
+        """Cellules couvertes par les boîtes [centre +- half] ; retourne (cellules, propriétaire de la boîte)"""
+        i0 = np.clip(np.floor((centers - half - self.lo) / self.cell), 0, self.dims - 1).astype(np.int64)
+        i1 = np.clip(np.floor((centers + half - self.lo) / self.cell), 0, self.dims - 1).astype(np.int64)
+        span = int((i1 - i0).max()) + 1 if len(centers) else 1
+        if span > MAX_SPAN:
+            return None, None
+        r = np.arange(span)
+        offsets = np.stack(np.meshgrid(r, r, r, indexing="ij"), axis=-1).reshape(-1, 3)
+        idx = i0[:, None, :] + offsets[None, :, :]
+        valid = np.all(idx <= i1[:, None, :], axis=2)
+        idx = idx[valid]
+        owner = np.broadcast_to(owner[:, None], valid.shape)[valid]
+        cells = (idx[:, 0] * self.dims[1] + idx[:, 1]) * self.dims[2] + idx[:, 2]
+        return cells, owner
+
+    def _clip_ray(self, origin, direction):
+        """Intervalle [t0, t1] du rayon dans la boîte de la grille (None si pas d'intersection)"""
+        hi = self.lo + self.dims * self.cell
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv = 1.0 / direction
+            ta = (self.lo - origin) * inv
+            tb = (hi - origin) * inv
+        tmin = np.where(np.isnan(ta), -np.inf, np.minimum(ta, tb))
+        tmax = np.where(np.isnan(tb), np.inf, np.maximum(ta, tb))
+        # axe parallèle au rayon : l'origine doit être dans la tranche
+        parallel = direction == 0.0
+        if np.any(parallel & ((origin < self.lo) | (origin > hi))):
+            return None
+        t0 = max(float(np.max(np.where(parallel, -np.inf, tmin))), 0.0)
+        t1 = float(np.min(np.where(parallel, np.inf, tmax)))
+        if t1 < t0:
+            return None
+        return t0, t1
+
+    def _ray_samples(self, origin, direction, radius):
+        """Paramètres t des échantillons du rayon (tous les cell/2) dans la grille, None si hors grille"""
+        clipped = self._clip_ray(origin, direction)
+        if clipped is None:
+            return None
+        t0, t1 = clipped
+        t0 = max(t0 - radius, 0.0)
+        t1 = t1 + radius
+        n = int(np.ceil((t1 - t0) / (self.cell * 0.5))) + 1
+        return np.linspace(t0, t1, n)
+
+    def candidates(self, origin, direction, radius, t=None):
+        """
+        Segments (avec doublons) des cellules à moins de radius des échantillons t du rayon
+        (tout le rayon par défaut). None : trop de cellules, tester tous les segments.
+        """
+        if t is None:
+            t = self._ray_samples(origin, direction, radius)
+            if t is None:
+                return np.empty(0, dtype=np.int64)
+        samples = origin + t[:, None] * direction
+        cells, _ = self._box_cells(samples, self.cell * 0.25 + radius, np.zeros(len(t), dtype=np.int64))
+        if cells is None:
+            return None
+        cells = np.unique(cells)
+        start, stop = self.offsets[cells], self.offsets[cells + 1]
+        counts = stop - start
+        if counts.sum() == 0:
+            return np.empty(0, dtype=np.int64)
+        keep = counts > 0
+        start, counts = start[keep], counts[keep]
+        first = np.cumsum(counts) - counts
+        idx = np.repeat(start - first, counts) + np.arange(counts.sum())
+        # un segment peut apparaître dans plusieurs cellules : les doublons ne changent pas le résultat
+        return self.items[idx]
+
+    def _nearest(self, origin, direction, radius, ids):
+        if len(ids) == 0:
+            return None
+        dist, t, _ = ray_segment_distance(origin, direction, self.p0[ids], self.p1[ids])
+        inside = np.flatnonzero(dist <= radius)
+        if len(inside) == 0:
+            return None
+        best = inside[np.argmin(t[inside])]
+        return int(ids[best]), float(t[best]), float(dist[best])
+
+    def query(self, origin, direction, radius):
+        """
+        Segment le plus proche de la caméra à moins de radius du rayon.
+        Retourne (segment, t le long du rayon, distance au rayon) ou None.
+        """
+        if len(self.p0) == 0:
+            return None
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        direction = direction / np.linalg.norm(direction)
+
+        t = self._ray_samples(origin, direction, radius)
+        if t is None:
+            return None
+        # parcours du rayon d'avant en arrière par tronçons de taille croissante : un segment
+        # touché à t <= fin du tronçon ne peut pas être précédé par un segment d'un tronçon suivant
+        start, size = 0, 8
+        while start < len(t):
+            chunk = t[start:start + size]
+            ids = self.candidates(origin, direction, radius, chunk)
+            if ids is None:
+                return self._nearest(origin, direction, radius, np.arange(len(self.p0)))
+            hit = self._nearest(origin, direction, radius, ids)
+            if hit is not None and (start + size >= len(t) or hit[1] <= chunk[-1]):
+                return hit
+            if hit is not None:
+                # touché plus loin que le tronçon : finir avec le reste du rayon
+                ids = self.candidates(origin, direction, radius, t[start:])
+                if ids is None:
+                    ids = np.arange(len(self.p0))
+                return self._nearest(origin, direction, radius, ids)
+            start += size
+            size *= 2
+        return None
@@ -0,0 +1,185 @@
+"""
+Table des mouvements du backplot et discrétisation vectorisée des arcs.
+
+L'interpréteur n'écrit plus de segments : il enregistre des mouvements
+(droites et arcs) dans une MoveTable. TessellatedPath les convertit ensuite
+en segments, tous les arcs d'un coup, avec un nombre de cordes calculé à
+partir de l'écart de corde toléré :
+
+  n = ceil(|balayage| / (2 * acos(1 - tolérance / rayon)))
+
+Plusieurs TessellatedPath peuvent être construits sur la même table
+(ex : détail fin et niveau de détail grossier pour une caméra éloignée).
+"""
+import math
+
+import numpy as np
+
+from Backplot.SegmentStore import MOTION_FEED, SegmentStore
+
+DEFAULT_CHORD_TOLERANCE = 0.01  # mm
+DEFAULT_COARSE_TOLERANCE = 0.2  # mm
+
+# bornes du pas angulaire : au moins 4 cordes par tour, au plus ~0.06° par corde
+MAX_STEP_ANGLE = math.pi / 2.0
+MIN_STEP_ANGLE = 1e-3
+
+
+class MoveTable:
+    """
+    Mouvements interprétés, dans l'ordre du programme.
+    Un arc est décrit par son centre (cx, cy), son rayon, son angle de départ et son balayage
+    (signé, positif en G3) ; une droite a un balayage nul.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self.kind)
+
+    def clear(self):
+        self.kind = []
+        self.line = []
+        self.start = []
+        self.end = []
+        self.arc = []   # (cx, cy, r, angle de départ, balayage)
+
+    def truncate(self, n):
+        for name in ("kind", "line", "start", "end", "arc"):
+            del getattr(self, name)[n:]
+
+    def add_line(self, a, b, kind, line):
+        self.kind.append(kind)
+        self.line.append(line)
+        self.start.append(a)
+        self.end.append(b)
+        self.arc.append((0.0, 0.0, 0.0, 0.0, 0.0))
+
+    def add_arc(self, a, b, center, radius, start_angle, sweep, line):
+        self.kind.append(MOTION_FEED)
+        self.line.append(line)
+        self.start.append(a)
+        self.end.append(b)
+        self.arc.append((center[0], center[1], radius, start_angle, sweep))
+
+    def replay(self, first, stop, delta, count):
+        """
+        Ajoute count copies des mouvements [first, stop), translatées de delta, 2 * delta, ...
+        Une copie dont l'original partait de l'extrémité du mouvement précédent part de
+        l'extrémité de la copie précédente (pas d'écart d'arrondi entre deux passes).
+        """
+        if stop <= first or count <= 0:
+            return
+        kind, line = self.kind[first:stop], self.line[first:stop]
+        start, end, arc = self.start[first:stop], self.end[first:stop], self.arc[first:stop]
+        attached = first > 0 and self.start[first] == self.end[first - 1]
+        dx, dy, dz = delta
+        for k in range(1, count + 1):
+            ox, oy, oz = dx * k, dy * k, dz * k
+            previous = self.end[-1]
+            self.kind.extend(kind)
+            self.line.extend(line)
+            self.start.extend([(x + ox, y + oy, z + oz) for x, y, z in start])
+            self.end.extend([(x + ox, y + oy, z + oz) for x, y, z in end])
+            self.arc.extend([(c[0] + ox, c[1] + oy) + c[2:] if c[4] else c for c in arc])
+            if attached:
+                self.start[-len(start)] = previous
+
+
+def arc_segment_counts(radius, sweep, tolerance):
+    """Nombre de cordes de chaque arc pour un écart de corde <= tolerance (vectorisé)"""
+    radius = np.asarray(radius, dtype=np.float64)
+    sweep = np.abs(np.asarray(sweep, dtype=np.float64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.clip(1.0 - tolerance / radius, -1.0, 1.0)
+    step = np.clip(2.0 * np.arccos(ratio), MIN_STEP_ANGLE, MAX_STEP_ANGLE)
+    return np.maximum(np.ceil(sweep / step - 1e-9), 1).astype(np.int64)
+
+
+class TessellatedPath:
+    """
+    Segments d'une MoveTable discrétisée avec une tolérance donnée, écrits dans un SegmentStore.
+    build(moves, first_move) ne réécrit que les segments des mouvements à partir de first_move.
+    """
+
+    def __init__(self, tolerance=DEFAULT_CHORD_TOLERANCE, store=None):
+        self.tolerance = float(tolerance)
+        self.store = store if store is not None else SegmentStore()
+        # premier segment / premier sommet de chaque mouvement (+ total en dernière position)
+        self.seg_offset = np.zeros(1, dtype=np.int64)
+        self.vtx_offset = np.zeros(1, dtype=np.int64)
+
+    def set_tolerance(self, tolerance):
+        self.tolerance = float(tolerance)
+        self.seg_offset = self.seg_offset[:1]
+        self.vtx_offset = self.vtx_offset[:1]
+
+    def invalidate(self, first_move):
+        """Les mouvements à partir de first_move ont changé : leurs segments devront être reconstruits"""
+        self.seg_offset = self.seg_offset[:first_move + 1]
+        self.vtx_offset = self.vtx_offset[:first_move + 1]
+
+    def build(self, moves, first_move=0):
+        """Discrétise moves[first_move:] ; retourne (premier segment, premier sommet) réécrits"""
+        first_move = min(first_move, len(self.seg_offset) - 1)
+        first_segment = int(self.seg_offset[first_move])
+        first_vertex = int(self.vtx_offset[first_move])
+        last = moves.end[first_move - 1] if first_move > 0 else None
+        self.store.truncate(first_segment, first_vertex, last)
+
+        m = len(moves) - first_move
+        if m <= 0:
+            self.seg_offset = self.seg_offset[:first_move + 1]
+            self.vtx_offset = self.vtx_offset[:first_move + 1]
+            return first_segment, first_vertex
+
+        p0 = np.array(moves.start[first_move:], dtype=np.float64)
+        p1 = np.array(moves.end[first_move:], dtype=np.float64)
+        arc = np.array(moves.arc[first_move:], dtype=np.float64)
+        kind = np.array(moves.kind[first_move:], dtype=np.uint8)
+        line = np.array(moves.line[first_move:], dtype=np.int32)
+
+        # nombre de segments de chaque mouvement
+        is_arc = arc[:, 4] != 0.0
+        counts = np.ones(m, dtype=np.int64)
+        if is_arc.any():
+            counts[is_arc] = arc_segment_counts(arc[is_arc, 2], arc[is_arc, 4], self.tolerance)
+
+        # un mouvement qui ne part pas du point précédent commence une nouvelle polyligne
+        breaks = np.empty(m, dtype=bool)
+        breaks[0] = last is None or moves.start[first_move] != last
+        breaks[1:] = np.any(p0[1:] != p1[:-1], axis=1)
+
+        # paramètre t de l'extrémité de chaque segment dans son mouvement
+        seg_start = np.cumsum(counts) - counts
+        seg_move = np.repeat(np.arange(m), counts)
+        n_seg = int(counts.sum())
+        t = (np.arange(n_seg) - seg_start[seg_move] + 1) / counts[seg_move]
+
+        a, b = p0[seg_move], p1[seg_move]
+        ends = a + (b - a) * t[:, None]
+        seg_arc = is_arc[seg_move]
+        if seg_arc.any():
+            c = arc[seg_move[seg_arc]]
+            ang = c[:, 3] + c[:, 4] * t[seg_arc]
+            ends[seg_arc, 0] = c[:, 0] + c[:, 2] * np.cos(ang)
+            ends[seg_arc, 1] = c[:, 1] + c[:, 2] * np.sin(ang)
+        # extrémité exacte de chaque mouvement
+        ends[seg_start + counts - 1] = p1
+
+        # sommets : extrémité de chaque segment, précédée du départ de chaque polyligne
+        n_breaks = np.cumsum(breaks)
+        end_vertex = np.arange(n_seg) + n_breaks[seg_move]
+        xyz = np.empty((n_seg + int(n_breaks[-1]), 3), dtype=np.float32)
+        xyz[end_vertex] = ends
+        xyz[seg_start[breaks] + n_breaks[breaks] - 1] = p0[breaks]
+
+        self.store.extend(xyz, end_vertex - 1, kind[seg_move], line[seg_move], moves.end[-1])
+
+        self.seg_offset = np.concatenate((self.seg_offset[:first_move + 1],
+                                          first_segment + seg_start[1:], [first_segment + n_seg]))
+        self.vtx_offset = np.concatenate((self.vtx_offset[:first_move + 1],
+                                          first_vertex + (seg_start + n_breaks - breaks)[1:],
+                                          [first_vertex + len(xyz)]))
+        return first_segment, first_vertex
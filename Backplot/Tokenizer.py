@@ -0,0 +1,97 @@
+"""
+Découpage d'un programme G-code en mots adresse (lettre + valeur).
+
+Tout le texte est parcouru en une seule passe par une expression régulière
+compilée ; le résultat est une table colonnaire (ligne, lettre, valeur)
+partagée par le backplot (Backplot.Interpreter) et par MPFParser.
+
+  table = tokenize("G0 X10 Y5 ; approche\\nG1 Z-2 F100\\n")
+  table.words(0)     -> {"G": 0.0, "X": 10.0, "Y": 5.0}
+  table.comments[0]  -> " approche"
+"""
+import re
+
+import numpy as np
+
+# un seul motif, une seule passe : mot adresse | fin de ligne | commentaire | reste
+# (les blancs sont consommés avec le jeton suivant, le mot adresse est essayé en premier)
+_TOKEN_RE = re.compile(
+    r"[ \t\r]*(?:"
+    r"([A-Za-z])[ \t]*([-+]?(?:\d+\.?\d*|\.\d+))"
+    r"|(\n)"
+    r"|;([^\n]*)|\(([^\n)]*)\)?"
+    r"|([^\s;(]+))"
+)
+
+
+class WordTable:
+    """
+    Mots adresse d'un programme, indexés par ligne source (0-based).
+
+      lines   : int32   (n,)  ligne de chaque mot
+      letters : list[str]     lettre (majuscule) de chaque mot
+      values  : float64 (n,)  valeur de chaque mot
+      offsets : int32   (n_lines + 1,)  mots de la ligne i = [offsets[i], offsets[i+1])
+      comments: {ligne: texte} commentaires ';' ou '( )'
+      others  : {ligne: [fragments]} texte qui n'est ni un mot ni un commentaire (labels, REPEAT, R1=...)
+    """
+
+    def __init__(self, lines, letters, values, offsets, comments, others):
+        self.lines = lines
+        self.letters = letters
+        self.values = values
+        self.offsets = offsets
+        self.comments = comments
+        self.others = others
+        # copies python pour les accès mot à mot (plus rapides que l'indexation numpy scalaire)
+        self._values = values.tolist()
+        self._offsets = offsets.tolist()
+
+    def __len__(self):
+        return len(self.letters)
+
+    @property
+    def n_lines(self):
+        return len(self._offsets) - 1
+
+    def items(self, line):
+        """Liste des (lettre, valeur) de la ligne, dans l'ordre du texte"""
+        a, b = self._offsets[line], self._offsets[line + 1]
+        return list(zip(self.letters[a:b], self._values[a:b]))
+
+    def words(self, line):
+        """Dictionnaire lettre -> valeur de la ligne (le premier mot d'une lettre l'emporte)"""
+        a, b = self._offsets[line], self._offsets[line + 1]
+        return dict(zip(reversed(self.letters[a:b]), reversed(self._values[a:b])))
+
+
+def tokenize(content):
+    """Découpe tout le programme en une passe et retourne une WordTable"""
+    letters = []
+    values = []
+    offsets = [0]
+    comments = {}
+    others = {}
+    line = 0
+    for letter, number, nl, semi, paren, other in _TOKEN_RE.findall(content):
+        if letter:
+            letters.append(letter)
+            values.append(number)
+        elif nl:
+            line += 1
+            offsets.append(len(letters))
+        elif other:
+            others.setdefault(line, []).append(other)
+        else:
+            comments[line] = semi or paren
+    offsets.append(len(letters))
+
+    offsets = np.array(offsets, dtype=np.int32)
+    return WordTable(
+        np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets)),
+        list("".join(letters).upper()),
+        np.array(values, dtype=np.float64),
+        offsets,
+        comments,
+        others,
+    )
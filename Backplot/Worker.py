@@ -0,0 +1,176 @@
+"""
+Évaluation du backplot hors du thread principal.
+
+L'interprétation et la discrétisation tournent dans un thread de calcul ;
+chaque résultat est une copie du SegmentStore, remise à on_result. Côté
+interface, on_result ne fait que transmettre le résultat au thread principal
+(signal Qt en file d'attente) où les noeuds coin sont remplacés d'un coup.
+
+Chaque demande reçoit un numéro de génération : une demande plus récente
+interrompt la précédente au checkpoint suivant, et un résultat dont la
+génération n'est plus la dernière doit être ignoré.
+
+Avec un cache (Backplot.Cache), un programme déjà discrétisé avec les mêmes
+réglages n'est pas réinterprété.
+
+  worker = BackplotWorker(on_result)
+  generation = worker.submit(gcode_text, tolerance)
+  ...
+  def on_result(result):
+      if worker.is_stale(result.generation):
+          return
+"""
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Backplot.Cache import BackplotCache, CachedBackplot
+from Backplot.Interpreter import BackplotCancelled, BackplotInterpreter
+from Backplot.LineIndex import LineIndex
+from Backplot.Tessellation import TessellatedPath
+
+
+class BackplotResult:
+    """
+    Résultat d'une évaluation. first_segment / first_vertex sont relatifs à
+    l'état de la génération base_generation : si ce n'est pas l'état affiché
+    (ou si base_generation est None), tout doit être recopié.
+    """
+    def __init__(self, generation, base_generation):
+        self.generation = generation
+        self.base_generation = base_generation
+        self.store = None
+        self.first_segment = 0
+        self.first_vertex = 0
+        self.coarse_store = None
+        self.coarse_first_segment = 0
+        self.coarse_first_vertex = 0
+        self.text_lines = []
+        self.line_index = None
+        self.warnings = []
+        self.error = None
+        self.from_cache = False
+
+
+class BackplotWorker:
+    """
+    Un interpréteur (et son éventuel niveau de détail grossier) réutilisé d'une demande
+    à l'autre : seule la fin modifiée du programme est réévaluée.
+    threaded=False exécute les demandes immédiatement dans le thread appelant.
+    cache : BackplotCache consulté avant toute évaluation (None : pas de cache).
+    """
+    def __init__(self, on_result, threaded=True, checkpoint_every=500, cache=None):
+        self.on_result = on_result
+        self.cache = cache
+        self.checkpoint_every = checkpoint_every
+        self.interpreter = None
+        self.coarse_path = None
+        # premier mouvement dont la discrétisation grossière est à refaire (interruptions)
+        self._coarse_from = math.inf
+        self.generation = 0
+        # génération de la dernière évaluation terminée (état courant de l'interpréteur)
+        self._state_generation = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if threaded else None
+
+    def is_stale(self, generation):
+        return generation != self.generation
+
+    def submit(self, gcode_text, tolerance, coarse_tolerance=None):
+        """Demande une évaluation ; les demandes précédentes non terminées sont abandonnées"""
+        with self._lock:
+            self.generation += 1
+            generation = self.generation
+        job = (generation, gcode_text, float(tolerance), coarse_tolerance)
+        if self._executor is None:
+            self._run(job)
+        else:
+            self._executor.submit(self._run, job)
+        return generation
+
+    def cancel(self):
+        """Abandonne les demandes en cours"""
+        with self._lock:
+            self.generation += 1
+
+    def shutdown(self):
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _run(self, job):
+        generation, gcode_text, tolerance, coarse_tolerance = job
+        if self.is_stale(generation):
+            # remplacée avant même d'avoir commencé
+            return
+        key = None
+        if self.cache is not None:
+            key = BackplotCache.key(gcode_text, tolerance, coarse_tolerance)
+            entry = self.cache.get(key)
+            if entry is not None:
+                # l'interpréteur garde son état : le résultat suivant sera recopié en entier
+                result = BackplotResult(generation, None)
+                result.store = entry.store
+                result.coarse_store = entry.coarse_store
+                result.text_lines = entry.text_lines
+                result.line_index = entry.line_index
+                result.warnings = list(entry.warnings)
+                result.from_cache = True
+                self.on_result(result)
+                return
+
+        result = BackplotResult(generation, self._state_generation)
+        try:
+            self._evaluate(result, gcode_text, tolerance, coarse_tolerance)
+            if key is not None:
+                self.cache.put(key, CachedBackplot(result.store, result.coarse_store, result.text_lines,
+                                                   result.warnings, result.line_index))
+        except BackplotCancelled:
+            self._coarse_from = min(self._coarse_from, self.interpreter.first_move)
+            return
+        except Exception as e:
+            # état de l'interpréteur incertain : la prochaine demande repart de zéro
+            self.interpreter = None
+            self.coarse_path = None
+            self._state_generation = 0
+            result.error = "{}: {}".format(type(e).__name__, e)
+        self.on_result(result)
+
+    def _evaluate(self, result, gcode_text, tolerance, coarse_tolerance):
+        cancelled = lambda: self.is_stale(result.generation)
+        interpreter = self.interpreter
+        if interpreter is None:
+            interpreter = self.interpreter = BackplotInterpreter(checkpoint_every=self.checkpoint_every, tolerance=tolerance)
+            self.coarse_path = None
+        retessellate = interpreter.path.tolerance != tolerance
+        if retessellate:
+            interpreter.path.set_tolerance(tolerance)
+
+        changed = interpreter.update(gcode_text, cancelled)
+        if changed is None:
+            # texte identique : seule la discrétisation change (ou rien)
+            changed = interpreter.set_tolerance(tolerance) if retessellate else \
+                (interpreter.store.n_segments, interpreter.store.n_vertices)
+            first_move = 0 if retessellate else len(interpreter.moves)
+        else:
+            first_move = interpreter.first_move
+
+        result.first_segment, result.first_vertex = changed
+        result.store = interpreter.store.copy()
+        result.text_lines = interpreter.text_lines
+        result.line_index = LineIndex(result.store.lines, len(result.text_lines))
+        result.warnings = list(interpreter.warnings)
+
+        if coarse_tolerance is None:
+            self.coarse_path = None
+        else:
+            coarse_tolerance = float(coarse_tolerance)
+            if self.coarse_path is None or self.coarse_path.tolerance != coarse_tolerance:
+                self.coarse_path = TessellatedPath(coarse_tolerance)
+                first_move = 0
+            first_move = int(min(first_move, self._coarse_from))
+            result.coarse_first_segment, result.coarse_first_vertex = self.coarse_path.build(interpreter.moves, first_move)
+            result.coarse_store = self.coarse_path.store.copy()
+        self._coarse_from = math.inf
+        self._state_generation = result.generation
@@ -5,6 +5,8 @@ import BaptUtilities
 from PySide import QtWidgets
 import PySide.QtCore as QtCore
 import PySide.QtGui as QtGui
+from pivy import coin
+from Backplot.Merge import MergedBackplot, packed_colors
 
 class Stock:
     """Classe pour gérer le brut d'usinage"""
@@ -601,7 +603,101 @@ class ViewProviderCamProject:
     def attach(self, vobj):
         """Appelé lors de l'attachement du ViewProvider"""
         self.Object = vobj.Object
-    
+        self.default_group = coin.SoGroup()
+        vobj.addDisplayMode(self.default_group, "Default")
+
+        # mode "Backplot" : parcours de toutes les opérations actives dans un seul line set
+        self.backplot = coin.SoSeparator()
+        pick = coin.SoPickStyle()
+        pick.style = coin.SoPickStyle.UNPICKABLE
+        self.backplot.addChild(pick)
+        self.backplot_vertices = coin.SoVertexProperty()
+        self.backplot_vertices.materialBinding = coin.SoVertexProperty.PER_PART_INDEXED
+        self.backplot_lines = coin.SoIndexedLineSet()
+        self.backplot_lines.vertexProperty = self.backplot_vertices
+        self.backplot.addChild(self.backplot_lines)
+        vobj.addDisplayMode(self.backplot, "Backplot")
+        self.merged = None
+        self.merged_ops = []
+
+        # les opérations signalent chaque nouveau parcours : une seule fusion par passage dans la boucle Qt
+        self.backplot_timer = QtCore.QTimer()
+        self.backplot_timer.setSingleShot(True)
+        self.backplot_timer.timeout.connect(self.refreshBackplot)
+
+    def getDisplayModes(self, vobj):
+        return ["Default", "Backplot"]
+
+    def getDefaultDisplayMode(self):
+        return "Default"
+
+    def setDisplayMode(self, mode):
+        return mode
+
+    def isBackplotMode(self):
+        vobj = getattr(self.Object, "ViewObject", None)
+        return vobj is not None and vobj.DisplayMode == "Backplot"
+
+    def scheduleBackplot(self):
+        """Demande une nouvelle fusion des parcours (appelé par les opérations)"""
+        if self.isBackplotMode() and hasattr(self, "backplot_timer"):
+            self.backplot_timer.start(0)
+
+    def backplotOperations(self):
+        """(opération, view provider) des opérations actives du projet, dans l'ordre du projet"""
+        from BaptPostProcess import list_machining_operations
+        ops = []
+        for op in list_machining_operations(self.Object):
+            target = op.LinkedObject if getattr(op, "LinkedObject", None) is not None else op
+            vp = getattr(getattr(target, "ViewObject", None), "Proxy", None)
+            if vp is None or not hasattr(vp, "setMerged"):
+                continue
+            ops.append((target, vp))
+        return ops
+
+    def refreshBackplot(self):
+        """Fusionne les parcours des opérations actives ; leurs propres noeuds sont masqués"""
+        merged = self.isBackplotMode()
+        ops = self.backplotOperations()
+        for previous in self.merged_ops:
+            if previous not in ops:
+                previous[1].setMerged(False)
+        for target, vp in ops:
+            vp.setMerged(merged)
+        self.merged_ops = ops if merged else []
+        if not merged:
+            self.merged = None
+            self.backplot_lines.coordIndex.setNum(0)
+            self.backplot_lines.materialIndex.setNum(0)
+            self.backplot_vertices.vertex.setNum(0)
+            return
+
+        stores, colors = [], []
+        for target, vp in ops:
+            store = getattr(vp, "store", None)
+            if store is None or not getattr(target, "Active", True):
+                continue
+            stores.append(store)
+            for prop_name, default_color in (("Rapid", (1.0, 0.0, 0.0)), ("Feed", (0.0, 1.0, 0.0))):
+                color = getattr(target.ViewObject, prop_name, default_color)
+                colors.append(tuple(color)[:3])
+        self.merged = MergedBackplot(stores)
+
+        vertices = self.merged.vertices
+        self.backplot_vertices.vertex.setNum(len(vertices))
+        if len(vertices):
+            self.backplot_vertices.vertex.setValues(0, len(vertices), vertices)
+        rgba = packed_colors(colors)
+        self.backplot_vertices.orderedRGBA.setNum(len(rgba))
+        if rgba:
+            self.backplot_vertices.orderedRGBA.setValues(0, len(rgba), rgba)
+        idx = self.merged.coord_index
+        self.backplot_lines.coordIndex.setNum(len(idx))
+        self.backplot_lines.materialIndex.setNum(len(self.merged))
+        if len(idx):
+            self.backplot_lines.coordIndex.setValues(0, len(idx), idx)
+            self.backplot_lines.materialIndex.setValues(0, len(self.merged), self.merged.material_index)
+
     def setupContextMenu(self, vobj, menu):
         """Configuration du menu contextuel"""
         action_edit = QtGui.QAction(Gui.getIcon("Std_TransformManip.svg"), "Edit", menu)
@@ -613,8 +709,21 @@ class ViewProviderCamProject:
 
         action2 = menu.addAction("Active Object")
         action2.triggered.connect(lambda: self.activateObject(vobj))
+
+        action_backplot = menu.addAction("Merged Backplot")
+        action_backplot.setCheckable(True)
+        action_backplot.setChecked(vobj.DisplayMode == "Backplot")
+        action_backplot.triggered.connect(lambda checked: setattr(vobj, "DisplayMode", "Backplot" if checked else "Default"))
+
+        action_simulate = menu.addAction("Simulate Project")
+        action_simulate.triggered.connect(lambda: self.simulateProject(vobj))
         return True
 
+    def simulateProject(self, vobj):
+        """Simulation de toutes les opérations du projet, avec reprise des bruts intermédiaires en cache"""
+        from BaptPath import simulateProject
+        return simulateProject(vobj.Object)
+
     def activateObject(self, vobj):
         """Activer l'objet dans le document"""
         #App.ActiveDocument.ActiveObject = vobj.Object
@@ -641,7 +750,8 @@ class ViewProviderCamProject:
 
     def onChanged(self, vobj, prop):
         """Appelé quand une propriété du ViewProvider est modifiée"""
-        pass
+        if prop == "DisplayMode" and hasattr(self, "backplot"):
+            self.refreshBackplot()
 
     def doubleClicked(self, vobj):
         """Gérer le double-clic"""
@@ -1,17 +1,31 @@
 # https://forum.freecad.org/viewtopic.php?t=100312&sid=a77831c5cae7ee6feb8cf340f0e19dc6
-from collections import deque
 import math
 import sys
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 from BaptUtilities import find_cam_project
 import FreeCAD as App
 import FreeCADGui
 
 
 from pivy import coin
-from enum import Enum 
 from PySide import QtGui,QtCore
 import Mesh,MeshPart
 
+from Backplot.Interpreter import absinc, comp, memory
+from Backplot.SegmentStore import MOTION_RAPID
+from Backplot.Tessellation import DEFAULT_CHORD_TOLERANCE
+from Sim.Batch import simulate
+from Sim.Chain import ChainStep, program_key, simulate_chain, stock_cache
+from Sim.Heightmap import Heightmap, heightmap_triangles
+from Sim.Rapids import rapid_crashes
+from Sim.Snapshots import StockSnapshots
+from Sim.StockMesh import StockTiles
+from Sim.Timeline import Timeline
+from Sim.ToolProfile import FLAT, profile_from_tool, tool_profile
+from BaptTools import ToolDatabase
+from BaptPreferences import BaptPreferences
+
 
 """
 Gcode  | Heidenhain | Description
@@ -36,30 +50,12 @@ LABEL  |LBL         | Label declaration
 REPEAT |CALL        | Repeat block
 """
 
-class comp(Enum):
-    G40 = 0
-    G41 = 1
-    G42 = 2
-
-class absinc(Enum):
-    G90 = 0
-    G91 = 1
-
-
-        
-class memory():
-    def __init__(self):
-        #labels tableau de string et int
-        self.labels = {}
-        self.queue = deque()
-        self.variables = {}
-        self.current_cycle = None
-        self.absincMode = absinc.G90
-
-    def addLabel(self, key, value):
-        self.labels[key]= value
-
 class GcodeEditorTaskPanel:
+    """
+    Éditeur du G-code d'une opération, lié au backplot :
+    les lignes sélectionnées sont mises en évidence dans la vue 3D et
+    un clic sur un segment fait défiler l'éditeur jusqu'à sa ligne.
+    """
     def __init__(self, obj):
         self.obj = obj
         self.form = QtGui.QWidget()
@@ -70,17 +66,46 @@ class GcodeEditorTaskPanel:
         self.textEdit.setPlainText(self.obj.Gcode)
         layout.addWidget(self.textEdit)
 
+        self.vp = getattr(getattr(obj, "ViewObject", None), "Proxy", None)
+        if self.vp is not None and hasattr(self.vp, "highlightLines"):
+            self.vp.editor = self
+            self.textEdit.cursorPositionChanged.connect(self.onCursorMoved)
+        else:
+            self.vp = None
+
         self.buttonBox = QtGui.QDialogButtonBox(QtGui.QDialogButtonBox.Ok | QtGui.QDialogButtonBox.Cancel)
         self.buttonBox.accepted.connect(self.accept)
         self.buttonBox.rejected.connect(self.reject)
         layout.addWidget(self.buttonBox)
 
+    def onCursorMoved(self):
+        """Met en évidence les segments des lignes sélectionnées"""
+        cursor = self.textEdit.textCursor()
+        document = self.textEdit.document()
+        first = document.findBlock(cursor.selectionStart()).blockNumber()
+        last = document.findBlock(cursor.selectionEnd()).blockNumber()
+        self.vp.highlightLines(first, last)
+
+    def showLine(self, line):
+        """Place le curseur au début de la ligne source (0-based) et la centre dans l'éditeur"""
+        block = self.textEdit.document().findBlockByNumber(line)
+        if not block.isValid():
+            return
+        self.textEdit.setTextCursor(QtGui.QTextCursor(block))
+        self.textEdit.centerCursor()
+
+    def close(self):
+        if self.vp is not None:
+            self.vp.editor = None
+            self.vp.clearHighlight()
+        FreeCADGui.Control.closeDialog()
+
     def accept(self):
         self.obj.Gcode = self.textEdit.toPlainText()
-        FreeCADGui.Control.closeDialog()
+        self.close()
 
     def reject(self):
-        FreeCADGui.Control.closeDialog()
+        self.close()
 
     def getStandardButtons(self):
         """Définir les boutons standard"""
@@ -90,6 +115,235 @@ class GcodeEditorTaskPanel:
     
 
     
+def toolProfile(tool):
+    """Profil de l'outil de la base (par son Id), à défaut une fraise plate du rayon du cylindre"""
+    try:
+        tool_id = int(getattr(tool, "Id", -1))
+        data = ToolDatabase().get_tool_by_id(tool_id) if tool_id >= 0 else None
+        if data is not None and data.diameter > 0:
+            return profile_from_tool(data)
+    except Exception as e:
+        App.Console.PrintWarning(f"Profil d'outil indisponible, fraise plate utilisée : {e}\n")
+    return tool_profile(FLAT, float(getattr(tool, "Radius", 0.0)))
+
+
+def simulateToEnd(view_provider):
+    """
+    Simule d'un coup tout le programme d'une opération (rapides compris), sans animation :
+    le brut final est ajouté au document dans un Mesh::Feature, le brut du projet est masqué.
+    Les tuiles du brut sont réparties sur un pool de processus ; barre de progression annulable.
+    """
+    obj = view_provider.Object
+    project = find_cam_project(obj)
+    store = getattr(view_provider, "store", None)
+    tool = getattr(obj, "Tool", None)
+    if project is None or tool is None or store is None or len(store) == 0:
+        App.Console.PrintWarning("Simulation impossible : projet, outil ou parcours manquant\n")
+        return None
+    stock = project.Proxy.getStock(project)
+    profile = toolProfile(tool)
+    if profile.radius <= 0:
+        App.Console.PrintWarning("Simulation impossible : rayon d'outil nul\n")
+        return None
+
+    heightmap = Heightmap.from_bound_box(stock.Shape.BoundBox, cell=profile.radius / 5.0)
+    p0 = store.vertices[store.starts]
+    p1 = store.vertices[store.starts + 1]
+
+    workers, context = BaptPreferences().getProcessPool()
+    dialog = SimulationProgress()
+    try:
+        done = simulate(heightmap, p0, p1, profile.radius, profile, workers=workers, mp_context=context,
+                        progress=dialog.progress, cancelled=dialog.cancelled)
+    except (BrokenProcessPool, OSError) as e:
+        App.Console.PrintWarning(f"Pool de processus indisponible ({e}), simulation sur place\n")
+        done = simulate(heightmap, p0, p1, profile.radius, profile, workers=0,
+                        progress=dialog.progress, cancelled=dialog.cancelled)
+    dialog.close()
+    if not done:
+        App.Console.PrintMessage("Simulation annulée\n")
+        return None
+    return showSimulatedStock(heightmap, stock)
+
+
+def simulateProject(project):
+    """
+    Simule toutes les opérations actives du projet dans l'ordre du post-traitement, sur le
+    même brut. Le brut après chaque opération est gardé en cache (Sim.Chain) : après une
+    modification, seules l'opération modifiée et les suivantes sont resimulées.
+    """
+    from BaptPostProcess import list_machining_operations
+    steps = []
+    for op in list_machining_operations(project):
+        # une copie liée simule l'opération d'origine, dont le view provider porte le parcours
+        target = op.LinkedObject if getattr(op, "LinkedObject", None) is not None else op
+        vp = getattr(getattr(target, "ViewObject", None), "Proxy", None)
+        store = getattr(vp, "store", None)
+        tool = getattr(target, "Tool", None)
+        if not getattr(target, "Active", True) or store is None or len(store) == 0:
+            continue
+        if tool is None:
+            App.Console.PrintWarning(f"{target.Label} : pas d'outil, opération ignorée\n")
+            continue
+        profile = toolProfile(tool)
+        if profile.radius <= 0:
+            App.Console.PrintWarning(f"{target.Label} : rayon d'outil nul, opération ignorée\n")
+            continue
+        tolerance = vp.getLength(target.ViewObject, "ChordTolerance", DEFAULT_CHORD_TOLERANCE)
+        key = program_key(str(getattr(target, "Gcode", "") or ""), tolerance, repr(profile))
+        steps.append(ChainStep(target.Label, key, store.vertices[store.starts],
+                               store.vertices[store.starts + 1], profile))
+    if not steps:
+        App.Console.PrintWarning("Simulation impossible : aucune opération active avec un parcours\n")
+        return None
+
+    stock = project.Proxy.getStock(project)
+    # une cellule de l'ordre du cinquième du plus petit rayon d'outil
+    cell = min(step.profile.radius for step in steps) / 5.0
+    heightmap = Heightmap.from_bound_box(stock.Shape.BoundBox, cell=cell)
+    stock_cache.resize(BaptPreferences().SimulationChainSize << 20)
+
+    workers, context = BaptPreferences().getProcessPool()
+    dialog = SimulationProgress("Simulation du projet...")
+    try:
+        simulated = simulate_chain(heightmap, steps, workers=workers, mp_context=context,
+                                   progress=dialog.progress, cancelled=dialog.cancelled)
+    except (BrokenProcessPool, OSError) as e:
+        App.Console.PrintWarning(f"Pool de processus indisponible ({e}), simulation sur place\n")
+        # les opérations déjà terminées sont en cache
+        simulated = simulate_chain(heightmap, steps, workers=0,
+                                   progress=dialog.progress, cancelled=dialog.cancelled)
+    dialog.close()
+    if simulated is None:
+        App.Console.PrintMessage("Simulation annulée\n")
+        return None
+    App.Console.PrintMessage(f"Simulation du projet : {simulated} opération(s) simulée(s), "
+                             f"{len(steps) - simulated} reprise(s) du cache\n")
+    return showSimulatedStock(heightmap, stock)
+
+
+class SimulationProgress:
+    """Barre de progression annulable d'une simulation ; progress et cancelled font vivre l'interface"""
+    def __init__(self, text="Simulation de l'enlèvement de matière..."):
+        self.dialog = QtGui.QProgressDialog(text, "Annuler", 0, 1)
+        self.dialog.setWindowModality(QtCore.Qt.WindowModal)
+        self.dialog.setMinimumDuration(500)
+
+    def progress(self, n, total):
+        self.dialog.setMaximum(max(total, 1))
+        self.dialog.setValue(n)
+        QtGui.QApplication.processEvents()
+
+    def cancelled(self):
+        QtGui.QApplication.processEvents()
+        return self.dialog.wasCanceled()
+
+    def close(self):
+        self.dialog.close()
+
+
+def showSimulatedStock(heightmap, stock):
+    """Brut simulé ajouté au document (Mesh::Feature SimulatedStock), brut du projet masqué"""
+    result = App.activeDocument().addObject("Mesh::Feature", "SimulatedStock")
+    result.Mesh = Mesh.Mesh(heightmap_triangles(heightmap).reshape(-1, 3).tolist())
+    if stock.ViewObject is not None:
+        stock.ViewObject.Visibility = False
+    App.activeDocument().recompute()
+    return result
+
+
+def checkRapidMoves(view_provider):
+    """
+    Rejoue le programme d'une opération sur le brut du projet et signale les rapides qui
+    traversent de la matière : lignes source dans la console, segments en rouge dans le backplot.
+    Renvoie les lignes (1-based) en collision.
+    """
+    obj = view_provider.Object
+    project = find_cam_project(obj)
+    store = getattr(view_provider, "store", None)
+    tool = getattr(obj, "Tool", None)
+    if project is None or tool is None or store is None or len(store) == 0:
+        App.Console.PrintWarning("Vérification impossible : projet, outil ou parcours manquant\n")
+        return []
+    profile = toolProfile(tool)
+    if profile.radius <= 0:
+        App.Console.PrintWarning("Vérification impossible : rayon d'outil nul\n")
+        return []
+    stock = project.Proxy.getStock(project)
+    heightmap = Heightmap.from_bound_box(stock.Shape.BoundBox, cell=profile.radius / 5.0)
+    p0 = store.vertices[store.starts]
+    p1 = store.vertices[store.starts + 1]
+    crashes = rapid_crashes(heightmap, p0, p1, store.kinds == MOTION_RAPID, profile.radius, profile)
+
+    view_provider.markCrashes(crashes)
+    lines = sorted(set(int(l) for l in store.lines[crashes]))
+    if not lines:
+        App.Console.PrintMessage(f"{obj.Label} : aucun rapide ne traverse de matière\n")
+    for line in lines:
+        text = view_provider.text_lines[line].strip() if line < len(view_provider.text_lines) else ""
+        App.Console.PrintWarning(f"{obj.Label} : rapide dans la matière ligne {line + 1} : {text}\n")
+    return [line + 1 for line in lines]
+
+
+# nombre d'instantanés du brut le long du programme (si la mémoire le permet)
+SNAPSHOT_COUNT = 256
+
+
+class StockView:
+    """
+    Brut simulé affiché directement dans la scène : un SoIndexedFaceSet par tuile
+    (Sim.StockMesh), de topologie fixe ; update() ne réécrit que les sommets des
+    tuiles modifiées depuis l'appel précédent.
+    """
+    def __init__(self, heightmap, color=(0.8, 0.8, 0.6)):
+        self.tiles = StockTiles(heightmap)
+        self.root = coin.SoSeparator()
+        hints = coin.SoShapeHints()
+        hints.vertexOrdering = coin.SoShapeHints.COUNTERCLOCKWISE
+        hints.shapeType = coin.SoShapeHints.SOLID
+        material = coin.SoMaterial()
+        material.diffuseColor.setValue(*color)
+        self.root.addChild(hints)
+        self.root.addChild(material)
+
+        self.tile_vertices = []
+        for t in range(len(self.tiles)):
+            vertices = coin.SoVertexProperty()
+            faces = coin.SoIndexedFaceSet()
+            faces.vertexProperty = vertices
+            idx = self.tiles.coord_index(t)
+            faces.coordIndex.setValues(0, len(idx), idx)
+            self.root.addChild(faces)
+            self.tile_vertices.append(vertices)
+            self._push(t)
+
+        # fond, jamais modifié
+        bottom = self.tiles.bottom_triangles().reshape(-1, 3)
+        vertices = coin.SoVertexProperty()
+        vertices.vertex.setValues(0, len(bottom), bottom)
+        faces = coin.SoFaceSet()
+        faces.vertexProperty = vertices
+        faces.numVertices.setValues(0, len(bottom) // 3, [3] * (len(bottom) // 3))
+        self.root.addChild(faces)
+
+        self.scene = FreeCADGui.ActiveDocument.ActiveView.getSceneGraph()
+        self.scene.addChild(self.root)
+
+    def _push(self, tile):
+        v = self.tiles.vertices(tile)
+        self.tile_vertices[tile].vertex.setNum(len(v))
+        self.tile_vertices[tile].vertex.setValues(0, len(v), v)
+
+    def update(self):
+        for t in self.tiles.take_dirty():
+            self._push(int(t))
+
+    def remove(self):
+        if self.root is not None:
+            self.scene.removeChild(self.root)
+            self.root = None
+
+
 class GcodeAnimator:
     """
     Simule le parcours d'usinage en déplaçant un marqueur (sphere) le long des segments
@@ -106,38 +360,56 @@ class GcodeAnimator:
         from PySide import QtCore
         self.vp = view_provider
         self.timer = QtCore.QTimer()
-        self.timer.setInterval(30)  # ms, ~33 FPS default
+        self.timer.setInterval(16)  # ms, ~60 FPS : un pas ne touche que des noeuds coin
         self.timer.timeout.connect(self._on_timer)
         self.speed = 20.0  # mm / sec
         self.include_rapid = False
 
         self.tool = None
-        self.toolMesh = None
+        self.tool_node = None   # géométrie de l'outil dans la scène, déplacée avec le marqueur
         self.stock = None
+        self.stock_visibility = None
 
-        self.stockMesh = None
+        # brut simulé (Z-dexels) et son maillage affiché
+        self.heightmap = None
+        self.tool_radius = 0.0
+        self.profile = None     # profil de l'outil (Sim.ToolProfile) évalué sur les cellules du brut
+        self.stockView = None   # maillage du brut en tuiles dans la scène (StockView)
         
         # Récupérer le projet CAM actif
         project = find_cam_project(self.vp.Object)
         if project:
             self.stock = project.Proxy.getStock(project)
-            self.stockMesh = App.activeDocument().addObject("Mesh::Feature", "stockMesh")
-            self.stockMesh.Mesh = MeshPart.meshFromShape(Shape=self.stock.Shape, MaxLength=5)
             if hasattr(self.vp.Object, "Tool") and self.vp.Object.Tool is not None:
                 self.tool = self.vp.Object.Tool
-                self.toolMesh = App.activeDocument().addObject("Mesh::Feature", "toolMesh")
-                self.toolMesh.Mesh = MeshPart.meshFromShape(Shape=self.tool.Shape, MaxLength=5)
+                self.profile = toolProfile(self.tool)
+                self.tool_radius = self.profile.radius
+                self.tool_node = self._tool_node(self.tool)
+            # une cellule de l'ordre du cinquième du rayon d'outil
+            cell = self.tool_radius / 5.0 if self.tool_radius > 0 else 0.5
+            self.heightmap = Heightmap.from_bound_box(self.stock.Shape.BoundBox, cell=cell)
+            self.initial_z = self.heightmap.z.copy()
+            self.stockView = StockView(self.heightmap)
+            # le brut du projet n'est pas modifié : il est masqué pendant la simulation
+            if self.stock.ViewObject is not None:
+                self.stock_visibility = self.stock.ViewObject.Visibility
+                self.stock.ViewObject.Visibility = False
 
         
             
-        self.frequence_cut = 20
+        # seules les tuiles modifiées sont réécrites : le brut peut suivre chaque pas
+        self.frequence_cut = 1
         self.indice_frequence_cut = 0
 
         # animation state
-        self.segments = []      # list of (p0,p1) tuples
-        self.seg_index = 0
-        self.seg_pos = 0.0      # distance along current segment
-        self.seg_len = 0.0
+        self.store = None       # SegmentStore partagé avec le view provider
+        self.seg_ids = np.empty(0, dtype=np.int32)  # indices des segments animés dans self.store
+        self.seg_count = 0
+        self.timeline = Timeline(np.empty((0, 3)), np.empty((0, 3)))
+        self.rapid_factor = 4.0  # les rapides sont animés plus vite que l'avance
+        self.time = 0.0         # instant courant sur la ligne de temps (mm à la vitesse d'avance)
+        self.cut_time = 0.0     # le brut simulé contient exactement le volume balayé sur [0, cut_time]
+        self.snapshots = None   # instantanés du brut le long de la ligne de temps (retour en arrière)
         self.running = False
 
         # create a marker in the scene (small sphere)
@@ -149,7 +421,8 @@ class GcodeAnimator:
         self.marker_switch.whichChild = coin.SO_SWITCH_NONE
 
         self.marker_sep = coin.SoSeparator()
-        self.marker_trans = coin.SoTranslation()
+        # seul ce noeud change à chaque pas : pas de Placement ni de recompute du document
+        self.marker_trans = coin.SoTransform()
         self.marker_color = coin.SoBaseColor()
         self.marker_sphere = coin.SoSphere()
         self.marker_sphere.radius = 1.0
@@ -160,65 +433,87 @@ class GcodeAnimator:
         self.marker_sep.addChild(self.marker_trans)
         self.marker_sep.addChild(self.marker_color)
         self.marker_sep.addChild(self.marker_sphere)
+        if self.tool_node is not None:
+            self.marker_sep.addChild(self.tool_node)
         self.marker_switch.addChild(self.marker_sep)
 
-        # attach to view provider display group if available
-        try:
-            self.vp.my_displaymode.addChild(self.marker_switch)
-        except Exception:
-            pass
+        # dans la scène de la vue active, comme le brut simulé (StockView)
+        self.scene = FreeCADGui.ActiveDocument.ActiveView.getSceneGraph()
+        self.scene.addChild(self.marker_switch)
+
+    def removeMarker(self):
+        """Retire le marqueur (et l'outil) de la scène où il a été ajouté"""
+        if self.scene is not None:
+            self.scene.removeChild(self.marker_switch)
+            self.scene = None
+
+    def _tool_node(self, tool):
+        """Maillage de la forme de l'outil (bout à l'origine) en noeud coin"""
+        shape = tool.Shape.copy()
+        shape.Placement = App.Placement()
+        mesh = MeshPart.meshFromShape(Shape=shape, MaxLength=5)
+        points, facets = mesh.Topology
+        node = coin.SoSeparator()
+        color = coin.SoBaseColor()
+        color.rgb.setValue(0.6, 0.6, 0.7)
+        coords = coin.SoCoordinate3()
+        coords.point.setValues(0, len(points), [(p.x, p.y, p.z) for p in points])
+        faces = coin.SoIndexedFaceSet()
+        index = np.full((len(facets), 4), -1, dtype=np.int32)
+        if len(facets):
+            index[:, :3] = np.asarray(facets, dtype=np.int32)
+        faces.coordIndex.setValues(0, index.size, index.ravel())
+        node.addChild(color)
+        node.addChild(coords)
+        node.addChild(faces)
+        return node
 
     def load_paths(self, include_rapid=False):
         """
-        Construit la liste de segments à partir des feed_coords (et éventuellement rapid_coords)
-        en respectant l'ordre d'origine du programme si disponible (self.vp.ordered_segments).
+        Construit la liste de segments à partir du SegmentStore du view provider
+        (self.vp.store), dans l'ordre d'origine du programme, et sa ligne de temps.
+        Le brut simulé repart de l'état initial.
         """
         self.include_rapid = include_rapid
-        segs = []
-        vp = self.vp
-        # prefer ordered_segments if provided by the view provider (keeps original program order)
-        if hasattr(vp, "ordered_segments") and vp.ordered_segments:
-            for typ, a, b in vp.ordered_segments:
-                if typ == "rapid" and not include_rapid:
-                    continue
-                segs.append((a, b))
+        self.store = getattr(self.vp, "store", None)
+        if self.store is None or len(self.store) == 0:
+            self.seg_ids = np.empty(0, dtype=np.int32)
+        elif include_rapid:
+            self.seg_ids = self.store.segment_ids()
         else:
-            # fallback: keep previous behavior (rapid then feed)
-            if include_rapid and hasattr(vp, "rapid_coords"):
-                rc = getattr(vp, "rapid_coords") or []
-                for i in range(0, len(rc), 2):
-                    if i+1 < len(rc):
-                        segs.append((rc[i], rc[i+1]))
-            if hasattr(vp, "feed_coords"):
-                fc = getattr(vp, "feed_coords") or []
-                for i in range(0, len(fc), 2):
-                    if i+1 < len(fc):
-                        segs.append((fc[i], fc[i+1]))
-        self.segments = segs
+            self.seg_ids = np.flatnonzero(self.store.kinds != MOTION_RAPID).astype(np.int32)
+        self.seg_count = len(self.seg_ids)
+        if self.seg_count:
+            starts = self.store.starts[self.seg_ids]
+            rapid = self.store.kinds[self.seg_ids] == MOTION_RAPID
+            self.timeline = Timeline(self.store.vertices[starts], self.store.vertices[starts + 1],
+                                     rapid, self.rapid_factor)
+        else:
+            self.timeline = Timeline(np.empty((0, 3)), np.empty((0, 3)))
+        self.resetStock()
         self.stop()  # reset indices
 
     def start(self, speed_mm_s=20.0):
         self.speed = float(speed_mm_s)
-        if not self.segments:
+        if not self.seg_count:
             self.load_paths(self.include_rapid)
-        if not self.segments:
+        if not self.seg_count:
             return
         self.running = True
-        # initialize first segment
-        self.seg_index = 0
-        self._prepare_segment(0)
+        if self.time >= self.timeline.total_time:
+            self.time = 0.0
+        self.seek(self.time)
         self.marker_switch.whichChild = 0  # show marker
         self.timer.start()
 
     def pause(self):
         self.running = False
         self.timer.stop()
+        self.syncDocument()
 
     def stop(self):
         self.pause()
-        self.seg_index = 0
-        self.seg_pos = 0.0
-        self.seg_len = 0.0
+        self.time = 0.0
         # hide marker
         try:
             self.marker_switch.whichChild = coin.SO_SWITCH_NONE
@@ -227,113 +522,136 @@ class GcodeAnimator:
 
     def step(self):
         """Avance d'un tick (utile pour debug ou pas-à-pas)."""
-        if not self.segments:
+        if not self.seg_count:
             return
-        self._on_timer()
+        self.marker_switch.whichChild = 0
+        self.seek(self.time + self.speed * max(0.001, self.timer.interval() / 1000.0))
+        self.updateMesh()
 
     def set_speed(self, speed_mm_s):
         self.speed = float(speed_mm_s)
 
-    def _prepare_segment(self, idx):
-        if idx < 0 or idx >= len(self.segments):
-            self.seg_len = 0.0
+    @property
+    def seg_index(self):
+        """Indice (dans seg_ids) du segment animé courant"""
+        return self.timeline.locate(self.time)[0]
+
+    def seek(self, t):
+        """
+        Place l'outil à l'instant t (recherche dichotomique dans la ligne de temps) et met le
+        brut simulé dans l'état correspondant : en avant, seul le chemin restant est balayé,
+        en une fois ; en arrière, le brut est recalculé depuis l'état initial.
+        """
+        if not self.seg_count:
             return
-        p0, p1 = self.segments[idx]
-        dx = p1[0] - p0[0]
-        dy = p1[1] - p0[1]
-        dz = p1[2] - p0[2]
-        self.seg_len = math.sqrt(dx*dx + dy*dy + dz*dz)
-        self.seg_pos = 0.0
-        self._set_marker_position(p0)
+        self.time = self.timeline.clamp(t)
+        self._set_marker_position(self.timeline.point(self.time))
+        self._cut_to(self.time)
+
+    def _cut_to(self, t):
+        """
+        Amène le brut simulé à l'état cut_time = t. Les instantanés (Sim.Snapshots) pris tous
+        les snapshots.interval servent en arrière, et en avant sur une partie déjà simulée ;
+        le chemin restant depuis l'instantané est balayé.
+        """
+        if self.heightmap is None or self.tool_radius <= 0:
+            return
+        snapshots = self.snapshots
+        target = snapshots.index(t)
+        if t < self.cut_time:
+            if target < snapshots.first:
+                # avant le plus ancien instantané conservé : retour au brut initial
+                self.resetStock()
+                snapshots = self.snapshots
+            else:
+                snapshots.restore(target)
+                self.cut_time = snapshots.time(target)
+        while target > snapshots.base:
+            if snapshots.base < snapshots.last:
+                # partie déjà simulée : saut direct au dernier instantané utile
+                index = min(target, snapshots.last)
+                snapshots.restore(index)
+                self.cut_time = snapshots.time(index)
+            else:
+                self._sweep(self.cut_time, snapshots.time(snapshots.base + 1))
+                self.cut_time = snapshots.time(snapshots.base + 1)
+                snapshots.record()
+        if t > self.cut_time:
+            self._sweep(self.cut_time, t)
+            self.cut_time = t
+
+    def _sweep(self, t0, t1):
+        a, b = self.timeline.path(t0, t1)
+        self.heightmap.sweep(a, b, self.tool_radius, self.profile)
+
+    def resetStock(self):
+        """Brut simulé remis à l'état initial ; instantanés recommencés"""
+        self.cut_time = 0.0
+        if self.heightmap is not None:
+            np.copyto(self.heightmap.z, self.initial_z)
+            interval = self.timeline.total_time / SNAPSHOT_COUNT
+            self.snapshots = StockSnapshots(self.heightmap, interval,
+                                            max_bytes=BaptPreferences().SimulationSnapshotSize << 20)
 
     def _set_marker_position(self, point):
         # set translation to point (x,y,z)
+        self.marker_trans.translation.setValue(float(point[0]), float(point[1]), float(point[2]))
+
+    def syncDocument(self):
+        """Reporte la position courante sur l'objet outil du document (pause / arrêt seulement)"""
+        if self.tool is None:
+            return
         try:
-            self.marker_trans.translation.setValue(point[0], point[1], point[2])
-            if self.tool is not None:
-                self.tool.Placement = App.Placement(App.Vector(point[0], point[1], point[2]), App.Rotation(0,0,0,1))
-            if self.toolMesh is not None:
-                self.toolMesh.Placement = App.Placement(App.Vector(point[0], point[1], point[2]), App.Rotation(0,0,0,1))
+            x, y, z = self.marker_trans.translation.getValue()
+            self.tool.Placement = App.Placement(App.Vector(x, y, z), App.Rotation(0,0,0,1))
             self.tool.recompute()
-            self.indice_frequence_cut += 1
-            if self.frequence_cut != 0 and self.indice_frequence_cut % self.frequence_cut == 0:
-                self.stock.Shape = self.stock.Shape.cut(self.tool.Shape)
-            #☺self.updateMesh(App.Vector(point[0],point[1],point[2]))
         except Exception as e:
             App.Console.PrintError(f" {str(e)}\n")
             exc_type, exc_obj, exc_tb = sys.exc_info()
             App.Console.PrintMessage(f'{exc_tb.tb_lineno}\n')
-            pass
 
-    def updateMesh(self, outil_pos):
-        tolerance = 0.01
-        m = self.stockMesh.Mesh
-        new_facets = []
-        # for f in m.Facets:
-        #     d = sum([(App.Vector(p) - outil_pos).Length for p in f.Points]) / 3
-        #     if d > self.tool.Radius:
-        #         new_facets.append(f)
-        for f in m.Facets:
-            inside_count = 0
-            for p in f.Points:
-                global_p = App.Vector(p)
-                if self.toolMesh.isInside(global_p,tolerance,True):
-                    inside_count += 1
-                    if inside_count < 2 :
-                        new_facets.append(f)
-
-        newMesh = Mesh.Mesh(new_facets)
-        self.stockMesh.Mesh = newMesh
+    def updateMesh(self):
+        """Réécrit dans la scène les tuiles du brut modifiées depuis la dernière mise à jour"""
+        if self.stockView is not None:
+            self.stockView.update()
+
+    def removeStockView(self):
+        if self.stockView is not None:
+            self.stockView.remove()
+            self.stockView = None
+
+    def restoreStock(self):
+        """Réaffiche le brut du projet masqué pendant la simulation"""
+        if self.stock is not None and self.stock_visibility is not None and self.stock.ViewObject is not None:
+            self.stock.ViewObject.Visibility = self.stock_visibility
+            self.stock_visibility = None
 
     def _on_timer(self):
         # single step of animation based on timer interval and speed
-        if not self.running or not self.segments or self.seg_index >= len(self.segments):
+        if not self.running or not self.seg_count:
             self.stop()
             return
 
         interval_s = max(0.001, self.timer.interval() / 1000.0)
-        distance = self.speed * interval_s
-
-        # ensure current segment prepared
-        if self.seg_len <= 0.0:
-            self._prepare_segment(self.seg_index)
-
-        while distance > 0 and self.seg_index < len(self.segments):
-            p0, p1 = self.segments[self.seg_index]
-            if self.seg_len <= 1e-12:
-                # zero-length segment -> advance
-                self.seg_index += 1
-                if self.seg_index < len(self.segments):
-                    self._prepare_segment(self.seg_index)
-                continue
-
-            remaining = self.seg_len - self.seg_pos
-            if distance < remaining:
-                # advance within current segment
-                t = (self.seg_pos + distance) / self.seg_len
-                x = p0[0] + (p1[0]-p0[0]) * t
-                y = p0[1] + (p1[1]-p0[1]) * t
-                z = p0[2] + (p1[2]-p0[2]) * t
-                self.seg_pos += distance
-                self._set_marker_position((x,y,z))
-                distance = 0
-            else:
-                # jump to end of segment
-                self._set_marker_position(p1)
-                distance -= remaining
-                self.seg_index += 1
-                if self.seg_index < len(self.segments):
-                    self._prepare_segment(self.seg_index)
-                else:
-                    # finished all segments
-                    self.stop()
-                    return
+        self.seek(self.time + self.speed * interval_s)
+
+        # le maillage du brut n'est mis à jour que tous les frequence_cut pas
+        self.indice_frequence_cut += 1
+        if self.frequence_cut != 0 and self.indice_frequence_cut % self.frequence_cut == 0:
+            self.updateMesh()
+
+        if self.time >= self.timeline.total_time:
+            # finished all segments
+            self.updateMesh()
+            self.stop()
 
     def is_running(self):
         return self.running
 
 class GcodeAnimationControl():
     """Interface graphique pour contrôler GcodeAnimator"""
+    SCRUB_STEPS = 1000
+
     def __init__(self, animator, parent=None):
         #super(GcodeAnimationControl, self).__init__(parent)
         self.animator = animator
@@ -395,6 +713,14 @@ class GcodeAnimationControl():
         self.frequenceSpinBox.valueChanged.connect(self.frequenceChanged)
         frequenceLayout.addWidget(self.frequenceSpinBox)
         
+        # Position dans le programme : glisser place l'outil (et le brut) à cet instant
+        scrubLayout = QtGui.QHBoxLayout()
+        scrubLayout.addWidget(QtGui.QLabel("Position:"))
+        self.scrubSlider = QtGui.QSlider(QtCore.Qt.Horizontal)
+        self.scrubSlider.setRange(0, self.SCRUB_STEPS)
+        self.scrubSlider.valueChanged.connect(self.scrubChanged)
+        scrubLayout.addWidget(self.scrubSlider)
+
         # Include Rapid moves checkbox
         self.rapidCheckBox = QtGui.QCheckBox("Include Rapid Moves")
         self.rapidCheckBox.setChecked(self.animator.include_rapid)
@@ -409,6 +735,7 @@ class GcodeAnimationControl():
         layout.addLayout(btnLayout)
         layout.addLayout(speedLayout)
         layout.addLayout(frequenceLayout)
+        layout.addLayout(scrubLayout)
         layout.addWidget(self.rapidCheckBox)
 
         layoutToolPos = QtGui.QVBoxLayout(self.ui2)
@@ -427,8 +754,6 @@ class GcodeAnimationControl():
         
         self.updateButtons()
 
-        if self.animator.tool is not None:
-            self.animator.tool.Visibility = True
     
     def play(self):
         """Démarre ou reprend l'animation"""
@@ -458,6 +783,17 @@ class GcodeAnimationControl():
     def frequenceChanged(self,value):
         self.animator.frequence_cut = value
 
+    def scrubChanged(self, value):
+        """Déplacement du curseur de position : l'outil et le brut sont placés à cet instant"""
+        if not self.animator.seg_count:
+            self.animator.load_paths(self.animator.include_rapid)
+        if not self.animator.seg_count:
+            return
+        self.animator.seek(self.animator.timeline.total_time * value / self.SCRUB_STEPS)
+        self.animator.marker_switch.whichChild = 0
+        self.animator.updateMesh()
+        self.updateToolPosition()
+
     def rapidChanged(self, state):
         """Appelé quand la case Include Rapid change"""
         include_rapid = (state == QtCore.Qt.Checked)
@@ -473,9 +809,17 @@ class GcodeAnimationControl():
         self.stepBtn.setEnabled(not running)
 
         if running:
-            self.toolPosXLabel.setText(f"X: {self.animator.marker_trans.translation.getValue()[0]:.3f}")
-            self.toolPosYLabel.setText(f"Y: {self.animator.marker_trans.translation.getValue()[1]:.3f}")
-            self.toolPosZLabel.setText(f"Z: {self.animator.marker_trans.translation.getValue()[2]:.3f}")
+            self.updateToolPosition()
+            total = self.animator.timeline.total_time
+            self.scrubSlider.blockSignals(True)
+            self.scrubSlider.setValue(int(round(self.SCRUB_STEPS * self.animator.time / total)) if total > 0 else 0)
+            self.scrubSlider.blockSignals(False)
+
+    def updateToolPosition(self):
+        position = self.animator.marker_trans.translation.getValue()
+        self.toolPosXLabel.setText(f"X: {position[0]:.3f}")
+        self.toolPosYLabel.setText(f"Y: {position[1]:.3f}")
+        self.toolPosZLabel.setText(f"Z: {position[2]:.3f}")
     
     def closeEvent(self, event):
         """Arrête l'animation quand on ferme la fenêtre"""
@@ -483,12 +827,9 @@ class GcodeAnimationControl():
         self.updateTimer.stop()
         if self.animator.tool is not None:
             self.animator.tool.Visibility = False
-        if self.animator.stockMesh is not None:
-            App.activeDocument().removeObject(self.animator.stockMesh.Name)
-            self.animator.stockMesh = None
-        if self.animator.toolMesh is not None:
-            App.activeDocument().removeObject(self.animator.toolMesh.Name)
-            self.animator.toolMesh = None
+        self.animator.removeStockView()
+        self.animator.restoreStock()
+        self.animator.removeMarker()
         #super(GcodeAnimationControl, self).closeEvent(event)
 
     def accept(self):
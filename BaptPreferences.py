@@ -1,4 +1,7 @@
+import multiprocessing
 import os
+import shutil
+import sys
 import FreeCAD
 import FreeCAD as App
 import FreeCADGui as Gui
@@ -21,6 +24,10 @@ class BaptPreferences:
         self.ModeAjout:int= None
         self.DefaultRapidColor = (1.0, 0.0, 0.0)
         self.DefaultFeedColor = (0.0, 1.0, 0.0)
+        self.BackplotCacheSize :int= None
+        self.SimulationSnapshotSize :int= None
+        self.SimulationChainSize :int= None
+        self.ProcessPool :bool= None
         
         # Load settings
         self.preferences = App.ParamGet("User parameter:BaseApp/Preferences/Mod/Bapt")
@@ -54,6 +61,10 @@ class BaptPreferences:
         b = int(self.DefaultFeedColor[2] * 255) & 0xFF
         feed_color_unsigned = (r << 16) | (g << 8) | b
         self.preferences.SetUnsigned("DefaultFeedColor", feed_color_unsigned)
+        self.preferences.SetInt("BackplotCacheSize", self.BackplotCacheSize)
+        self.preferences.SetInt("SimulationSnapshotSize", self.SimulationSnapshotSize)
+        self.preferences.SetInt("SimulationChainSize", self.SimulationChainSize)
+        self.preferences.SetBool("ProcessPool", self.ProcessPool)
 
 
         self.Dirty = False
@@ -82,9 +93,34 @@ class BaptPreferences:
         g = (DefaultFeedColor >> 8) & 0xFF
         b = DefaultFeedColor & 0xFF
         self.DefaultFeedColor = (r / 255.0, g / 255.0, b / 255.0)
+
+        # taille maximale (Mo) du cache des backplots
+        self.BackplotCacheSize = self.preferences.GetInt("BackplotCacheSize", 256)
+        # taille maximale (Mo) des instantanés du brut simulé (retour en arrière dans l'animation)
+        self.SimulationSnapshotSize = self.preferences.GetInt("SimulationSnapshotSize", 64)
+        # taille maximale (Mo) du cache des bruts intermédiaires de la simulation du projet
+        self.SimulationChainSize = self.preferences.GetInt("SimulationChainSize", 256)
+        # calculs lourds (simulation, passes de poche) dans des processus séparés
+        self.ProcessPool = self.preferences.GetBool("ProcessPool", False)
         return True
         
         
+    def getProcessPool(self):
+        """
+        (workers, mp_context) des calculs parallèles : (0, None), dans le processus courant, sauf si
+        ProcessPool est coché. Les processus sont alors lancés par spawn avec l'interpréteur Python
+        de FreeCAD : un fork copierait le processus graphique multithread et ses verrous.
+        """
+        if not self.ProcessPool:
+            return 0, None
+        python = getPythonExecutable()
+        if python is None:
+            App.Console.PrintWarning("Interpréteur Python introuvable, calculs dans le processus courant\n")
+            return 0, None
+        context = multiprocessing.get_context("spawn")
+        context.set_executable(python)
+        return None, context
+
     def getToolsDbPath(self) -> str:
         """Obtenir le chemin de la base de données d'outils"""
         path = self.ToolsDbPath
@@ -106,6 +142,17 @@ class BaptPreferences:
         # return preferences.GetInt("ModeAjout", 0)  # Valeur par défaut 0
         return self.ModeAjout
     
+def getPythonExecutable():
+    """Interpréteur Python livré avec FreeCAD (sys.executable est l'exécutable de FreeCAD)"""
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    for candidate in (os.path.join(sys.prefix, "bin", "python3"), os.path.join(sys.prefix, "bin", "python"),
+                      os.path.join(sys.prefix, "python.exe"), os.path.join(sys.prefix, "bin", "python.exe")):
+        if os.path.isfile(candidate):
+            return candidate
+    return shutil.which("python3")
+
+
 class BaptPreferencesPage(QtGui.QWidget):
     name = translate("Preferences", "Bapt CAM Pref")
     def __init__(self, parent=None):
@@ -214,6 +261,30 @@ class BaptPreferencesPage(QtGui.QWidget):
         
         color_group.setLayout(color_layout)
         layout.addWidget(color_group)
+
+        # Cache des backplots
+        backplot_group = QtGui.QGroupBox("Backplot")
+        backplot_layout = QtGui.QFormLayout()
+        self.backplotCacheSize = QtGui.QSpinBox()
+        self.backplotCacheSize.setRange(0, 16384)
+        self.backplotCacheSize.setSuffix(" Mo")
+        self.backplotCacheSize.setToolTip("Mémoire réservée aux parcours déjà calculés (programmes identiques, opérations liées). 0 désactive le cache.")
+        backplot_layout.addRow("Taille maximale du cache des parcours:", self.backplotCacheSize)
+        self.simulationSnapshotSize = QtGui.QSpinBox()
+        self.simulationSnapshotSize.setRange(0, 16384)
+        self.simulationSnapshotSize.setSuffix(" Mo")
+        self.simulationSnapshotSize.setToolTip("Mémoire réservée aux instantanés du brut simulé, pour revenir en arrière dans l'animation.")
+        backplot_layout.addRow("Instantanés de la simulation:", self.simulationSnapshotSize)
+        self.simulationChainSize = QtGui.QSpinBox()
+        self.simulationChainSize.setRange(0, 16384)
+        self.simulationChainSize.setSuffix(" Mo")
+        self.simulationChainSize.setToolTip("Mémoire réservée au brut après chaque opération : seules les opérations modifiées et les suivantes sont resimulées.")
+        backplot_layout.addRow("Bruts intermédiaires du projet:", self.simulationChainSize)
+        self.processPool = QtGui.QCheckBox()
+        self.processPool.setToolTip("Simulation et passes de poche réparties sur plusieurs processus (lancés à part, sans copier FreeCAD).")
+        backplot_layout.addRow("Calculs dans des processus séparés:", self.processPool)
+        backplot_group.setLayout(backplot_layout)
+        layout.addWidget(backplot_group)
         
         # Ajouter un espace extensible en bas
         layout.addStretch()
@@ -256,6 +327,10 @@ class BaptPreferencesPage(QtGui.QWidget):
         self.prefs.ModeAjout = self.mode_ajout_combo.currentIndex()
         self.prefs.DefaultRapidColor = self.rapidColor
         self.prefs.DefaultFeedColor = self.feedColor
+        self.prefs.BackplotCacheSize = self.backplotCacheSize.value()
+        self.prefs.SimulationSnapshotSize = self.simulationSnapshotSize.value()
+        self.prefs.SimulationChainSize = self.simulationChainSize.value()
+        self.prefs.ProcessPool = self.processPool.isChecked()
 
         self.prefs.saveSettings()
         
@@ -269,6 +344,10 @@ class BaptPreferencesPage(QtGui.QWidget):
         
         self.rapidColor = self.prefs.DefaultRapidColor
         self.feedColor = self.prefs.DefaultFeedColor
+        self.backplotCacheSize.setValue(self.prefs.BackplotCacheSize)
+        self.simulationSnapshotSize.setValue(self.prefs.SimulationSnapshotSize)
+        self.simulationChainSize.setValue(self.prefs.SimulationChainSize)
+        self.processPool.setChecked(self.prefs.ProcessPool)
 
         self.rapidColorButton.setStyleSheet(f"background-color: rgb({int(self.rapidColor[0]*255)}, {int(self.rapidColor[1]*255)}, {int(self.rapidColor[2]*255)})")
         self.feedColorButton.setStyleSheet(f"background-color: rgb({int(self.feedColor[0]*255)}, {int(self.feedColor[1]*255)}, {int(self.feedColor[2]*255)})")
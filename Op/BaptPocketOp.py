@@ -1,15 +1,22 @@
 import math
+import numpy as np
 import BaptPreferences
 import FreeCAD as App, FreeCADGui as Gui
 from Op.PocketNode import noeud
 import Part
 from PySide import QtGui, QtCore
 import sys
+import time
 import traceback
 import BaptUtilities
 from utils import BQuantitySpinBox
 from utils import Log as Log
 from utils.Contour import getFirstPoint, getLastPoint, shiftWire
+from Pocket.Offset import DEFAULT_TOLERANCE, nest_rings, orient_loops
+from Pocket.Layers import LayerCost, depth_levels
+from Pocket.Rings import pocket_rings
+from Pocket.Scanline import scanline_spans, zigzag_segments
+from Pocket.Spiral import spiral_path
 
 if True:
     Log.setLevel(Log.Level.DEBUG, Log.thisModule())
@@ -18,6 +25,23 @@ else:
 
 pocketFillMode = ["offset", "offset2", "zigzag","spirale"]
 
+def wiresToLoops(shape, tolerance=DEFAULT_TOLERANCE):
+    """Boucles (n, 2) des wires fermés de la shape, arcs discrétisés à la tolérance, et leur cote Z"""
+    loops = []
+    z = 0.0
+    for wire in shape.Wires:
+        if not wire.isClosed():
+            continue
+        points = wire.discretize(Deflection=tolerance)
+        z = points[0].z
+        loops.append(np.array([(p.x, p.y) for p in points]))
+    return loops, z
+
+def loopToWire(loop, z)->Part.Wire:
+    """Wire polygonal fermé d'une boucle, pour l'affichage"""
+    points = [App.Vector(float(x), float(y), z) for x, y in loop]
+    return Part.makePolygon(points + points[:1])
+
 class PocketOperation:
     """
     Opération d'usinage de poche basée sur ContourGeometry.
@@ -55,6 +79,8 @@ class PocketOperation:
         obj.addProperty("App::PropertyInteger", "maxGeneration", "Pocket", "Nombre maximum de générations d'offset").maxGeneration = 2
 
         obj.addProperty("App::PropertyBool", "useMiddleofFirstEdge", "Pocket", "Utiliser le milieu de la première arête").useMiddleofFirstEdge = False
+        if not hasattr(obj, "ZigzagAngle"):
+            obj.addProperty("App::PropertyFloat", "ZigzagAngle", "Pocket", "Angle des lignes du zigzag (degrés)").ZigzagAngle = 0.0
         obj.addProperty("App::PropertyBool", "debugMode", "General", "Activer le mode debug").debugMode = False
 
         if not hasattr(obj, "desactivated"):
@@ -63,7 +89,7 @@ class PocketOperation:
 
     def onChanged(self, obj, prop):
         Log.baptDebug(f"{prop}")
-        if prop in ["Overlap", "ToolDiameter", "StepDown", "FinalDepth", "FillMode", "Contour", "maxGeneration", "useMiddleofFirstEdge"]:
+        if prop in ["Overlap", "ToolDiameter", "StepDown", "FinalDepth", "FillMode", "Contour", "maxGeneration", "useMiddleofFirstEdge", "ZigzagAngle"]:
             self.execute(obj)
 
     def is_shape_valid(self, shape:Part.Shape):
@@ -137,10 +163,12 @@ class PocketOperation:
 
             # spheres pour marquer le debut du contour
             spheres  = []
+            # le motif 2D est calculé une fois, quel que soit le nombre de niveaux
+            t0 = time.perf_counter()
             
             # Génération du chemin selon le mode choisi
             if hasattr(obj, 'FillMode') and obj.FillMode == "zigzag":
-                path = self.generate_zigzag_path(shape, tool_diam, overlap)
+                path = self.generate_zigzag_path(shape, tool_diam, overlap, getattr(obj, "ZigzagAngle", 0.0))
             
             elif hasattr(obj, 'FillMode') and obj.FillMode == "offset":
                 edges = self.collectEdges(obj.Contour)
@@ -226,7 +254,7 @@ class PocketOperation:
                 App.Console.PrintError("PocketOperation: Échec de la génération du chemin d'usinage.\n")
                 obj.Shape = Part.Shape()
                 return
-            a = path
+            a = self.stackLayers(obj, shape, path if isinstance(path, list) else [path], time.perf_counter() - t0)
             for s in spheres:
                 a.append(s)
             compound = Part.makeCompound(a)
@@ -239,49 +267,81 @@ class PocketOperation:
             App.Console.PrintError(f"Erreur à la ligne {line_number}\n")
             
 
-    def generate_zigzag_path(self, shape, tool_diam, overlap):
-        # On suppose une poche plane, contour fermé
+    def stackLayers(self, obj, shape, path, pattern_time):
+        """
+        Pose le motif 2D à chaque niveau de StepDown jusqu'à FinalDepth par translation en Z ;
+        le niveau final reçoit en plus la passe de finition des flancs. Sans profondeur sous
+        le contour, le motif est renvoyé tel quel.
+        """
+        levels = depth_levels(shape.BoundBox.ZMax, obj.FinalDepth, obj.StepDown)
+        if len(levels) == 0:
+            return path
+        t0 = time.perf_counter()
+        pattern = Part.makeCompound(path)
+        z0 = pattern.BoundBox.ZMin
+        layers = [pattern.translated(App.Vector(0, 0, float(z) - z0)) for z in levels]
+        t1 = time.perf_counter()
+        layers.extend(self.generate_wall_pass(shape, obj.ToolDiameter, float(levels[-1])))
+        cost = LayerCost(len(levels), pattern_time, t1 - t0, time.perf_counter() - t1)
+        Log.baptDebug(f"{cost}")
+        return layers
+
+    def generate_wall_pass(self, shape, tool_diam, z):
+        """Finition des flancs : contour et îlots décalés du rayon d'outil, à la cote z"""
+        loops, _ = wiresToLoops(shape)
+        rings = pocket_rings(orient_loops(loops), tool_diam / 2, max_rings=1, workers=0)
+        if not rings:
+            return []
+        return [loopToWire(loop, z) for loop in rings[0]]
+
+    def generate_zigzag_path(self, shape, tool_diam, overlap, angle=0.0):
+        """
+        Zigzag dans la zone accessible au centre de l'outil (contour et îlots décalés du rayon),
+        lignes à angle degrés : toutes les lignes sont coupées par le contour en une passe (Pocket.Scanline)
+        """
         if not shape or not shape.BoundBox:
             return None
-        bbox = shape.BoundBox
-        xmin, xmax = bbox.XMin, bbox.XMax
-        ymin, ymax = bbox.YMin, bbox.YMax
         pas = tool_diam * (1 - overlap)
-        lines = []
-        y = ymin + tool_diam/2
-        direction = 1
-        while y <= ymax - tool_diam/2:
-            # Cherche intersections entre la ligne y et la poche
-            section = shape.slice(App.Vector(0, 0, 1), y)
-            if section and hasattr(section, 'Edges'):
-                for edge in section.Edges:
-                    p1, p2 = edge.Vertexes[0].Point, edge.Vertexes[-1].Point
-                    if direction == 1:
-                        lines.append(Part.makeLine(p1, p2))
-                    else:
-                        lines.append(Part.makeLine(p2, p1))
-            y += pas
-            direction *= -1
+        loops, z = wiresToLoops(shape)
+        region = pocket_rings(orient_loops(loops), pas, first=tool_diam / 2, max_rings=1, workers=0)
+        if not region:
+            return None
+        y, row, x0, x1 = scanline_spans(region[0], pas, math.radians(angle))
+        p0, p1 = zigzag_segments(y, row, x0, x1, math.radians(angle))
+        lines = [Part.makeLine(App.Vector(a[0], a[1], z), App.Vector(b[0], b[1], z)) for a, b in zip(p0, p1)]
         if lines:
-            return Part.Wire(lines)
+            return lines
         return None
 
     def offsetting(self, wires, offset_dist, maxGen, parentNode=None, generation=0):
-        """Fonction récursive pour générer les offsets et construire l'arbre des offsets"""
-        node : list[noeud] = [] 
-        for wire in wires.Wires:
-            try:
-                o = wire.makeOffset2D(-offset_dist, join=0, fill=False, openResult=False)
-                for j,w in enumerate(o.Wires):
-                    n = noeud(generation,j, w)
-                    node.append(n)
-                    if parentNode is not None:
-                        parentNode.addChild(n)
-                    self.offsetting(w, offset_dist, maxGen, n, generation+1)
-            except Exception as e:
-                print(f"Offsetting generation {generation} échouée: {e}\n")
-                pass
-        
+        """
+        Construit l'arbre des offsets : toutes les passes sont calculées en un appel (Pocket.Rings,
+        passes mémorisées et calculées en parallèle), puis chaque boucle est rattachée à la boucle
+        de la passe précédente qui la contient. Les noeuds et wires sont neufs à chaque appel :
+        shiftWire et les liaisons les modifient.
+        """
+        node : list[noeud] = []
+        try:
+            loops, z = wiresToLoops(wires)
+            workers, context = BaptPreferences.BaptPreferences().getProcessPool()
+            rings = pocket_rings(orient_loops(loops), offset_dist, workers=workers, mp_context=context)
+        except Exception as e:
+            print(f"Offsetting generation {generation} échouée: {e}\n")
+            return node
+        parents = nest_rings(rings)
+        previous : list[noeud] = []
+        for k, level in enumerate(rings):
+            current = []
+            for j, loop in enumerate(level):
+                n = noeud(generation + k, j, loopToWire(loop, z))
+                current.append(n)
+                if k > 0 and parents[k][j] >= 0:
+                    previous[parents[k][j]].addChild(n)
+                    continue
+                node.append(n)
+                if parentNode is not None:
+                    parentNode.addChild(n)
+            previous = current
 
         return node
 
@@ -335,89 +395,54 @@ class PocketOperation:
             current = Part.Wire(shape)
 
             offset_dist = tool_diam * (1 - overlap)
-            generation = 0
-            while True:
-                generation += 1
-                offset = current.makeOffset2D(-offset_dist, join=0, fill=False, openResult=False)
-
-                current = offset
-
-                # on arrete si l'offset n'est plus fermé ou trop petit
-                if offset is None:
-                    App.Console.PrintMessage("Offset nul, fin de génération.\n")
-                    break
-
-                if not offset or not hasattr(offset, 'Wires') or not offset.Wires:
-                    App.Console.Warning("PocketOperation: Offset invalide ou vide.\n")
-                    break
-                    return None
-
-                path_edges.append(offset)
-
-                if generation >= maxGen: break
+            loops, z = wiresToLoops(current)
+            # toutes les générations en un appel
+            workers, context = BaptPreferences.BaptPreferences().getProcessPool()
+            rings = pocket_rings(orient_loops(loops), offset_dist, max_rings=maxGen, workers=workers, mp_context=context)
+            if not rings:
+                App.Console.PrintMessage("Offset nul, fin de génération.\n")
+
+            for level in rings:
+                path_edges.append(Part.makeCompound([loopToWire(loop, z) for loop in level]))
                 
             App.Console.PrintMessage(f"Offset généré: nb {len(path_edges)}\n")
             return  path_edges
 
         except Exception as e:
-            # import json
-            # j = json.loads(e)
-            # if  j['sErrMsg'] == "makeOffset2D: offset result has no wires.":
-            #     App.Console.PrintMessage(f"Erreur offset gen: {generation}: {e.sErrMsg}\n")
-            #     return path_edges
-            App.Console.PrintError(f"Erreur offset gen: {generation}: {e}\n")
+            App.Console.PrintError(f"Erreur offset gen: {len(path_edges)}: {e}\n")
             exc_type, exc_value, exc_traceback = sys.exc_info()
             line_number = exc_traceback.tb_lineno
             App.Console.PrintError(f"Erreur à la ligne {line_number}\n")
             return path_edges
         
     def generate_spiral_path(self, shape, tool_diam, overlap):
-        # Génère une série d'offsets intérieurs, connecte chaque boucle à la suivante par le point le plus proche
+        """
+        Spirale continue de l'extérieur vers le centre : la plus grande boucle de chaque passe d'offset,
+        tant qu'elle reste dans celle de la passe précédente, rééchantillonnée et fondue dans la suivante
+        (Pocket.Spiral). Un seul polygone est construit pour tout le chemin.
+        """
         try:
             offset_dist = tool_diam * (1 - overlap)
+            contours, z = wiresToLoops(shape)
+            workers, context = BaptPreferences.BaptPreferences().getProcessPool()
+            rings = pocket_rings(orient_loops(contours), offset_dist, workers=workers, mp_context=context)
+            parents = nest_rings(rings)
             loops = []
-            current = shape
-            while True:
-                #offset = current.makeOffset2D(-offset_dist, fill=False, join=0, openResult=True)
-
-                face = Part.Face(current)
-                offset = face.makeOffset(-offset_dist)
-
-                # On arrête si l'offset n'est plus fermé ou trop petit
-                if not offset or not hasattr(offset, 'Wires') or not offset.Wires:
-                    break
-                # Prend la plus grande wire (pour éviter les artefacts)
-                main_wire = max(offset.Wires, key=lambda w: w.Length)
-                if main_wire.Length < tool_diam:
+            previous = -1
+            for k, level in enumerate(rings):
+                # Prend la plus grande boucle (pour éviter les artefacts)
+                lengths = [np.linalg.norm(np.roll(l, -1, axis=0) - l, axis=1).sum() for l in level]
+                main = int(np.argmax(lengths))
+                # On arrête si l'offset est trop petit ou si la poche se sépare ailleurs
+                if lengths[main] < tool_diam or (k > 0 and parents[k][main] != previous):
                     break
-                loops.append(main_wire)
-                current = main_wire
-            # On connecte les boucles entre elles
+                loops.append(level[main])
+                previous = main
             if not loops:
                 return None
-            path_edges = []
-            prev_wire = shape.Wires[0] if hasattr(shape, 'Wires') and shape.Wires else shape
-            for wire in loops:
-                # Trouver le point le plus proche entre la fin du wire précédent et le wire courant
-                p_start = prev_wire.Vertexes[-1].Point
-                min_dist = None
-                min_vert = None
-                for v in wire.Vertexes:
-                    dist = (p_start - v.Point).Length
-                    if min_dist is None or dist < min_dist:
-                        min_dist = dist
-                        min_vert = v.Point
-                # Décale le wire courant pour commencer à ce point
-                reordered = wire.copy()
-                reordered.rotate(reordered.CenterOfMass, App.Vector(0,0,1), 0)  # dummy to force copy
-                reordered = reordered
-                # Ajoute une liaison
-                path_edges.append(Part.makeLine(p_start, min_vert))
-                # Ajoute le wire courant
-                path_edges.extend(reordered.Edges)
-                prev_wire = wire
-            # Retourne un wire unique
-            return Part.Wire(path_edges)
+            # une dizaine de points par pas d'offset suffit à suivre les coins des passes
+            points = spiral_path(loops, offset_dist / 10)
+            return Part.makePolygon([App.Vector(float(x), float(y), z) for x, y in points])
         except Exception as e:
             App.Console.PrintError(f"Erreur spirale: {e}\n")
             exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -1,12 +1,19 @@
-from BaptPath import GcodeAnimationControl, GcodeAnimator, absinc, comp, memory
+from BaptPath import GcodeAnimationControl, GcodeAnimator, checkRapidMoves, simulateToEnd
+from Backplot.Cache import backplot_cache
+from Backplot.SegmentStore import MOTION_FEED, MOTION_NAMES, MOTION_RAPID
+from Backplot.SpatialIndex import SegmentGrid
+from Backplot.Tessellation import DEFAULT_CHORD_TOLERANCE, DEFAULT_COARSE_TOLERANCE
+from Backplot.Worker import BackplotWorker
 from BaptPreferences import BaptPreferences
+from BaptUtilities import find_cam_project
 import FreeCAD as App
 import FreeCADGui as Gui
 
 from Op.utils import CoolantMode
 from PySide import QtCore, QtGui
 from pivy import coin
-import math
+import numpy as np
+import weakref
 
 class baseOp:
     
@@ -48,7 +55,30 @@ class baseOp:
         return None
 
 
+class BackplotRelay(QtCore.QObject):
+    """Transmet les résultats du thread de calcul du backplot au thread principal"""
+    ready = QtCore.Signal(object)
+
+
+class BackplotDocumentObserver:
+    """Arrête les threads de calcul du backplot des opérations d'un document fermé"""
+    def __init__(self):
+        self.providers = weakref.WeakSet()
+
+    def slotDeletedDocument(self, doc):
+        for vp in list(self.providers):
+            if getattr(vp, "document_name", None) == doc.Name:
+                vp.releaseBackplot()
+
+
+backplot_observer = BackplotDocumentObserver()
+App.addDocumentObserver(backplot_observer)
+
+
 class baseOpViewProviderProxy:
+    # opération dont le segment survolé est affiché (info-bulle, cône de direction) : une seule à la fois
+    hover_owner = None
+
     def __init__(self, obj):
         "Set this object as the proxy object of the actual view provider"
         # App.Console.PrintMessage("Initializing baseOpViewProviderProxy for: {}\n".format(__class__.__name__))
@@ -66,6 +96,22 @@ class baseOpViewProviderProxy:
             obj.addProperty("App::PropertyColor", "Feed", "Gcode", "Color for feed moves")
             obj.Feed = BaptPref.DefaultFeedColor
 
+        if not hasattr(obj, "ChordTolerance"):
+            obj.addProperty("App::PropertyLength", "ChordTolerance", "Backplot", "Maximum chordal deviation of displayed arcs")
+            obj.ChordTolerance = DEFAULT_CHORD_TOLERANCE
+
+        if not hasattr(obj, "CoarseLOD"):
+            obj.addProperty("App::PropertyBool", "CoarseLOD", "Backplot", "Display a coarser path when the camera is far away")
+            obj.CoarseLOD = False
+
+        if not hasattr(obj, "CoarseTolerance"):
+            obj.addProperty("App::PropertyLength", "CoarseTolerance", "Backplot", "Chordal deviation of the coarse path")
+            obj.CoarseTolerance = DEFAULT_COARSE_TOLERANCE
+
+        if not hasattr(obj, "CoarseDistance"):
+            obj.addProperty("App::PropertyLength", "CoarseDistance", "Backplot", "Camera distance beyond which the coarse path is displayed")
+            obj.CoarseDistance = 500.0
+
 
         # self.Object = obj.Object
         # obj.Proxy = self
@@ -78,6 +124,21 @@ class baseOpViewProviderProxy:
     def onChanged(self, vp, prop):
         ''' Print the name of the property that has changed '''
         #App.Console.PrintMessage("Change property: " + str(prop) + "\n")
+        if getattr(self, "Path", None) is None:
+            # pas encore attaché
+            return
+        if prop in ("ChordTolerance", "CoarseLOD", "CoarseTolerance", "CoarseDistance"):
+            self.submitBackplot()
+        elif prop in ("Rapid", "Feed"):
+            self.applyColors()
+            self.notifyProject()
+
+    def getLength(self, vobj, name, default):
+        """Valeur (mm) d'une propriété longueur du view provider, default si absente"""
+        value = getattr(vobj, name, None)
+        if value is None:
+            return default
+        return float(getattr(value, "Value", value))
 
     def __getstate__(self):
         ''' When saving the document this object gets stored using Python's cPickle module.
@@ -97,32 +158,69 @@ class baseOpViewProviderProxy:
         self.pick_radius = 5
         self.Path = coin.SoGroup()
 
+        # sommets partagés par les deux line sets (lus depuis self.store)
+        self.points = coin.SoCoordinate3()
+        self.store = None
+        self.text_lines = []
+        self.line_index = None
+        self.spatial_index = None
+        # GcodeEditorTaskPanel ouvert sur cet objet (défilement vers la ligne du segment cliqué)
+        self.editor = None
+
+        self.worker = None
+        self.relay = None
+        self.document_name = obj.Object.Document.Name
+        self.startBackplot()
+
         self.rapid_group = coin.SoSeparator()
         self.rapid_color = coin.SoBaseColor()
-        self.rapid_points = coin.SoCoordinate3()
         self.rapid_lines = coin.SoIndexedLineSet()
         pick = coin.SoPickStyle()
         pick.style = coin.SoPickStyle.SHAPE
         self.rapid_group.insertChild(pick, 0)
         self.rapid_group.addChild(self.rapid_color)
-        self.rapid_group.addChild(self.rapid_points)
         self.rapid_group.addChild(self.rapid_lines)
 
         self.feed_group = coin.SoSeparator()
         self.feed_color = coin.SoBaseColor()
-        self.feed_points = coin.SoCoordinate3()
         self.feed_lines = coin.SoIndexedLineSet()
         pick = coin.SoPickStyle()
         pick.style = coin.SoPickStyle.SHAPE
         self.feed_group.insertChild(pick, 0)
         self.feed_group.addChild(self.feed_color)
-        self.feed_group.addChild(self.feed_points)
         self.feed_group.addChild(self.feed_lines)
 
-        self.line_set_kind = {
-            self.rapid_lines: "rapid",
-            self.feed_lines: "feed",
-        }
+        # niveau de détail grossier (mêmes couleurs), non sélectionnable
+        self.coarse_points = coin.SoCoordinate3()
+        self.coarse_rapid_lines = coin.SoIndexedLineSet()
+        self.coarse_feed_lines = coin.SoIndexedLineSet()
+        self.coarse_group = coin.SoSeparator()
+        pick = coin.SoPickStyle()
+        pick.style = coin.SoPickStyle.UNPICKABLE
+        self.coarse_group.addChild(pick)
+        self.coarse_group.addChild(self.coarse_points)
+        for color, lines in ((self.rapid_color, self.coarse_rapid_lines), (self.feed_color, self.coarse_feed_lines)):
+            sep = coin.SoSeparator()
+            sep.addChild(color)
+            sep.addChild(lines)
+            self.coarse_group.addChild(sep)
+
+        # segments des lignes sélectionnées dans l'éditeur (mêmes sommets)
+        self.highlight_group, self.highlight_lines = self.makeOverlay((1.0, 1.0, 0.0), 4)
+        # rapides qui traversent de la matière (checkRapidMoves)
+        self.crash_group, self.crash_lines = self.makeOverlay((1.0, 0.0, 0.0), 6)
+
+        self.fine_group = coin.SoGroup()
+        self.fine_group.addChild(self.points)
+        self.fine_group.addChild(self.rapid_group)
+        self.fine_group.addChild(self.feed_group)
+        self.fine_group.addChild(self.highlight_group)
+        self.fine_group.addChild(self.crash_group)
+
+        # sans range, SoLOD affiche toujours le premier enfant (détail fin)
+        self.lod = coin.SoLOD()
+        self.lod.addChild(self.fine_group)
+        self.lod.addChild(self.coarse_group)
         # Créer le groupe pour le cône de direction
         self.direction_group = coin.SoSeparator()
         self.direction_switch = coin.SoSwitch()  # Pour montrer/cacher le cône
@@ -145,12 +243,14 @@ class baseOpViewProviderProxy:
 
         # Ajouter les événements de souris
         self.mouse_cb = coin.SoEventCallback()
-        #self.mouse_cb.setCallback(self.mouse_event_cb)
-
-        #self.mouse_cb.addEventCallback(coin.SoLocation2Event.getClassTypeId(), self.mouse_event_cb)
+        self.mouse_cb.addEventCallback(coin.SoLocation2Event.getClassTypeId(), self.mouse_event_cb)
+        self.mouse_cb.addEventCallback(coin.SoMouseButtonEvent.getClassTypeId(), self.mouse_click_cb)
 
-        self.Path.addChild(self.rapid_group)
-        self.Path.addChild(self.feed_group)
+        # masqué quand le projet affiche le backplot fusionné de toutes ses opérations
+        self.display_switch = coin.SoSwitch()
+        self.display_switch.addChild(self.lod)
+        self.display_switch.whichChild = 0
+        self.Path.addChild(self.display_switch)
 
         self.Path.addChild(self.direction_switch)
         self.Path.addChild(self.mouse_cb)
@@ -172,63 +272,35 @@ class baseOpViewProviderProxy:
         if not isinstance(event, coin.SoLocation2Event):
             return
 
-        if not hasattr(self, "segment_metadata"):
-            return
-
-        pos = event.getPosition()
-        view = Gui.ActiveDocument.ActiveView
-        renderer = view.getViewer().getSoRenderManager().getViewportRegion()
-        picking = coin.SoRayPickAction(renderer)
-        picking.setPoint(pos)
-        picking.setRadius(self.pick_radius)
-        picking.apply(self.Path)
-        App.Console.PrintMessage(f'mouse event cb 0\n')
-
-        picked = picking.getPickedPoint()
-        if picked is None:
-            self.direction_switch.whichChild = coin.SO_SWITCH_NONE
-            return
-
-        App.Console.PrintMessage(f'mouse event cb 01\n')
-        detail = picked.getDetail()
-        if not isinstance(detail, coin.SoLineDetail):
-            self.direction_switch.whichChild = coin.SO_SWITCH_NONE
+        if getattr(self, "store", None) is None or len(self.store) == 0:
             return
-
-        App.Console.PrintMessage(f'mouse event cb 1\n')
-
-        path = picked.getPath()
-        kind = None
-        if path is not None:
-            line_set_kind = getattr(self, "line_set_kind", {})
-            for i in range(path.getLength() - 1, -1, -1):
-                node = path.getNode(i)
-                kind = line_set_kind.get(node)
-                if kind is not None:
-                    break
-
-        if kind is None or kind not in self.segment_metadata:
-            self.direction_switch.whichChild = coin.SO_SWITCH_NONE
+        if self.display_switch.whichChild.getValue() != 0:
+            # parcours affiché par le backplot fusionné du projet
+            self.clearHover()
             return
-        App.Console.PrintMessage(f'mouse event cb 2\n')
-
 
-        line_index = detail.getLineIndex()
-        segments = self.segment_metadata.get(kind, [])
-        if not (0 <= line_index < len(segments)):
-            self.direction_switch.whichChild = coin.SO_SWITCH_NONE
+        hit = self.pickSegment(event.getPosition())
+        if hit is None:
+            # n'efface que ce que cette opération a affiché : une autre peut avoir un segment sous le curseur
+            self.clearHover()
             return
+        # les opérations suivantes dans la scène ne cherchent pas de segment pour ce mouvement
+        event_callback.setHandled()
 
-        pt1, pt2 = segments[line_index]
-        App.Console.PrintMessage(f'mouse event cb 3\n')
+        seg = hit[0]
+        kind = int(self.store.kinds[seg])
+        pt1, pt2 = self.store.endpoint(seg)
+        self.takeHover()
+        self.showSegmentToolTip(seg)
 
-        default_color = (1.0, 0.0, 0.0) if kind == "rapid" else (0.0, 1.0, 0.0)
+        default_color = (1.0, 0.0, 0.0) if kind == MOTION_RAPID else (0.0, 1.0, 0.0)
+        prop_name = MOTION_NAMES[kind].capitalize()
         view_obj = getattr(self.Object, "ViewObject", None)
         prop_color = None
         if view_obj is not None:
-            prop_color = getattr(view_obj, kind.capitalize(), None)
+            prop_color = getattr(view_obj, prop_name, None)
         if prop_color is None:
-            prop_color = getattr(self.Object, kind.capitalize(), default_color)
+            prop_color = getattr(self.Object, prop_name, default_color)
         if hasattr(prop_color, "x"):
             color = (prop_color.x, prop_color.y, prop_color.z)
         else:
@@ -248,7 +320,8 @@ class baseOpViewProviderProxy:
             return
 
         dir_norm = (direction[0] / length, direction[1] / length, direction[2] / length)
-        rot = coin.SbRotation(coin.SbVec3f(0, 0, 1), coin.SbVec3f(*dir_norm))
+        # SoCone est orienté selon +Y
+        rot = coin.SbRotation(coin.SbVec3f(0, 1, 0), coin.SbVec3f(*dir_norm))
         self.direction_rotation.rotation.setValue(rot)
 
         h = max(length * 0.6, 2.0)
@@ -262,470 +335,219 @@ class baseOpViewProviderProxy:
         self.direction_color.rgb.setValues(0, 1, [color])
         self.direction_switch.whichChild = 0
 
+    def takeHover(self):
+        """Cette opération affiche le segment survolé : l'affichage de la précédente est effacé"""
+        owner = baseOpViewProviderProxy.hover_owner
+        if owner is not None and owner is not self:
+            owner.clearHover()
+        baseOpViewProviderProxy.hover_owner = self
+
+    def clearHover(self):
+        """Cache le cône de direction, et l'info-bulle si c'est cette opération qui l'a affichée"""
+        self.direction_switch.whichChild = coin.SO_SWITCH_NONE
+        if baseOpViewProviderProxy.hover_owner is self:
+            QtGui.QToolTip.hideText()
+            baseOpViewProviderProxy.hover_owner = None
+
+    def mouse_click_cb(self, user_data, event_callback):
+        """Clic sur un segment : l'éditeur G-code ouvert défile jusqu'à sa ligne"""
+        event = event_callback.getEvent()
+        if self.editor is None or getattr(self, "store", None) is None or len(self.store) == 0:
+            return
+        if not coin.SoMouseButtonEvent.isButtonPressEvent(event, coin.SoMouseButtonEvent.BUTTON1):
+            return
+        hit = self.pickSegment(event.getPosition())
+        if hit is not None:
+            self.editor.showLine(int(self.store.lines[hit[0]]))
+
+    def makeOverlay(self, color, width):
+        """Groupe non sélectionnable de segments (indices dans self.points) dessinés par-dessus le backplot"""
+        group = coin.SoSeparator()
+        pick = coin.SoPickStyle()
+        pick.style = coin.SoPickStyle.UNPICKABLE
+        group.addChild(pick)
+        style = coin.SoDrawStyle()
+        style.lineWidth = width
+        group.addChild(style)
+        base_color = coin.SoBaseColor()
+        base_color.rgb.setValue(*color)
+        group.addChild(base_color)
+        lines = coin.SoIndexedLineSet()
+        group.addChild(lines)
+        return group, lines
+
+    def setOverlay(self, lines, segments):
+        s = self.store.starts[np.sort(segments)]
+        idx = np.empty((len(s), 3), dtype=np.int32)
+        idx[:, 0] = s
+        idx[:, 1] = s + 1
+        idx[:, 2] = -1
+        lines.coordIndex.setNum(idx.size)
+        if idx.size:
+            lines.coordIndex.setValues(0, idx.size, idx.ravel())
+
+    def highlightLines(self, first, last=None):
+        """Met en évidence les segments des lignes source first à last (0-based)"""
+        if self.line_index is None:
+            return
+        self.setOverlay(self.highlight_lines, self.line_index.segments(first, last))
+
+    def clearHighlight(self):
+        self.highlight_lines.coordIndex.setNum(0)
+
+    def markCrashes(self, segments):
+        """Segments (indices dans self.store) à marquer en rouge : rapides en collision"""
+        self.setOverlay(self.crash_lines, np.asarray(segments, dtype=np.int64))
+
+    def pickSegment(self, pos):
+        """
+        Segment sous le curseur (position en pixels du viewport) à l'aide de l'index spatial.
+        Retourne (segment, t, distance) ou None.
+        """
+        if self.spatial_index is None:
+            # construit au premier survol après chaque évaluation
+            self.spatial_index = SegmentGrid(*self.store.endpoints())
+
+        viewer = Gui.ActiveDocument.ActiveView.getViewer()
+        render_manager = viewer.getSoRenderManager()
+        viewport = render_manager.getViewportRegion()
+        size = viewport.getViewportSizePixels()
+        camera = render_manager.getCamera()
+        volume = camera.getViewVolume(viewport.getViewportAspectRatio())
+
+        line = coin.SbLine()
+        volume.projectPointToLine(coin.SbVec2f(pos[0] / float(size[0]), pos[1] / float(size[1])), line)
+        origin = line.getPosition().getValue()
+        direction = line.getDirection().getValue()
+
+        # rayon de picking en pixels converti en longueur au niveau du plan focal
+        focal = coin.SbVec3f(*origin) + line.getDirection() * camera.focalDistance.getValue()
+        radius = volume.getWorldToScreenScale(focal, self.pick_radius / float(size[0]))
+        return self.spatial_index.query(origin, direction, radius)
+
+    def showSegmentToolTip(self, seg):
+        """Info-bulle : ligne source du segment survolé"""
+        line = int(self.store.lines[seg])
+        text_lines = self.text_lines or []
+        text = text_lines[line].strip() if line < len(text_lines) else ""
+        QtGui.QToolTip.showText(QtGui.QCursor.pos(), "{} - ligne {} : {}".format(MOTION_NAMES[int(self.store.kinds[seg])], line + 1, text))
+
     def updateData(self, fp, prop):
 
         # if no Gcode property, nothing to do
         if not hasattr(self.Object, "Gcode"):
             return
+        if getattr(self, "Path", None) is None:
+            return
+        self.submitBackplot()
+
+    def startBackplot(self):
+        """Crée le thread de calcul du backplot et le relais vers le thread principal"""
+        # interprétation / discrétisation dans un thread, résultats appliqués dans le thread principal
+        self.relay = BackplotRelay()
+        self.relay.ready.connect(self.applyBackplot, QtCore.Qt.QueuedConnection)
+        # un programme déjà discrétisé (copie liée, document rouvert) est repris du cache du processus
+        backplot_cache.resize(BaptPreferences().BackplotCacheSize << 20)
+        self.worker = BackplotWorker(self.relay.ready.emit, cache=backplot_cache)
+        self.applied_generation = 0
+        backplot_observer.providers.add(self)
+
+    def submitBackplot(self):
+        """Demande la réévaluation du backplot au thread de calcul (la demande précédente est abandonnée)"""
+        if self.worker is None:
+            # opération restaurée par une annulation après sa suppression
+            self.startBackplot()
+        vobj = self.Object.ViewObject
+        gcode_text = str(getattr(self.Object, "Gcode", "") or "")
+        coarse_tolerance = None
+        if getattr(vobj, "CoarseLOD", False):
+            coarse_tolerance = self.getLength(vobj, "CoarseTolerance", DEFAULT_COARSE_TOLERANCE)
+        self.worker.submit(gcode_text, self.getLength(vobj, "ChordTolerance", DEFAULT_CHORD_TOLERANCE), coarse_tolerance)
+
+    def applyBackplot(self, result):
+        """Thread principal : remplace le contenu des noeuds coin par le résultat d'une évaluation"""
+        if self.worker is None or self.worker.is_stale(result.generation):
+            # une demande plus récente est en cours : son résultat remplacera celui-ci
+            return
+        if result.error is not None:
+            App.Console.PrintError("Backplot {}: {}\n".format(self.Object.Label, result.error))
+            return
+        for warning in result.warnings:
+            App.Console.PrintMessage("{}\n".format(warning))
 
-        gcode_text = str(self.Object.Gcode or "")
-        self.lines = [l.strip() for l in gcode_text.splitlines() if l.strip()]
-
-        def parse_xyz(line, prev,absinc_mode=absinc.G90):
-            """helper to parse coords in a G-code line (X Y Z)"""
-            x, y, z = prev
-
-            for token in line.split():
-                if token.upper().startswith("X"):
-                    try:
-                        x = float(token[1:]) if absinc_mode == absinc.G90 else prev[0] + float(token[1:])
-                    except:
-                        pass
-                elif token.upper().startswith("Y"):
-                    try:
-                        y = float(token[1:]) if absinc_mode == absinc.G90 else prev[1] + float(token[1:])
-                    except:
-                        pass
-                elif token.upper().startswith("Z"):
-                    try:
-                        z = float(token[1:]) if absinc_mode == absinc.G90 else prev[2] + float(token[1:])
-                    except:
-                        pass
-            return (x, y, z)
-
-        # build coordinate lists and index arrays for each group
-        rapid_coords = []
-        rapid_idx = []
-        feed_coords = []
-        feed_idx = []
-
-        # current position (start at origin)
-        self.cur = (0.0, 0.0, 0.0)
-
-        self.ordered_segments = []
-        self.segment_metadata = {"rapid": [], "feed": []}
-
-        self.comp_mode = comp.G40  # default cutter compensation off
-        self.absinc_mode = absinc.G90  # default absolute mode
-        self.mem = memory()
-        self.line = 0
-
-        def parse_ijr(line):
-            """helper to parse I/J/R (center offsets or radius)"""
-            I = J = R = None
-            for token in line.split():
-                t = token.upper()
-                if t.startswith("I"):
-                    try:
-                        I = float(token[1:])
-                    except:
-                        pass
-                elif t.startswith("J"):
-                    try:
-                        J = float(token[1:])
-                    except:
-                        pass
-                elif t.startswith("R"):
-                    try:
-                        R = float(token[1:])
-                    except:
-                        pass
-            return I, J, R
-
-        def centers_from_radius(p0, p1, R):
-            """compute circle centers from radius R (returns one center that matches direction if requested)"""
-            (x1, y1) = (p0[0], p0[1])
-            (x2, y2) = (p1[0], p1[1])
-            dx = x2 - x1
-            dy = y2 - y1
-            d2 = dx*dx + dy*dy
-            if d2 == 0.0:
-                return None  # identical points
-            d = math.sqrt(d2)
-            if d > 2.0 * R + 1e-12:
-                return None  # impossible with given radius
-            # midpoint
-            mx = (x1 + x2) / 2.0
-            my = (y1 + y2) / 2.0
-            # distance from midpoint to center
-            h = math.sqrt(max(R*R - (d/2.0)*(d/2.0), 0.0))
-            ux = -dy / d
-            uy = dx / d
-            c1 = (mx + ux * h, my + uy * h)
-            c2 = (mx - ux * h, my - uy * h)
-            return c1, c2
-
-        def append_segment(coords_list, idx_list, a, b):
-            """helper to append a segment to a group's arrays"""
-            i = len(coords_list)
-            coords_list.append(a)
-            coords_list.append(b)
-            idx_list.extend([i, i+1, -1])
-            group = "rapid" if coords_list is rapid_coords else "feed"
-            self.ordered_segments.append((group, a, b))
-            self.segment_metadata[group].append((a, b))
-
-        def executeCycle():
-            new = self.cur
-
-            if self.mem.current_cycle["type"] == 81:
-
-                a = list(new[0:2])
-                a.append(self.mem.current_cycle["Z"])
-                new = tuple(a)
-
-                append_segment(feed_coords,feed_idx,self.cur,new)
-                self.cur = new
-                a = list(new[0:2])
-                a.append(self.mem.current_cycle["R"])
-                new = tuple(a)
-                append_segment(rapid_coords,rapid_idx,self.cur,new)
-                self.cur = new
-
-            elif self.mem.current_cycle["type"] == 83:
-                start_z = self.cur[-1]
-                final_Z = self.mem.current_cycle["Z"]
-                done = start_z
-                prisePasse = self.mem.current_cycle["Q"]
-                while done > final_Z:
-                    done = done-prisePasse
-                    if done < final_Z:
-                        prisePasse = final_Z
-                    a = list(new[0:2])
-                    a.append(done)
-                    new = tuple(a)
-
-                    append_segment(feed_coords,feed_idx,self.cur,new)
-                    self.cur = new
-                    a = list(new[0:2])
-                    a.append(self.mem.current_cycle["R"])
-                    new = tuple(a)
-                    append_segment(rapid_coords,rapid_idx,self.cur,new)
-                    self.cur = new
-
-            else:
-                raise ValueError()
-
-        def processGcode():
-            while self.line < len(self.lines):
-
-                if len(self.mem.queue) > 0:
-                    #App.Console.PrintMessage("Checking memory queue for line {}\n".format(self.line))
-                    if self.line == self.mem.queue[0] :
-                        self.mem.queue.popleft()
-                        break
-
-                ln = self.lines[self.line]
-                #App.Console.PrintMessage("Processing line {}: {}\n".format(self.line, ln))
-                self.line += 1
-                up = ln.upper()
-                # consider only movement commands G0/G00 and G1/G01
-                if up.startswith("G0") or up.startswith("G00"):
-                    new = parse_xyz(ln, self.cur, self.absinc_mode)
-                    append_segment(rapid_coords, rapid_idx, self.cur, new)
-                    self.cur = new
-                    if self.mem.current_cycle is not None:
-                        executeCycle()
-
-                elif up.startswith("G1") or up.startswith("G01"):
-                    new = parse_xyz(ln, self.cur, self.absinc_mode)
-                    append_segment(feed_coords, feed_idx, self.cur, new)
-                    self.cur = new
-                    if self.mem.current_cycle is not None:
-                        executeCycle()
-                elif up.startswith("G2") or up.startswith("G3"):
-                    # Circular interpolation. Prefer I/J (center offsets). If only R given, compute center(s).
-                    is_ccw = up.startswith("G3")
-                    end = parse_xyz(ln, self.cur,self.absinc_mode)
-                    I, J, R = parse_ijr(ln)
-
-                    # if no XY endpoint given, skip (cannot handle)
-                    if (end[0], end[1]) == (self.cur[0], self.cur[1]):
-                        # nothing to do if no movement in XY
-                        self.cur = (end[0], end[1], end[2])
-                        continue
-
-                    center = None
-                    radius = None
-                    if I is not None or J is not None:
-                        # center relative to start
-                        i_val = I or 0.0
-                        j_val = J or 0.0
-                        cx = self.cur[0] + i_val
-                        cy = self.cur[1] + j_val
-                        center = (cx, cy)
-                        radius = math.hypot(self.cur[0] - cx, self.cur[1] - cy)
-                    elif R is not None:
-                        # compute possible centers from R
-                        cs = centers_from_radius(self.cur, end, R)
-                        if cs is None:
-                            # fallback to linear if impossible
-                            append_segment(feed_coords, feed_idx, self.cur, end)
-                            self.cur = end
-                            continue
-                        # choose center that yields correct direction (G2 cw => negative sweep)
-                        c1, c2 = cs
-                        # compute sweeps for both centers
-                        def compute_sweep(c):
-                            sx = math.atan2(self.cur[1]-c[1], self.cur[0]-c[0])
-                            ex = math.atan2(end[1]-c[1], end[0]-c[0])
-                            sweep = ex - sx
-                            return sweep, sx, ex
-                        s1, s1s, s1e = compute_sweep(c1)
-                        s2, s2s, s2e = compute_sweep(c2)
-                        # normalize sweeps
-                        def norm_sweep(s):
-                            if is_ccw:
-                                if s <= 0:
-                                    s += 2*math.pi
-                            else:
-                                if s >= 0:
-                                    s -= 2*math.pi
-                            return s
-                        ns1 = norm_sweep(s1)
-                        ns2 = norm_sweep(s2)
-                        # choose the center with smaller absolute normalized sweep
-                        if abs(ns1) <= abs(ns2):
-                            center = c1
-                            radius = R
-                        else:
-                            center = c2
-                            radius = R
-                    else:
-                        # no center info -> fallback to linear
-                        append_segment(feed_coords, feed_idx, self.cur, end)
-                        self.cur = end
-                        continue
-
-                    # now we have center and radius
-                    cx, cy = center
-
-                    r = radius
-                    if r <= 1e-12:
-                        append_segment(feed_coords, feed_idx, self.cur, end)
-                        self.cur = end
-                        continue
-
-                    # compute start and end angles
-                    start_ang = math.atan2(self.cur[1] - cy, self.cur[0] - cx)
-                    end_ang = math.atan2(end[1] - cy, end[0] - cx)
-                    # compute sweep based on direction
-                    if is_ccw:
-                        sweep = end_ang - start_ang
-                        if sweep <= 0:
-                            sweep += 2 * math.pi
-                    else:
-                        sweep = end_ang - start_ang
-                        if sweep >= 0:
-                            sweep -= 2 * math.pi
-
-                    # choose segment density: ~5° per segment or more for large arcs
-                    seg_angle = math.radians(5.0)
-                    nseg = max(1, int(math.ceil(abs(sweep) / seg_angle)))
-                    z0 = self.cur[2]
-                    z1 = end[2]
-                    for i in range(1, nseg + 1):
-                        ang = start_ang + sweep * (i / float(nseg))
-                        x = cx + r * math.cos(ang)
-                        y = cy + r * math.sin(ang)
-                        z = z0 + (z1 - z0) * (i / float(nseg))
-                        new_pt = (x, y, z)
-                        append_segment(feed_coords, feed_idx, self.cur, new_pt)
-                        self.cur = new_pt
-
-                    # ensure final endpoint exact
-                    if (abs(self.cur[0]-end[0]) > 1e-9) or (abs(self.cur[1]-end[1]) > 1e-9) or (abs(self.cur[2]-end[2]) > 1e-9):
-                        append_segment(feed_coords, feed_idx, self.cur, end)
-                        self.cur = end
-
-                elif up.startswith("G40"):
-                    self.comp_mode = comp.G40
-                elif up.startswith("G41"):
-                    self.comp_mode = comp.G41
-                elif up.startswith("G42"):
-                    self.comp_mode = comp.G42
-
-                elif up.startswith("G80"):
-                    self.mem.current_cycle = None
-                elif up.startswith("G81"):
-                    up.removeprefix("G81")
-                    tokens = up.split(" ")
-                    d = dict()
-                    for t in tokens:
-                        if t.upper().startswith("X"):
-                            d["X"] = float(t[1:]) if self.mem.absincMode == absinc.G90 else  self.cur + float(t[1:])
-                        if t.upper().startswith("Y"):
-                            d["Y"] = float(t[1:]) if self.mem.absincMode == absinc.G90 else  self.cur + float(t[1:])
-                        if t.upper().startswith("Z"):
-                            d["Z"] = float(t[1:]) if self.mem.absincMode == absinc.G90 else  self.cur + float(t[1:])
-                        if t.upper().startswith("R"):
-                            d["R"] = float(t[1:])
-                    self.mem.current_cycle = {"type":81,"Z":d["Z"],"R":d["R"]}
-                    executeCycle()
-
-                elif up.startswith("G83"):
-                    up.removeprefix("G83")
-                    tokens = up.split(" ")
-                    d = dict()
-                    for t in tokens:
-                        if t.upper().startswith("X"):
-                            d["X"] = float(t[1:]) if self.mem.absincMode == absinc.G90 else  self.cur + float(t[1:])
-                        if t.upper().startswith("Y"):
-                            d["Y"] = float(t[1:]) if self.mem.absincMode == absinc.G90 else  self.cur + float(t[1:])
-                        if t.upper().startswith("Z"):
-                            d["Z"] = float(t[1:]) if self.mem.absincMode == absinc.G90 else  self.cur + float(t[1:])
-                        if t.upper().startswith("R"):
-                            d["R"] = float(t[1:])
-                        if t.upper().startswith("Q"):
-                            d["Q"] = float(t[1:])
-                            if d["Q"] <= 0: raise ValueError()
-                    self.mem.current_cycle = {"type":83,"Z":d["Z"],"R":d["R"],"Q":d["Q"]}
-                    executeCycle()
-
-                elif up.startswith("G90") :
-                    self.absinc_mode = absinc.G90
-                elif up.startswith("G91") :
-                    self.absinc_mode = absinc.G91
-
-                elif up.startswith("M30"):
-                    # program end
-                    break
-
-
-
-                elif up[0].isalpha() and up.endswith(":"):
-                    # label declaration
-                    label = up[:-1]
-                    # store label with current line number
-                    self.mem.addLabel(label, self.line)
-
-                elif up.startswith("REPEAT"):
-                    # repeat command
-                    parts = up.split()
-                    label_begin = None
-                    n_times = 1
-                    label_end = None
-
-                    if len(parts) == 2: #REPEAT Start
-                        label_begin = parts[1] if len(parts) > 1 else None
-                        n_times = 1
-                    elif len(parts) == 3: #REPEAT Start P=
-                        label_begin = parts[1] if len(parts) > 1 else None
-
-                        n_times = parts[2].removeprefix("P=")
-                        if n_times.isdigit():
-                            n_times = int(n_times)
-                        elif n_times.startswith("R"):
-                            var_name = "R{}".format(n_times[1:])
-                            if var_name in self.mem.variables:
-                                n_times = int(self.mem.variables[var_name])
-                            else:
-                                raise Exception("Variable {} not defined for REPEAT".format(var_name))
-                    elif len(parts) == 4: #REPEAT Start End P=
-                        label_begin = parts[1]
-                        label_end = parts[2]
-                        n_times = parts[3].removeprefix("P=")
-                        if n_times.isdigit():
-                            n_times = int(n_times)
-                        elif n_times.startswith("R"):
-                            var_name = "R{}".format(n_times[1:])
-                            if var_name in self.mem.variables:
-                                n_times = int(self.mem.variables[var_name])
-                            else:
-                                raise Exception("Variable {} not defined for REPEAT".format(var_name))
-                    else:
-                        pass
-                    #App.Console.PrintMessage("REPEAT command found: label={} times={}\n".format(label_begin, n_times))
-
-                    if label_begin is not None and label_begin in self.mem.labels:
-                        start_line = self.mem.labels[label_begin]
-                        #App.Console.PrintMessage("REPEAT label {} found at line {}\n".format(label_begin, start_line))
-                        for _ in range(n_times):
-                            # reset line to start_line and process until we reach the label_end or original line
-
-                            if label_end is not None and label_end in self.mem.labels:
-
-                                saved_line = self.mem.labels[label_end] - 1
-                                restore = self.line
-                                self.line = start_line
-
-                            else:
-                                saved_line = self.line-1
-                                self.line = start_line
-                                restore = saved_line
-
-                            self.mem.queue.append(saved_line)
-
-                            processGcode()
-                            self.line = restore  # restore original line after repeat
-                            #App.Console.PrintMessage(f'sortie de boucle ligne {self.lines[self.line]}\n')
-                        pass
-                    else:
-                        App.Console.PrintMessage("REPEAT label {} not found\n".format(label_begin))
-                        raise Exception("REPEAT label {} not found".format(label_begin))
-
-                elif up.startswith("R"):
-                    # variable
-                    #up.removeprefix("R")
-                    number = int(up[1:up.index("=")])
-                    value = float(up[up.index("=")+1:])
-                    # if not hasattr(fp, "R{}".format(number)):
-                    #     App.Console.PrintMessage("Adding property R{} to object\n".format(number))
-                    try:
-                        #fp.addProperty("App::PropertyFloat", "R{}".format(number), "Gcode", "Variable R{}".format(number))
-                        #setattr(fp, "R{}".format(number), value)
-                        self.mem.variables["R{}".format(number)] = value
-                    except:
-                        pass
-
-                    pass
-
-                elif up.startswith("(") or up.startswith(";"):
-                    # comment line, ignore
-                    pass
-                else:
-                    # other lines may still change position if they contain coords
-                    App.Console.PrintMessage("Ignoring line: {}\n".format(ln))
-                    if any(t.upper().startswith(("X","Y","Z")) for t in ln.split()):
-                        new = parse_xyz(ln, self.cur)
-                        self.cur = new
-                        if self.mem.current_cycle is not None:
-                            executeCycle()
-
-
-
-
-        processGcode()
-
-        # store coords for callbacks/picking
-        self.rapid_coords = rapid_coords
-        self.feed_coords = feed_coords
-
-        # set rapid nodes
-        self.rapid_lines.coordIndex.setValue(0)
-        self.rapid_points.point.setValues(0, 0, [])
-        if rapid_coords:
-            self.rapid_points.point.setValues(0, len(rapid_coords), rapid_coords)
-            self.rapid_lines.coordIndex.setValues(0, len(rapid_idx), rapid_idx)
-            # set single color for rapid group from object's property
-            color = getattr(self.Object.ViewObject, "Rapid", getattr(self.Object, "Rapid", (1.0,0.0,0.0)))
-            self.rapid_color.rgb.setValues(0, 1, [color])
-        else:
-            # clear
-            self.rapid_points.point.setValues(0, 0, [])
-            self.rapid_lines.coordIndex.setValues(0, 0, [])
-
-        # set feed nodes
-        self.feed_lines.coordIndex.setValue(0)
-        self.feed_points.point.setValues(0, 0, [])
-        if feed_coords:
-            self.feed_points.point.setValues(0, len(feed_coords), feed_coords)
-            self.feed_lines.coordIndex.setValues(0, len(feed_idx), feed_idx)
-            color = getattr(self.Object.ViewObject, "Feed", getattr(self.Object, "Feed", (0.0,1.0,0.0)))
-            self.feed_color.rgb.setValues(0, 1, [color])
+        if result.base_generation == self.applied_generation:
+            # seule la fin du parcours a changé depuis l'état affiché
+            first = (result.first_segment, result.first_vertex)
+            coarse_first = (result.coarse_first_segment, result.coarse_first_vertex)
         else:
-            self.feed_points.point.setValues(0, 0, [])
-            self.feed_lines.coordIndex.setValues(0, 0, [])
+            first = coarse_first = (0, 0)
+        self.applied_generation = result.generation
+
+        self.store = result.store
+        self.text_lines = result.text_lines
+        self.line_index = result.line_index
+        self.spatial_index = None
+        self.clearHighlight()
+        self.crash_lines.coordIndex.setNum(0)
+        self.patchLineSets(self.store, first[0], first[1], self.points, self.rapid_lines, self.feed_lines)
+
+        self.applyColors()
+        self.updateCoarse(result.coarse_store, coarse_first[0], coarse_first[1])
+        self.notifyProject()
+
+    def applyColors(self):
+        """Couleurs des rapides et des avances lues dans les propriétés Rapid / Feed"""
+        for color_node, prop_name, default_color in (
+            (self.rapid_color, "Rapid", (1.0, 0.0, 0.0)),
+            (self.feed_color, "Feed", (0.0, 1.0, 0.0)),
+        ):
+            # set single color for the group from object's property
+            color = getattr(self.Object.ViewObject, prop_name, getattr(self.Object, prop_name, default_color))
+            color_node.rgb.setValues(0, 1, [color])
+
+    def notifyProject(self):
+        """Le backplot fusionné du projet (s'il est affiché) doit être recalculé"""
+        project = find_cam_project(self.Object)
+        vp = getattr(getattr(project, "ViewObject", None), "Proxy", None)
+        if vp is not None and hasattr(vp, "scheduleBackplot"):
+            vp.scheduleBackplot()
+
+    def setMerged(self, merged):
+        """Affiché par le projet (backplot fusionné) : les noeuds propres à l'opération sont masqués"""
+        self.display_switch.whichChild = coin.SO_SWITCH_NONE if merged else 0
+
+    def patchLineSets(self, store, first_segment, first_vertex, points, rapid_lines, feed_lines):
+        """Réécrit les sommets et coordIndex à partir de first_segment / first_vertex avec setValues"""
+        vertices = store.vertices
+        points.point.setNum(len(vertices))
+        if len(vertices) > first_vertex:
+            points.point.setValues(first_vertex, len(vertices) - first_vertex, vertices[first_vertex:])
+
+        kinds_before = store.kinds[:first_segment]
+        for kind, lines in ((MOTION_RAPID, rapid_lines), (MOTION_FEED, feed_lines)):
+            offset = 3 * int(np.count_nonzero(kinds_before == kind))
+            idx = store.line_set_index(kind, first_segment)
+            lines.coordIndex.setNum(offset + len(idx))
+            if len(idx):
+                lines.coordIndex.setValues(offset, len(idx), idx)
+
+    def updateCoarse(self, coarse_store, first_segment, first_vertex):
+        """Niveau de détail grossier, affiché par le SoLOD au-delà de CoarseDistance"""
+        if coarse_store is None:
+            self.lod.range.setNum(0)
+            self.coarse_points.point.setNum(0)
+            self.coarse_rapid_lines.coordIndex.setNum(0)
+            self.coarse_feed_lines.coordIndex.setNum(0)
+            return
+
+        self.patchLineSets(coarse_store, first_segment, first_vertex,
+                           self.coarse_points, self.coarse_rapid_lines, self.coarse_feed_lines)
+
+        vertices = self.store.vertices
+        if len(vertices):
+            center = (vertices.min(axis=0) + vertices.max(axis=0)) / 2.0
+            self.lod.center.setValue(*(float(v) for v in center))
+        self.lod.range.setValue(self.getLength(self.Object.ViewObject, "CoarseDistance", 500.0))
 
     def setupContextMenu(self, vobj, menu):
         """Configuration du menu contextuel"""
@@ -735,6 +557,12 @@ class baseOpViewProviderProxy:
         action2 = menu.addAction("Simulate Toolpath")
         action2.triggered.connect(lambda: self.startSimulation(vobj))
 
+        action3 = menu.addAction("Simulate to End")
+        action3.triggered.connect(lambda: simulateToEnd(vobj.Proxy))
+
+        action4 = menu.addAction("Check Rapid Moves")
+        action4.triggered.connect(lambda: checkRapidMoves(vobj.Proxy))
+
         action_Toggle = QtGui.QAction(Gui.getIcon("Std_TransformManip.svg"), "Active Op", menu)
         QtCore.QObject.connect(action_Toggle, QtCore.SIGNAL("triggered()"), lambda: self.ToggleOp(vobj))
         menu.addAction(action_Toggle)
@@ -742,6 +570,32 @@ class baseOpViewProviderProxy:
 
     def ToggleOp(self,vobj):
         vobj.Object.Active = not vobj.Object.Active
+        self.notifyProject()
+
+    def releaseBackplot(self):
+        """Arrête le thread de calcul du backplot et déconnecte ses résultats"""
+        backplot_observer.providers.discard(self)
+        worker = getattr(self, "worker", None)
+        if worker is not None:
+            worker.shutdown()
+            self.worker = None
+        relay = getattr(self, "relay", None)
+        if relay is not None:
+            try:
+                relay.ready.disconnect(self.applyBackplot)
+            except (RuntimeError, TypeError):
+                pass
+            self.relay = None
+
+    def onDelete(self, vobj, subelements):
+        """
+        Suppression de l'opération : le thread de calcul du backplot est arrêté, il est recréé
+        par submitBackplot si la suppression est annulée
+        """
+        if baseOpViewProviderProxy.hover_owner is self:
+            self.clearHover()
+        self.releaseBackplot()
+        return True
 
     def setDeleteOnReject(self, val):
         self.deleteOnReject = val
@@ -533,6 +533,8 @@ class ViewProviderContournageCycle(baseOpViewProviderProxy):
 
     def onChanged(self, vobj, prop):
         """Appelé lorsqu'une propriété du ViewProvider est modifiée"""
+        # backplot : tolérance de corde, niveau de détail, couleurs
+        super().onChanged(vobj, prop)
         # Mettre à jour l'affichage si une propriété d'affichage change
         if prop in ["ShowToolPath", "PathColor", "PathWidth"]:
             # Appliquer les nouvelles propriétés d'affichage
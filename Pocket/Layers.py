@@ -0,0 +1,63 @@
+"""
+Usinage d'une poche en plusieurs niveaux de profondeur.
+
+Le motif 2D (offsets, zigzag ou spirale) ne dépend pas de la profondeur :
+il est calculé une fois puis posé à chaque niveau par une translation en Z.
+Seuls le fond (dernier niveau, exactement à la profondeur finale) et la
+passe de finition des flancs (contour décalé du rayon d'outil, faite à la
+profondeur finale sur toute la hauteur) sont propres à un niveau.
+LayerCost estime le temps de calcul évité par la réutilisation du motif.
+
+  levels = depth_levels(top, final_depth, step_down)
+  layers = [pattern.translated(Vector(0, 0, z - z0)) for z in levels]
+"""
+import math
+
+import numpy as np
+
+
+def depth_levels(top, final_depth, step_down):
+    """
+    Cotes Z des niveaux, de haut en bas : tous les step_down sous top, le dernier exactement
+    à final_depth. Vide si final_depth n'est pas sous top (le motif reste dans le plan du contour).
+    """
+    if step_down <= 0:
+        raise ValueError("la profondeur de passe doit être positive")
+    depth = top - final_depth
+    if depth <= 0:
+        return np.empty(0)
+    # tolérance relative : une profondeur multiple du pas ne donne pas de niveau supplémentaire
+    count = max(int(math.ceil(depth / step_down - 1e-9)), 1)
+    levels = top - step_down * np.arange(1, count + 1, dtype=np.float64)
+    levels[-1] = final_depth
+    return levels
+
+
+class LayerCost:
+    """
+    Temps de calcul (s) d'une poche à levels niveaux : motif 2D calculé une fois (pattern_time),
+    posé à chaque niveau (emit_time), passes propres au niveau final (finish_time).
+    """
+    def __init__(self, levels, pattern_time, emit_time, finish_time):
+        self.levels = levels
+        self.pattern_time = pattern_time
+        self.emit_time = emit_time
+        self.finish_time = finish_time
+
+    @property
+    def recomputed(self):
+        """Temps estimé si le motif était recalculé à chaque niveau"""
+        return self.levels * self.pattern_time + self.finish_time
+
+    @property
+    def actual(self):
+        return self.pattern_time + self.emit_time + self.finish_time
+
+    @property
+    def saved(self):
+        return self.recomputed - self.actual
+
+    def __str__(self):
+        return (f"{self.levels} niveaux : motif {self.pattern_time * 1000:.1f} ms, "
+                f"pose {self.emit_time * 1000:.1f} ms, finition {self.finish_time * 1000:.1f} ms, "
+                f"gain estimé {self.saved * 1000:.1f} ms sur {self.recomputed * 1000:.1f} ms")
@@ -0,0 +1,372 @@
+"""
+Décalage (offset) intérieur de polygones pour l'évidement de poches.
+
+Les contours sont des boucles fermées de points (n, 2), arcs déjà discrétisés
+à la tolérance : contour extérieur dans le sens trigonométrique, îlots dans
+le sens horaire (orient_loops), la matière à enlever est à gauche.
+
+Un décalage à la distance d se calcule sans OpenCascade :
+  1. offset brut : chaque arête est décalée de d vers la gauche sur toute sa
+     longueur, les coins rentrants sont raccordés par un arc de rayon d
+     discrétisé à la tolérance ;
+  2. les segments bruts sont coupés à leurs intersections (recherche dans
+     une grille, sans comparer tous les couples) ;
+  3. seuls les morceaux à distance >= d du contour d'origine sont gardés,
+     puis recousus en boucles par leurs extrémités.
+
+offset_rings calcule toutes les passes d'un coup, chacune directement depuis
+le contour d'origine (pas d'accumulation d'erreur d'une passe à l'autre) :
+
+  loops = orient_loops([outer, island])
+  rings = offset_rings(loops, step, first=step)    # rings[k] : boucles à first + k * step
+  parents = nest_rings(rings)                      # parents[k][i] : boucle de rings[k - 1] qui contient rings[k][i]
+"""
+import math
+
+import numpy as np
+
+DEFAULT_TOLERANCE = 0.01  # mm
+# les extrémités des morceaux sont recousues sur une grille de ce pas (fraction de la tolérance)
+SNAP_FACTOR = 1e-3
+# recherche de distance : segments par paquets de NEAR_CHUNK, points par blocs de NEAR_BLOCK
+NEAR_CHUNK = 16
+NEAR_BLOCK = 1024
+
+
+def clean_loop(points):
+    """Boucle (n, 2) sans point répété ni point de fermeture"""
+    p = np.asarray(points, dtype=np.float64).reshape(-1, np.shape(points)[-1])[:, :2]
+    if len(p) > 1 and np.allclose(p[0], p[-1]):
+        p = p[:-1]
+    if len(p) > 1:
+        keep = np.any(np.abs(p - np.roll(p, 1, axis=0)) > 1e-12, axis=1)
+        keep[0] = True
+        p = p[keep]
+    return p
+
+
+def signed_area(loop):
+    """Aire signée (positive dans le sens trigonométrique)"""
+    x, y = loop[:, 0], loop[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def loop_segments(loops):
+    """Segments (a, b) de toutes les boucles"""
+    if not loops:
+        return np.empty((0, 2)), np.empty((0, 2))
+    a = np.concatenate([loop for loop in loops])
+    b = np.concatenate([np.roll(loop, -1, axis=0) for loop in loops])
+    return a, b
+
+
+def winding_numbers(points, loops):
+    """Nombre d'enroulement de chaque point (k, 2) par rapport aux boucles"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    a, b = loop_segments(loops)
+    wn = np.zeros(len(points), dtype=np.int64)
+    if len(a) == 0:
+        return wn
+    px, py = points[:, 0:1], points[:, 1:2]
+    side = (b[:, 0] - a[:, 0]) * (py - a[:, 1]) - (px - a[:, 0]) * (b[:, 1] - a[:, 1])
+    up = (a[:, 1] <= py) & (b[:, 1] > py) & (side > 0)
+    down = (a[:, 1] > py) & (b[:, 1] <= py) & (side < 0)
+    return up.sum(axis=1) - down.sum(axis=1)
+
+
+def orient_loops(loops):
+    """
+    Boucles nettoyées et orientées : sens trigonométrique pour les contours de profondeur paire
+    (extérieur, îlot dans un îlot...), horaire pour les autres
+    """
+    loops = [clean_loop(loop) for loop in loops]
+    loops = [loop for loop in loops if len(loop) >= 3]
+    oriented = []
+    for i, loop in enumerate(loops):
+        others = [other for j, other in enumerate(loops) if j != i]
+        depth = int(sum(abs(winding_numbers(loop[:1], [other])[0]) for other in others))
+        ccw = signed_area(loop) > 0
+        oriented.append(loop if ccw == (depth % 2 == 0) else loop[::-1].copy())
+    return oriented
+
+
+def _grid_keys(lo, hi, cell):
+    """Couples (élément, cellule) des boîtes lo..hi (k, 2) sur une grille de pas cell"""
+    origin = lo.min(axis=0)
+    c0 = np.floor((lo - origin) / cell).astype(np.int64)
+    c1 = np.floor((hi - origin) / cell).astype(np.int64)
+    width = c1[:, 0] - c0[:, 0] + 1
+    counts = width * (c1[:, 1] - c0[:, 1] + 1)
+    n = int(counts.sum())
+    item = np.repeat(np.arange(len(lo)), counts)
+    local = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+    w = width[item]
+    rows = int(c1[:, 1].max()) + 1
+    return item, (c0[item, 0] + local % w) * rows + c0[item, 1] + local // w, origin, rows
+
+
+def _candidate_pairs(a, b, cell):
+    """Couples (i, j), i < j, de segments dont les boîtes partagent une cellule de la grille"""
+    item, key, _, _ = _grid_keys(np.minimum(a, b), np.maximum(a, b), cell)
+    order = np.argsort(key, kind="stable")
+    item, key = item[order], key[order]
+    # dans chaque groupe de même cellule, chaque élément est couplé aux suivants du groupe
+    group_end = np.concatenate((np.flatnonzero(key[1:] != key[:-1]) + 1, [len(key)]))
+    ends = np.repeat(group_end, np.diff(np.concatenate(([0], group_end))))
+    counts = ends - np.arange(len(key)) - 1
+    first = np.repeat(np.arange(len(key)), counts)
+    second = first + 1 + np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    i, j = item[first], item[second]
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    pairs = np.unique((i * len(a) + j)[i != j])
+    return pairs // len(a), pairs % len(a)
+
+
+def _distance2(points, a, b):
+    """Carré de la distance de chaque point (k, 2) au segment (a, b) de même rang"""
+    e = b - a
+    q = points - a
+    ee = np.einsum("ij,ij->i", e, e)
+    t = np.clip(np.einsum("ij,ij->i", q, e) / np.where(ee > 0, ee, 1.0), 0.0, 1.0)
+    r = q - t[:, None] * e
+    return np.einsum("ij,ij->i", r, r)
+
+
+def _near_segments(points, a, b, radius, chunk=NEAR_CHUNK, block=NEAR_BLOCK):
+    """
+    Points (k, 2) à moins de radius d'un des segments (a, b). Les segments sont groupés par
+    paquets consécutifs dans un cercle englobant : seuls les paquets dont le cercle coupe
+    le seuil sont examinés segment par segment. Quand radius est petit devant les paquets,
+    la recherche se fait dans une grille de pas radius.
+    """
+    near = np.zeros(len(points), dtype=bool)
+    m = len(a)
+    if len(points) == 0 or m == 0:
+        return near
+    groups = -(-m // chunk)
+    pad = np.arange(groups * chunk) % m
+    ends = np.concatenate((a[pad], b[pad])).reshape(2, groups, chunk, 2)
+    center = ends.mean(axis=(0, 2))
+    spread = np.sqrt(((ends - center[None, :, None, :]) ** 2).sum(axis=3)).max(axis=(0, 2))
+    if radius < 2.0 * float(np.median(spread)):
+        return _near_segments_grid(points, a, b, radius)
+    for p0 in range(0, len(points), block):
+        pts = points[p0:p0 + block]
+        dist = np.hypot(pts[:, 0:1] - center[:, 0], pts[:, 1:2] - center[:, 1])
+        sure = (dist < radius - spread).any(axis=1)
+        pt, group = np.nonzero((dist < radius + spread) & ~sure[:, None])
+        pt = np.repeat(pt, chunk)
+        seg = pad[(np.repeat(group, chunk) * chunk + np.tile(np.arange(chunk), len(group)))]
+        sure[pt[_distance2(pts[pt], a[seg], b[seg]) < radius * radius]] = True
+        near[p0:p0 + block] = sure
+    return near
+
+
+def _near_segments_grid(points, a, b, radius):
+    """_near_segments dans une grille de pas radius : chaque point ne voit que les segments de sa cellule"""
+    near = np.zeros(len(points), dtype=bool)
+    cell = max(radius, 1e-9)
+    seg, key, origin, rows = _grid_keys(np.minimum(a, b) - radius, np.maximum(a, b) + radius, cell)
+    order = np.argsort(key, kind="stable")
+    seg, key = seg[order], key[order]
+    c = np.floor((points - origin) / cell).astype(np.int64)
+    inside = (c >= 0).all(axis=1) & (c[:, 1] < rows)
+    pkey = np.where(inside, c[:, 0] * rows + c[:, 1], -1)
+    start = np.searchsorted(key, pkey, side="left")
+    counts = np.where(inside, np.searchsorted(key, pkey, side="right") - start, 0)
+    pt = np.repeat(np.arange(len(points)), counts)
+    s = seg[np.repeat(start, counts) + np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)]
+    near[pt[_distance2(points[pt], a[s], b[s]) < radius * radius]] = True
+    return near
+
+
+def raw_offset(loop, distance, tolerance=DEFAULT_TOLERANCE):
+    """
+    Offset brut d'une boucle vers sa gauche : segments (a, b) non nettoyés.
+    Aux coins convexes, les deux arêtes décalées sont coupées à leur intersection quand
+    chacune est plus longue que le recul du coin ; sinon elles restent entières et se
+    croisent (ce qui dépasse est éliminé ensuite). Les coins rentrants sont raccordés
+    par un arc horaire de rayon distance autour du sommet.
+    """
+    d = float(distance)
+    p = loop
+    corner = np.roll(p, -1, axis=0)
+    e = corner - p
+    length = np.linalg.norm(e, axis=1)
+    u = e / length[:, None]
+    n = np.column_stack((-u[:, 1], u[:, 0]))
+    s = p + d * n
+    t = corner + d * n
+    # coin au sommet i + 1, entre l'arête i et l'arête i + 1 : rentrant s'il tourne à droite
+    un = np.roll(u, -1, axis=0)
+    cross = u[:, 0] * un[:, 1] - u[:, 1] * un[:, 0]
+    dot = np.einsum("ij,ij->i", u, un)
+    turn = np.arctan2(cross, dot)
+    reflex = cross < 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        setback = d * np.tan(0.5 * turn)
+        miter = corner + d * (n + np.roll(n, -1, axis=0)) / (1.0 + dot)[:, None]
+    clip = ~reflex & (dot > -1.0) & (length >= setback) & (np.roll(length, -1) >= setback)
+    t[clip] = miter[clip]
+    s[np.roll(clip, 1)] = np.roll(miter, 1, axis=0)[np.roll(clip, 1)]
+    # arête coupée aux deux bouts et retournée : entièrement trop proche de ses voisines
+    edge_ok = np.einsum("ij,ij->i", t - s, u) > 0
+
+    sweep = np.where(reflex, turn, 0.0)
+    step = 2.0 * math.acos(max(1.0 - tolerance / (4.0 * d), -1.0))
+    arcs = np.maximum(np.ceil(np.abs(sweep) / step).astype(np.int64) - 1, 0)
+    k = np.repeat(np.arange(len(p)), arcs)
+    local = np.arange(int(arcs.sum())) - np.repeat(np.cumsum(arcs) - arcs, arcs) + 1
+    angle = np.arctan2(n[k, 1], n[k, 0]) + sweep[k] * local / (arcs[k] + 1)
+    arc_points = corner[k] + d * np.column_stack((np.cos(angle), np.sin(angle)))
+
+    # chaîne : début et fin de l'arête i décalée, points de l'arc au sommet i + 1, arête i + 1...
+    size = 2 + arcs
+    offsets = np.cumsum(size) - size
+    chain = np.empty((int(size.sum()), 2))
+    chain[offsets] = s
+    chain[offsets + 1] = t
+    chain[offsets[k] + 1 + local] = arc_points
+    a, b = chain, np.roll(chain, -1, axis=0)
+    keep = np.ones(len(chain), dtype=bool)
+    keep[offsets[~edge_ok]] = False
+    # pas de liaison aux coins convexes : arêtes jointes au coin, ou qui s'y croisent
+    keep[offsets[~reflex] + 1] = False
+    keep &= np.any(np.abs(b - a) > 1e-12, axis=1)
+    return a[keep], b[keep]
+
+
+def _split(a, b, tolerance):
+    """Coupe les segments à leurs intersections : morceaux (a, b)"""
+    m = len(a)
+    lengths = np.linalg.norm(b - a, axis=1)
+    i, j = _candidate_pairs(a, b, max(float(np.median(lengths)), tolerance))
+    r, s = b[i] - a[i], b[j] - a[j]
+    q = a[j] - a[i]
+    den = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+    ok = np.abs(den) > 1e-12 * lengths[i] * lengths[j]
+    den = np.where(ok, den, 1.0)
+    ti = (q[:, 0] * s[:, 1] - q[:, 1] * s[:, 0]) / den
+    tj = (q[:, 0] * r[:, 1] - q[:, 1] * r[:, 0]) / den
+    eps = 1e-9
+    # les contacts aux extrémités sont gardés : ils donnent le même point aux deux segments
+    ok &= (ti >= -eps) & (ti <= 1 + eps) & (tj >= -eps) & (tj <= 1 + eps)
+    i, j, ti, tj = i[ok], j[ok], np.clip(ti[ok], 0, 1), np.clip(tj[ok], 0, 1)
+    x = a[i] + ti[:, None] * r[ok]
+
+    seg = np.concatenate((np.arange(m), np.arange(m), i, j))
+    par = np.concatenate((np.zeros(m), np.ones(m), ti, tj))
+    pts = np.concatenate((a, b, x, x))
+    order = np.lexsort((par, seg))
+    seg, pts = seg[order], pts[order]
+    same = seg[1:] == seg[:-1]
+    pa, pb = pts[:-1][same], pts[1:][same]
+    keep = np.any(np.abs(pb - pa) > tolerance * SNAP_FACTOR, axis=1)
+    return pa[keep], pb[keep]
+
+
+def _stitch(a, b, tolerance):
+    """
+    Recoud les morceaux orientés en boucles fermées. Une chaîne qui revient sur un de ses
+    noeuds est fermée à partir de ce noeud (l'amorce est abandonnée, comme les chaînes ouvertes :
+    bouts de segments qui dépassent d'une intersection d'à peine la tolérance).
+    """
+    snap = tolerance * SNAP_FACTOR
+    keys = np.round(np.concatenate((a, b)) / snap).astype(np.int64)
+    _, node = np.unique(keys, axis=0, return_inverse=True)
+    node = node.reshape(-1)
+    start, end = node[:len(a)].tolist(), node[len(a):].tolist()
+    outs = {}
+    for piece, n in enumerate(start):
+        outs.setdefault(n, []).append(piece)
+    direction = b - a
+    used = np.zeros(len(a), dtype=bool)
+    loops = []
+    for first in range(len(a)):
+        if used[first]:
+            continue
+        chain = [first]
+        used[first] = True
+        # noeud de départ de chaque morceau de la chaîne -> position
+        position = {start[first]: 0}
+        while True:
+            last = chain[-1]
+            if end[last] in position:
+                loop = chain[position[end[last]]:]
+                if len(loop) >= 3:
+                    loops.append(a[loop])
+                break
+            candidates = [c for c in outs.get(end[last], ()) if not used[c]]
+            if not candidates:
+                break
+            if len(candidates) > 1:
+                # plusieurs suites : la plus à gauche borde la zone à distance >= d
+                d0 = direction[last]
+                turn = [math.atan2(d0[0] * direction[c][1] - d0[1] * direction[c][0],
+                                   float(np.dot(d0, direction[c]))) for c in candidates]
+                candidates = [candidates[int(np.argmax(turn))]]
+            used[candidates[0]] = True
+            position[end[last]] = len(chain)
+            chain.append(candidates[0])
+    return loops
+
+
+def offset_loops(loops, distance, tolerance=DEFAULT_TOLERANCE, segments=None):
+    """
+    Boucles à la distance distance (> 0) à l'intérieur des contours orientés loops.
+    segments : segments (a, b) des contours, si déjà calculés.
+    """
+    if not loops or distance <= 0:
+        return [clean_loop(loop) for loop in loops]
+    raw = [raw_offset(loop, distance, tolerance) for loop in loops]
+    a = np.concatenate([r[0] for r in raw])
+    b = np.concatenate([r[1] for r in raw])
+    if len(a) == 0:
+        return []
+    a, b = _split(a, b, tolerance)
+    if segments is None:
+        segments = loop_segments(loops)
+    # les cordes des arcs de raccord sont à moins de tolerance / 4 de l'offset exact
+    far = ~_near_segments(0.5 * (a + b), segments[0], segments[1], distance - 0.5 * tolerance)
+    result = []
+    for loop in _stitch(a[far], b[far], tolerance):
+        loop = clean_loop(loop)
+        if len(loop) >= 3 and abs(signed_area(loop)) > tolerance * tolerance \
+                and winding_numbers(loop[:1], loops)[0] != 0:
+            result.append(loop)
+    return result
+
+
+def offset_rings(loops, step, first=None, tolerance=DEFAULT_TOLERANCE, max_rings=None):
+    """
+    Toutes les passes intérieures : rings[k] est la liste des boucles à la distance first + k * step
+    des contours (first vaut step par défaut). S'arrête à la première distance sans boucle.
+    """
+    if step <= 0:
+        raise ValueError("le pas d'offset doit être positif")
+    first = step if first is None else first
+    segments = loop_segments(loops)
+    rings = []
+    while max_rings is None or len(rings) < max_rings:
+        level = offset_loops(loops, first + len(rings) * step, tolerance, segments)
+        if not level:
+            break
+        rings.append(level)
+    return rings
+
+
+def nest_rings(rings):
+    """
+    parents[k][i] : indice de la boucle de rings[k - 1] qui contient rings[k][i] (la plus petite
+    s'il y en a plusieurs, -1 si aucune) ; parents[0] ne contient que des -1.
+    """
+    parents = [[-1] * len(rings[0])] if rings else []
+    for k in range(1, len(rings)):
+        level = []
+        areas = [abs(signed_area(loop)) for loop in rings[k - 1]]
+        for loop in rings[k]:
+            containers = [i for i, outer in enumerate(rings[k - 1])
+                          if winding_numbers(loop[:1], [outer])[0] != 0]
+            level.append(min(containers, key=lambda i: areas[i]) if containers else -1)
+        parents.append(level)
+    return parents
@@ -0,0 +1,115 @@
+"""
+Passes d'évidement d'un contour, mémorisées et calculées en parallèle.
+
+Chaque passe est calculée directement depuis le contour (Pocket.Offset) :
+elle ne dépend que du contour, de sa distance et de la tolérance. Les
+passes sont donc mises en cache (LRU du processus) sous la clé
+(empreinte du contour, distance, tolérance) : changer le nombre de
+générations, le point de départ ou le mode de remplissage retrouve les
+passes déjà calculées, et un contour lié ou rouvert aussi. Les passes
+manquantes sont indépendantes : elles sont calculées par vagues dans un
+pool de processus, jusqu'à la première passe vide. Le pool n'est utilisé que
+sur demande (workers) ; depuis FreeCAD il doit être lancé par spawn
+(mp_context), _offset_level n'important pas FreeCAD.
+
+  rings = pocket_rings(loops, step, first, max_rings=maxGen, workers=0)
+  parents = nest_rings(rings)
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Backplot.Cache import BackplotCache
+from Pocket.Offset import DEFAULT_TOLERANCE, loop_segments, offset_loops
+
+DEFAULT_RING_CACHE_SIZE = 64  # Mo
+# en dessous de ce nombre de segments du contour, une passe coûte moins que l'envoi à un processus
+PARALLEL_MIN_SEGMENTS = 2000
+
+
+class CachedRings:
+    """Boucles d'une passe (lecture seule)"""
+    def __init__(self, loops):
+        self.loops = [np.array(loop) for loop in loops]
+        for loop in self.loops:
+            loop.flags.writeable = False
+
+    @property
+    def nbytes(self):
+        return sum(loop.nbytes for loop in self.loops) + 64
+
+
+def contour_key(loops):
+    """Empreinte géométrique des boucles orientées du contour"""
+    digest = hashlib.sha1()
+    for loop in loops:
+        digest.update(np.ascontiguousarray(loop, dtype=np.float64).tobytes())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+
+def _offset_level(loops, distance, tolerance):
+    """Une passe ; fonction de module pour le pool de processus"""
+    return offset_loops(loops, distance, tolerance)
+
+
+def pocket_rings(loops, step, first=None, tolerance=DEFAULT_TOLERANCE, max_rings=None, workers=0, cache=None,
+                 mp_context=None):
+    """
+    Comme Pocket.Offset.offset_rings : rings[k] est la liste des boucles à first + k * step des
+    contours orientés loops. Les passes déjà calculées sont reprises du cache.
+    workers : nombre de processus (None : un par coeur, 0 : dans le processus appelant) ; le pool
+    n'est utilisé que pour les contours d'au moins PARALLEL_MIN_SEGMENTS segments, avec le contexte
+    multiprocessing mp_context (None : celui par défaut de la plateforme).
+    """
+    if step <= 0:
+        raise ValueError("le pas d'offset doit être positif")
+    if cache is None:
+        cache = ring_cache
+    first = step if first is None else first
+    key = contour_key(loops)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if len(loop_segments(loops)[0]) < PARALLEL_MIN_SEGMENTS:
+        workers = 0
+
+    def level_key(k):
+        return key, float(first + k * step), float(tolerance)
+
+    rings = []
+    pool = None
+    try:
+        while max_rings is None or len(rings) < max_rings:
+            k = len(rings)
+            entry = cache.get(level_key(k))
+            if entry is None:
+                # vague de passes manquantes consécutives, une par processus
+                wave = [k]
+                while workers > 1 and len(wave) < workers \
+                        and (max_rings is None or k + len(wave) < max_rings) \
+                        and cache.get(level_key(k + len(wave))) is None:
+                    wave.append(k + len(wave))
+                distances = [first + i * step for i in wave]
+                if len(wave) == 1:
+                    results = [_offset_level(loops, distances[0], tolerance)]
+                else:
+                    if pool is None:
+                        pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+                    results = pool.map(_offset_level, [loops] * len(wave), distances, [tolerance] * len(wave))
+                entries = [CachedRings(level) for level in results]
+                for i, e in zip(wave, entries):
+                    cache.put(level_key(i), e)
+                entry = entries[0]
+            if not entry.loops:
+                break
+            rings.append(entry.loops)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return rings
+
+
+# passes des contours de poche, partagées par toutes les opérations du processus
+ring_cache = BackplotCache(DEFAULT_RING_CACHE_SIZE << 20)
@@ -0,0 +1,90 @@
+"""
+Balayage en lignes parallèles (zigzag) d'une zone de poche.
+
+Le contour est discrétisé une fois (boucles orientées, îlots compris) ;
+toutes les lignes du balayage sont coupées par tous les segments du contour
+en une passe NumPy : chaque segment donne directement les lignes qu'il
+traverse. Les abscisses triées par ligne donnent les intervalles dans la
+matière (règle pair-impair : un îlot ouvre un trou dans l'intervalle).
+
+Le balayage se fait à un angle quelconque : le contour est tourné de -angle,
+balayé en lignes horizontales, et les segments produits sont tournés de
++angle.
+
+  y, row, x0, x1 = scanline_spans(loops, spacing, angle)
+  p0, p1 = zigzag_segments(y, row, x0, x1, angle)     # ordre d'usinage, sens alterné
+"""
+import math
+
+import numpy as np
+
+from Pocket.Offset import loop_segments
+
+
+def _rotation(angle):
+    c, s = math.cos(angle), math.sin(angle)
+    return np.array([[c, -s], [s, c]])
+
+
+def scanline_spans(loops, spacing, angle=0.0):
+    """
+    Intervalles dans la matière des lignes du balayage, dans le repère tourné de -angle (radians).
+    Les lignes sont régulièrement réparties dans la hauteur de la zone, à spacing au plus l'une
+    de l'autre et à une demi-distance des bords. Renvoie y (lignes) et, par intervalle, la ligne
+    row et les abscisses x0 < x1, triés par ligne puis par abscisse.
+    """
+    if spacing <= 0:
+        raise ValueError("l'espacement des lignes doit être positif")
+    a, b = loop_segments(loops)
+    empty = np.empty(0)
+    if len(a) == 0:
+        return empty, np.empty(0, dtype=np.int64), empty, empty
+    turn = _rotation(-angle).T
+    a, b = a @ turn, b @ turn
+    ymin = min(a[:, 1].min(), b[:, 1].min())
+    ymax = max(a[:, 1].max(), b[:, 1].max())
+    count = max(int(math.ceil((ymax - ymin) / spacing)), 1)
+    pitch = (ymax - ymin) / count
+    y = ymin + (np.arange(count) + 0.5) * pitch
+
+    # lignes traversées par chaque segment : ylo <= y < yhi (un sommet n'est compté qu'une fois)
+    ylo = np.minimum(a[:, 1], b[:, 1])
+    yhi = np.maximum(a[:, 1], b[:, 1])
+    k0 = np.ceil((ylo - y[0]) / pitch).astype(np.int64)
+    k1 = np.ceil((yhi - y[0]) / pitch).astype(np.int64) - 1
+    k0 = np.maximum(k0, 0)
+    k1 = np.minimum(k1, count - 1)
+    counts = np.maximum(k1 - k0 + 1, 0)
+    seg = np.repeat(np.arange(len(a)), counts)
+    row = k0[seg] + np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    # arrondi du ceil : la ligne doit vraiment être dans [ylo, yhi[
+    keep = (y[row] >= ylo[seg]) & (y[row] < yhi[seg])
+    seg, row = seg[keep], row[keep]
+    sa, sb = a[seg], b[seg]
+    x = sa[:, 0] + (y[row] - sa[:, 1]) * (sb[:, 0] - sa[:, 0]) / (sb[:, 1] - sa[:, 1])
+
+    order = np.lexsort((x, row))
+    row, x = row[order], x[order]
+    # règle pair-impair : les intersections d'une ligne vont par paires entrée / sortie
+    rank = np.arange(len(row)) - np.searchsorted(row, row, side="left")
+    start = (rank % 2 == 0) & (np.arange(len(row)) + 1 < len(row))
+    start &= np.concatenate((row[1:] == row[:-1], [False]))
+    x0, x1 = x[start], x[np.flatnonzero(start) + 1]
+    row = row[start]
+    wide = x1 > x0
+    return y, row[wide], x0[wide], x1[wide]
+
+
+def zigzag_segments(y, row, x0, x1, angle=0.0):
+    """
+    Segments (p0, p1) (k, 2) des intervalles dans l'ordre d'usinage, dans le repère d'origine :
+    lignes successives parcourues alternativement dans un sens puis dans l'autre.
+    """
+    forward = row % 2 == 0
+    # sur une ligne parcourue à rebours, les intervalles sont pris de droite à gauche
+    order = np.lexsort((np.where(forward, x0, -x0), row))
+    row, x0, x1, forward = row[order], x0[order], x1[order], forward[order]
+    start = np.column_stack((np.where(forward, x0, x1), y[row]))
+    end = np.column_stack((np.where(forward, x1, x0), y[row]))
+    turn = _rotation(angle).T
+    return start @ turn, end @ turn
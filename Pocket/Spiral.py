@@ -0,0 +1,79 @@
+"""
+Spirale continue à travers les passes d'offset d'une poche.
+
+Les passes successives (une boucle par passe, de l'extérieur vers
+l'intérieur) sont rééchantillonnées au même nombre de points, également
+répartis en abscisse curviligne ; chaque passe démarre au point le plus
+proche du départ de la précédente. Un tour de spirale passe d'une boucle à
+la suivante en mélangeant linéairement les points de même rang :
+
+  P(i) = (1 - i / n) * A(i) + i / n * B(i)
+
+Tout se fait en NumPy, en temps linéaire en nombre de points, et donne une
+seule polyligne : tour complet de la première passe, spirale, tour complet
+de la dernière.
+
+  points = spiral_path([outer_ring, ..., inner_ring], resolution)
+"""
+import math
+
+import numpy as np
+
+from Pocket.Offset import signed_area
+
+# nombre minimal de points par tour
+MIN_SAMPLES = 8
+
+
+def _arc_lengths(loop):
+    """Boucle refermée (n + 1, 2) et abscisses curvilignes de ses sommets"""
+    closed = np.vstack((loop, loop[:1]))
+    lengths = np.hypot(*np.diff(closed, axis=0).T)
+    return closed, np.concatenate(([0.0], np.cumsum(lengths)))
+
+
+def loop_start(loop, point):
+    """Boucle commençant au point de son contour le plus proche de point"""
+    a = loop
+    b = np.roll(loop, -1, axis=0)
+    ab = b - a
+    length2 = np.einsum("ij,ij->i", ab, ab)
+    t = np.clip(np.einsum("ij,ij->i", point - a, ab) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+    q = a + t[:, None] * ab
+    i = int(np.argmin(np.einsum("ij,ij->i", q - point, q - point)))
+    return np.vstack((q[i:i + 1], np.roll(loop, -(i + 1), axis=0)))
+
+
+def resample_loop(loop, count):
+    """count points de la boucle fermée, également espacés en abscisse curviligne depuis son premier point"""
+    closed, s = _arc_lengths(loop)
+    t = np.arange(count) * (s[-1] / count)
+    return np.column_stack((np.interp(t, s, closed[:, 0]), np.interp(t, s, closed[:, 1])))
+
+
+def spiral_path(rings, resolution):
+    """
+    Polyligne (m, 2) de la spirale passant par les boucles rings, emboîtées de l'extérieur vers
+    l'intérieur. Chaque tour compte autant de points que la plus longue boucle découpée à
+    resolution ; les boucles sont remises dans le sens de la première.
+    """
+    if resolution <= 0:
+        raise ValueError("la résolution de la spirale doit être positive")
+    if not rings:
+        return np.empty((0, 2))
+    rings = [np.asarray(loop, dtype=np.float64) for loop in rings]
+    perimeter = max(_arc_lengths(loop)[1][-1] for loop in rings)
+    count = max(int(math.ceil(perimeter / resolution)), MIN_SAMPLES)
+    ccw = signed_area(rings[0]) > 0
+
+    sampled = np.empty((len(rings), count, 2))
+    start = rings[0][0]
+    for k, loop in enumerate(rings):
+        if (signed_area(loop) > 0) != ccw:
+            loop = loop[::-1]
+        sampled[k] = resample_loop(loop_start(loop, start), count)
+        start = sampled[k, 0]
+
+    t = (np.arange(count) / count)[None, :, None]
+    turns = (1 - t) * sampled[:-1] + t * sampled[1:]
+    return np.concatenate((sampled[0], turns.reshape(-1, 2), sampled[-1], sampled[-1, :1]))
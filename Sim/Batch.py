@@ -0,0 +1,131 @@
+"""
+Simulation d'un programme complet, sans animation.
+
+Le brut est découpé en tuiles de tile_cells x tile_cells cellules ; chaque
+segment est rangé dans les tuiles que recouvre sa boîte englobante (élargie
+du rayon de l'outil) puis chaque tuile est balayée indépendamment, dans un
+pool de processus. Enlever de la matière étant un minimum, l'ordre des
+segments et des tuiles est indifférent : les tuiles sont recopiées dans le
+brut au fur et à mesure qu'elles reviennent.
+
+Le pool n'est utilisé que sur demande (workers > 1). Depuis FreeCAD, les
+processus doivent être lancés par spawn (mp_context) : un fork copierait le
+processus graphique multithread et ses verrous. _sweep_tile et les modules
+qu'il utilise n'importent pas FreeCAD.
+
+  done = simulate(heightmap, p0, p1, radius, profile,
+                  progress=lambda n, total: ..., cancelled=lambda: ...)
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+# côté d'une tuile en cellules
+TILE_CELLS = 128
+# intervalle (s) d'appel de progress / cancelled pendant l'attente des tuiles
+POLL_INTERVAL = 0.1
+
+
+def tile_ranges(heightmap, tile_cells=TILE_CELLS):
+    """Nombre de tuiles (tx, ty) du brut"""
+    return -(-heightmap.nx // tile_cells), -(-heightmap.ny // tile_cells)
+
+
+def bucket_segments(heightmap, p0, p1, radius, tile_cells=TILE_CELLS):
+    """
+    Segments de chaque tuile, en table CSR : les segments de la tuile t = ty * tx + ix
+    sont order[offsets[t]:offsets[t + 1]], dans l'ordre du programme.
+    """
+    hm = heightmap
+    tx, ty = tile_ranges(hm, tile_cells)
+    lo = (np.minimum(p0[:, :2], p1[:, :2]) - radius - (hm.x0, hm.y0)) / hm.cell
+    hi = (np.maximum(p0[:, :2], p1[:, :2]) + radius - (hm.x0, hm.y0)) / hm.cell
+    # cellules couvertes (mêmes arrondis que Heightmap.window), puis tuiles correspondantes
+    ci0 = np.maximum(np.ceil(lo[:, 0]), 0)
+    ci1 = np.minimum(np.floor(hi[:, 0]), hm.nx - 1)
+    cj0 = np.maximum(np.ceil(lo[:, 1]), 0)
+    cj1 = np.minimum(np.floor(hi[:, 1]), hm.ny - 1)
+    valid = (ci0 <= ci1) & (cj0 <= cj1)
+    ti0 = (ci0 // tile_cells).astype(np.int64)
+    ti1 = (ci1 // tile_cells).astype(np.int64)
+    tj0 = (cj0 // tile_cells).astype(np.int64)
+    tj1 = (cj1 // tile_cells).astype(np.int64)
+    width = np.where(valid, ti1 - ti0 + 1, 0)
+    counts = width * np.where(valid, tj1 - tj0 + 1, 0)
+
+    n = int(counts.sum())
+    seg = np.repeat(np.arange(len(p0)), counts)
+    local = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+    w = width[seg]
+    tiles = (tj0[seg] + local // w) * tx + ti0[seg] + local % w
+    order = seg[np.argsort(tiles, kind="stable")]
+    offsets = np.zeros(tx * ty + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tiles, minlength=tx * ty), out=offsets[1:])
+    return order, offsets
+
+
+def _sweep_tile(tile, p0, p1, radius, profile):
+    """Balaye une tuile (Heightmap) ; fonction de module pour le pool de processus"""
+    tile.sweep(p0, p1, radius, profile)
+    return tile.z
+
+
+def simulate(heightmap, p0, p1, radius, profile=None, workers=0, tile_cells=TILE_CELLS,
+             progress=None, cancelled=None, mp_context=None):
+    """
+    Enlève du brut le volume balayé par tous les segments p0 -> p1 (k, 3).
+    workers : nombre de processus (None : un par coeur, 0 : dans le processus appelant) ;
+    mp_context : contexte multiprocessing du pool (None : celui par défaut de la plateforme).
+    progress(n, total) est appelé quand des tuiles sont terminées, cancelled() régulièrement :
+    s'il renvoie vrai, les tuiles restantes sont abandonnées (le brut garde les tuiles finies).
+    Renvoie False si la simulation a été interrompue.
+    """
+    hm = heightmap
+    p0 = np.atleast_2d(np.asarray(p0, dtype=np.float64))
+    p1 = np.atleast_2d(np.asarray(p1, dtype=np.float64))
+    r = float(radius) if profile is None else profile.radius
+    order, offsets = bucket_segments(hm, p0, p1, r, tile_cells)
+    tx, ty = tile_ranges(hm, tile_cells)
+
+    jobs = []
+    for t in np.flatnonzero(np.diff(offsets)):
+        j, i = divmod(int(t), tx)
+        i0, j0 = i * tile_cells, j * tile_cells
+        window = (i0, min(i0 + tile_cells, hm.nx), j0, min(j0 + tile_cells, hm.ny))
+        ids = order[offsets[t]:offsets[t + 1]]
+        jobs.append((window, hm.tile(*window), p0[ids], p1[ids]))
+    total = len(jobs)
+    if progress is not None:
+        progress(0, total)
+
+    def compose(window, z):
+        i0, i1, j0, j1 = window
+        hm.z[j0:j1, i0:i1] = z
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or total <= 1:
+        for n, (window, tile, a, b) in enumerate(jobs):
+            if cancelled is not None and cancelled():
+                return False
+            compose(window, _sweep_tile(tile, a, b, r, profile))
+            if progress is not None:
+                progress(n + 1, total)
+        return True
+
+    with ProcessPoolExecutor(max_workers=min(workers, total), mp_context=mp_context) as pool:
+        pending = {pool.submit(_sweep_tile, tile, a, b, r, profile): window for window, tile, a, b in jobs}
+        done_count = 0
+        while pending:
+            if cancelled is not None and cancelled():
+                for future in pending:
+                    future.cancel()
+                return False
+            done, _ = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                compose(pending.pop(future), future.result())
+            done_count += len(done)
+            if done and progress is not None:
+                progress(done_count, total)
+    return True
@@ -0,0 +1,102 @@
+"""
+Simulation d'un projet : les opérations sont enchaînées sur le même brut.
+
+Le brut obtenu après chaque opération est mis en cache (LRU du processus,
+hauteurs compressées). Sa clé enchaîne celle du brut d'entrée et
+l'empreinte du programme de l'opération (G-code, outil) : modifier la 7e
+opération change les clés à partir de la 7e, et la simulation repart du
+brut mis en cache après la 6e.
+
+  steps = [ChainStep(label, program_key, p0, p1, profile), ...]   # ordre de post-traitement
+  done = simulate_chain(heightmap, steps, progress=..., cancelled=...)
+"""
+import hashlib
+import zlib
+
+import numpy as np
+
+from Backplot.Cache import BackplotCache
+from Sim.Batch import simulate
+
+DEFAULT_CHAIN_SIZE = 256  # Mo
+# niveau zlib : la vitesse de compression prime, les hauteurs se compressent déjà bien
+COMPRESSION_LEVEL = 1
+
+
+class ChainStep:
+    """
+    Une opération de la chaîne : program_key identifie ce qu'elle enlève (empreinte du
+    G-code et des réglages de discrétisation, paramètres de l'outil) ; p0 -> p1 ses segments.
+    """
+    def __init__(self, label, program_key, p0, p1, profile):
+        self.label = label
+        self.program_key = program_key
+        self.p0 = p0
+        self.p1 = p1
+        self.profile = profile
+
+
+class CachedStock:
+    """Hauteurs du brut compressées"""
+    def __init__(self, heightmap):
+        self.shape = heightmap.z.shape
+        self.data = zlib.compress(np.ascontiguousarray(heightmap.z).tobytes(), COMPRESSION_LEVEL)
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def restore(self, heightmap):
+        heightmap.z[...] = np.frombuffer(zlib.decompress(self.data), dtype=np.float32).reshape(self.shape)
+
+
+def program_key(gcode_text, *settings):
+    """Empreinte du programme d'une opération et des réglages qui changent les segments ou l'outil"""
+    digest = hashlib.sha1(gcode_text.encode("utf-8", "surrogatepass"))
+    digest.update(repr(settings).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def chain_keys(heightmap, steps):
+    """Clé du brut après chaque étape : empreinte du brut initial puis des programmes successifs"""
+    hm = heightmap
+    key = hashlib.sha1(repr((hm.xmin, hm.ymin, hm.nx, hm.ny, hm.cell, hm.zmin, hm.zmax)).encode("utf-8")).hexdigest()
+    keys = []
+    for step in steps:
+        key = hashlib.sha1((key + step.program_key).encode("utf-8")).hexdigest()
+        keys.append(key)
+    return keys
+
+
+def simulate_chain(heightmap, steps, cache=None, workers=0, progress=None, cancelled=None, mp_context=None):
+    """
+    Amène le brut (initial) à l'état après toutes les étapes. Seules les étapes qui suivent
+    le dernier brut en cache sont simulées. progress(n, total) après chaque étape ;
+    renvoie le nombre d'étapes simulées, ou None si cancelled() a interrompu la chaîne.
+    """
+    if cache is None:
+        cache = stock_cache
+    keys = chain_keys(heightmap, steps)
+    start = 0
+    for i in range(len(steps) - 1, -1, -1):
+        entry = cache.get(keys[i])
+        if entry is not None:
+            entry.restore(heightmap)
+            start = i + 1
+            break
+    if progress is not None:
+        progress(start, len(steps))
+
+    for i in range(start, len(steps)):
+        step = steps[i]
+        if not simulate(heightmap, step.p0, step.p1, step.profile.radius, step.profile,
+                        workers=workers, cancelled=cancelled, mp_context=mp_context):
+            return None
+        cache.put(keys[i], CachedStock(heightmap))
+        if progress is not None:
+            progress(i + 1, len(steps))
+    return len(steps) - start
+
+
+# brut après chaque opération, partagé par tous les projets du processus
+stock_cache = BackplotCache(DEFAULT_CHAIN_SIZE << 20)
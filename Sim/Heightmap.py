@@ -0,0 +1,307 @@
+"""
+Brut de simulation en Z-dexels.
+
+Le brut est une grille XY régulière ; chaque cellule garde la hauteur de
+matière restante à son centre (float32). Enlever de la matière revient à
+prendre, sur les cellules couvertes par l'outil, le minimum entre la
+hauteur courante et le bas de l'outil : le coût d'une coupe ne dépend que
+du nombre de cellules couvertes, pas des coupes précédentes (contrairement
+à une soustraction booléenne de BRep).
+
+  stock = Heightmap.from_bound_box(stock_obj.Shape.BoundBox, cell=0.5)
+  stock.stamp(x, y, z, radius)                 # fraise plate, bout en z
+  stock.sweep(p0, p1, radius)                  # volume balayé le long de segments (k, 3)
+  stock.sweep(p0, p1, radius, profile)         # outil quelconque (Sim.ToolProfile)
+  hit = stock.collisions(p0, p1, radius)       # segments qui rencontrent de la matière
+  triangles = heightmap_triangles(stock)       # (k, 3, 3) pour Mesh.Mesh
+"""
+import math
+
+import numpy as np
+
+# au-delà, la taille de cellule est augmentée (16 Mo de hauteurs float32)
+MAX_CELLS = 1 << 22
+# couples (segment, cellule) évalués par bloc lors d'un balayage
+SWEEP_CHUNK = 1 << 21
+# descente maximale d'un morceau de segment plongeant balayé avec un profil non plat (en cellules)
+PROFILE_STEP = 0.5
+
+
+class Heightmap:
+    """
+    Hauteur de matière au centre de chaque cellule : z[j, i] pour la cellule
+    de centre (x0 + i * cell, y0 + j * cell).
+    """
+    def __init__(self, xmin, ymin, xmax, ymax, zmin, zmax, cell=0.5, max_cells=MAX_CELLS):
+        width = max(xmax - xmin, 1e-6)
+        depth = max(ymax - ymin, 1e-6)
+        cell = float(cell)
+        if math.ceil(width / cell) * math.ceil(depth / cell) > max_cells:
+            cell = math.sqrt(width * depth / max_cells) * 1.01
+        self.cell = cell
+        self.nx = max(int(math.ceil(width / cell)), 1)
+        self.ny = max(int(math.ceil(depth / cell)), 1)
+        self.xmin, self.ymin = float(xmin), float(ymin)
+        self.x0 = self.xmin + cell / 2.0
+        self.y0 = self.ymin + cell / 2.0
+        self.zmin, self.zmax = float(zmin), float(zmax)
+        self.z = np.full((self.ny, self.nx), self.zmax, dtype=np.float32)
+
+    @classmethod
+    def from_bound_box(cls, bound_box, cell=0.5, max_cells=MAX_CELLS):
+        """Brut parallélépipédique à partir d'une BoundBox FreeCAD (XMin, XMax, ...)"""
+        return cls(bound_box.XMin, bound_box.YMin, bound_box.XMax, bound_box.YMax,
+                   bound_box.ZMin, bound_box.ZMax, cell, max_cells)
+
+    @property
+    def xs(self):
+        return self.x0 + self.cell * np.arange(self.nx)
+
+    @property
+    def ys(self):
+        return self.y0 + self.cell * np.arange(self.ny)
+
+    def copy(self):
+        other = Heightmap.__new__(Heightmap)
+        other.__dict__.update(self.__dict__)
+        other.z = self.z.copy()
+        return other
+
+    def tile(self, i0, i1, j0, j1):
+        """Brut indépendant formé des cellules [i0, i1) x [j0, j1), alignées sur celles-ci"""
+        other = Heightmap.__new__(Heightmap)
+        other.__dict__.update(self.__dict__)
+        other.nx, other.ny = i1 - i0, j1 - j0
+        other.xmin = self.xmin + i0 * self.cell
+        other.ymin = self.ymin + j0 * self.cell
+        other.x0 = self.x0 + i0 * self.cell
+        other.y0 = self.y0 + j0 * self.cell
+        other.z = self.z[j0:j1, i0:i1].copy()
+        return other
+
+    def window(self, xlo, ylo, xhi, yhi):
+        """Plage d'indices (i0, i1, j0, j1) des cellules dont le centre est dans [xlo, xhi] x [ylo, yhi]"""
+        i0 = max(int(math.ceil((xlo - self.x0) / self.cell)), 0)
+        i1 = min(int(math.floor((xhi - self.x0) / self.cell)) + 1, self.nx)
+        j0 = max(int(math.ceil((ylo - self.y0) / self.cell)), 0)
+        j1 = min(int(math.floor((yhi - self.y0) / self.cell)) + 1, self.ny)
+        return i0, i1, j0, j1
+
+    def stamp(self, x, y, z, radius, profile=None):
+        """
+        Enlève la matière d'un outil de rayon radius dont le bout est en (x, y, z) :
+        fraise plate, ou profil (Sim.ToolProfile) dont le rayon remplace radius.
+        """
+        if profile is not None:
+            radius = profile.radius
+        if z >= self.zmax:
+            return
+        i0, i1, j0, j1 = self.window(x - radius, y - radius, x + radius, y + radius)
+        if i0 >= i1 or j0 >= j1:
+            return
+        dx = self.x0 + self.cell * np.arange(i0, i1) - x
+        dy = self.y0 + self.cell * np.arange(j0, j1) - y
+        rho2 = dy[:, None] ** 2 + dx[None, :] ** 2
+        zone = self.z[j0:j1, i0:i1]
+        if profile is None or profile.is_flat:
+            bottom = np.where(rho2 <= radius * radius, np.float32(max(z, self.zmin)), np.float32(np.inf))
+        else:
+            bottom = np.maximum(z + profile.height(np.sqrt(rho2)), self.zmin).astype(np.float32)
+        np.minimum(zone, bottom, out=zone)
+
+    def sweep(self, p0, p1, radius, profile=None):
+        """
+        Enlève la matière balayée par une fraise plate de rayon radius dont le bout
+        parcourt les segments p0 -> p1 (tableaux (k, 3) ou points seuls).
+        Pour chaque cellule couverte, le paramètre t des positions de l'outil qui la
+        recouvrent forme un intervalle [ta, tb] (disque de rayon radius autour de la
+        cellule coupé par le segment en XY) ; le bout de l'outil variant linéairement
+        en z, la hauteur la plus basse est atteinte en ta ou tb. Le résultat ne dépend
+        pas du découpage des segments.
+
+        Avec un profil non plat (Sim.ToolProfile, dont le rayon remplace radius), chaque
+        cellule est abaissée à z + h(rho) au point du segment le plus proche en XY :
+        exact pour un segment horizontal ; un segment plongeant est d'abord découpé en
+        morceaux descendant d'au plus PROFILE_STEP cellule, ce qui borne l'erreur.
+        """
+        flat = self.z.reshape(-1)
+        for _, idx, z in self._swept_cells(p0, p1, radius, profile):
+            np.minimum.at(flat, idx, z)
+
+    def collisions(self, p0, p1, radius, profile=None, tolerance=1e-3):
+        """
+        Segments p0 -> p1 (k, 3) le long desquels l'outil rencontre de la matière : une
+        cellule couverte est plus haute que le bas de l'outil de plus de tolerance.
+        Renvoie un tableau de booléens (k,) ; le brut n'est pas modifié.
+        """
+        p0 = np.atleast_2d(np.asarray(p0, dtype=np.float64))
+        hit = np.zeros(len(p0), dtype=bool)
+        flat = self.z.reshape(-1)
+        for seg, idx, z in self._swept_cells(p0, p1, radius, profile):
+            hit[seg[flat[idx] > z + tolerance]] = True
+        return hit
+
+    def _swept_cells(self, p0, p1, radius, profile=None):
+        """
+        Cellules couvertes par l'outil le long des segments, par blocs bornés :
+        (indice du segment dans p0, indice de la cellule dans z.ravel(), bas de l'outil float32).
+        """
+        p0 = np.atleast_2d(np.asarray(p0, dtype=np.float64))
+        p1 = np.atleast_2d(np.asarray(p1, dtype=np.float64))
+        if profile is not None and profile.is_flat:
+            profile = None
+        r = float(radius) if profile is None else profile.radius
+        keep = np.minimum(p0[:, 2], p1[:, 2]) < self.zmax + (0.0 if profile is None else profile.length)
+        origin = np.flatnonzero(keep)
+        p0, p1 = p0[keep], p1[keep]
+        if len(p0) == 0:
+            return
+        if profile is not None:
+            p0, p1, pieces = self._split_plunges(p0, p1)
+            origin = origin[pieces]
+
+        lo = np.minimum(p0[:, :2], p1[:, :2]) - r
+        hi = np.maximum(p0[:, :2], p1[:, :2]) + r
+        i0 = np.maximum(np.ceil((lo[:, 0] - self.x0) / self.cell), 0).astype(np.int64)
+        i1 = np.minimum(np.floor((hi[:, 0] - self.x0) / self.cell) + 1, self.nx).astype(np.int64)
+        j0 = np.maximum(np.ceil((lo[:, 1] - self.y0) / self.cell), 0).astype(np.int64)
+        j1 = np.minimum(np.floor((hi[:, 1] - self.y0) / self.cell) + 1, self.ny).astype(np.int64)
+        width = np.maximum(i1 - i0, 0)
+        counts = width * np.maximum(j1 - j0, 0)
+
+        first = 0
+        total = np.cumsum(counts)
+        while first < len(p0):
+            # bloc de segments dont le nombre de cellules reste borné (au moins un segment)
+            base = total[first - 1] if first else 0
+            last = max(int(np.searchsorted(total, base + SWEEP_CHUNK, side="right")), first + 1)
+            block = slice(first, last)
+            if counts[block].sum():
+                if profile is None:
+                    seg, idx, z = self._sweep_block(p0[block], p1[block], r, i0[block], j0[block],
+                                                    width[block], counts[block])
+                else:
+                    seg, idx, z = self._sweep_profile_block(p0[block], p1[block], profile, i0[block], j0[block],
+                                                            width[block], counts[block])
+                yield origin[first + seg], idx, z
+            first = last
+
+    def _split_plunges(self, p0, p1):
+        """
+        Découpe les segments dont la descente dépasse PROFILE_STEP cellule en morceaux égaux ;
+        renvoie aussi le segment d'origine de chaque morceau.
+        """
+        step = PROFILE_STEP * self.cell
+        pieces = np.maximum(np.ceil(np.abs(p1[:, 2] - p0[:, 2]) / step), 1).astype(np.int64)
+        if np.all(pieces == 1):
+            return p0, p1, np.arange(len(p0))
+        seg = np.repeat(np.arange(len(p0)), pieces)
+        k = np.arange(len(seg)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        n = pieces[seg].astype(np.float64)
+        e = (p1 - p0)[seg]
+        return p0[seg] + e * (k / n)[:, None], p0[seg] + e * ((k + 1) / n)[:, None], seg
+
+    def _block_cells(self, n_segments, i0, j0, width, counts):
+        """Couples (segment, cellule) d'un bloc : indices du segment et de la cellule (ii, jj)"""
+        n = int(counts.sum())
+        seg = np.repeat(np.arange(n_segments), counts)
+        local = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+        w = width[seg]
+        return seg, i0[seg] + local % w, j0[seg] + local // w
+
+    def _sweep_block(self, p0, p1, r, i0, j0, width, counts):
+        seg, ii, jj = self._block_cells(len(p0), i0, j0, width, counts)
+
+        a, b = p0[seg], p1[seg]
+        ex, ey = b[:, 0] - a[:, 0], b[:, 1] - a[:, 1]
+        dx = a[:, 0] - (self.x0 + ii * self.cell)
+        dy = a[:, 1] - (self.y0 + jj * self.cell)
+        # |d + t e|^2 <= r^2  ->  qa t^2 + qb t + qc <= 0
+        qa = ex * ex + ey * ey
+        qb = 2.0 * (dx * ex + dy * ey)
+        qc = dx * dx + dy * dy - r * r
+        with np.errstate(divide="ignore", invalid="ignore"):
+            root = np.sqrt(np.maximum(qb * qb - 4.0 * qa * qc, 0.0))
+            ta = np.where(qa > 1e-18, (-qb - root) / (2.0 * qa), 0.0)
+            tb = np.where(qa > 1e-18, (-qb + root) / (2.0 * qa), 1.0)
+        covered = np.where(qa > 1e-18, qb * qb - 4.0 * qa * qc >= 0.0, qc <= 0.0)
+        # l'intervalle doit rencontrer le segment [0, 1]
+        covered &= (ta <= 1.0) & (tb >= 0.0)
+        ta = np.clip(ta, 0.0, 1.0)
+        tb = np.clip(tb, 0.0, 1.0)
+        dz = b[:, 2] - a[:, 2]
+        z = np.minimum(a[:, 2] + ta * dz, a[:, 2] + tb * dz)
+        z = np.maximum(z, self.zmin).astype(np.float32)
+        return seg[covered], (jj * self.nx + ii)[covered], z[covered]
+
+    def _sweep_profile_block(self, p0, p1, profile, i0, j0, width, counts):
+        seg, ii, jj = self._block_cells(len(p0), i0, j0, width, counts)
+
+        a, b = p0[seg], p1[seg]
+        ex, ey = b[:, 0] - a[:, 0], b[:, 1] - a[:, 1]
+        dx = a[:, 0] - (self.x0 + ii * self.cell)
+        dy = a[:, 1] - (self.y0 + jj * self.cell)
+        # point du segment le plus proche de la cellule en XY
+        qa = ex * ex + ey * ey
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(qa > 1e-18, np.clip(-(dx * ex + dy * ey) / qa, 0.0, 1.0), 0.0)
+        rho = np.hypot(dx + t * ex, dy + t * ey)
+        covered = rho <= profile.radius
+        z = a[:, 2] + t * (b[:, 2] - a[:, 2]) + profile.height(rho)
+        z = np.maximum(z, self.zmin).astype(np.float32)
+        return seg[covered], (jj * self.nx + ii)[covered], z[covered]
+
+    def removed_volume(self):
+        return float(np.sum(self.zmax - self.z, dtype=np.float64)) * self.cell * self.cell
+
+
+def heightmap_triangles(heightmap):
+    """
+    Triangles (k, 3, 3) float32 d'un maillage fermé du brut : surface supérieure
+    (sommets aux centres des cellules), quatre côtés et fond.
+    """
+    hm = heightmap
+    xs, ys = hm.xs, hm.ys
+    nx, ny = hm.nx, hm.ny
+    gx, gy = np.meshgrid(xs, ys)
+    top = np.stack((gx, gy, hm.z), axis=-1).astype(np.float32)  # (ny, nx, 3)
+
+    tris = []
+    if nx > 1 and ny > 1:
+        a, b = top[:-1, :-1], top[:-1, 1:]
+        c, d = top[1:, 1:], top[1:, :-1]
+        tris.append(np.stack((a, b, c), axis=-2).reshape(-1, 3, 3))
+        tris.append(np.stack((a, c, d), axis=-2).reshape(-1, 3, 3))
+
+    # côtés : chaque arête du bord descend jusqu'au fond (flip : ordre inversé pour une normale sortante)
+    zmin = np.float32(hm.zmin)
+    for edge, flip in ((top[0, :], False), (top[-1, :], True), (top[:, 0], True), (top[:, -1], False)):
+        if len(edge) < 2:
+            continue
+        p, q = edge[:-1], edge[1:]
+        pb, qb = p.copy(), q.copy()
+        pb[:, 2] = zmin
+        qb[:, 2] = zmin
+        if flip:
+            p, q, pb, qb = q, p, qb, pb
+        tris.append(np.stack((p, pb, qb), axis=1))
+        tris.append(np.stack((p, qb, q), axis=1))
+
+    tris.append(bottom_triangles(hm))
+    return np.concatenate(tris, axis=0)
+
+
+def bottom_triangles(heightmap):
+    """Fond du brut : éventail depuis le centre sur le contour inférieur (mêmes arêtes que les côtés)"""
+    hm = heightmap
+    xs, ys = hm.xs, hm.ys
+    nx, ny = hm.nx, hm.ny
+    zmin = np.float32(hm.zmin)
+    bx = np.concatenate((xs, np.full(ny - 1, xs[-1]), xs[-2::-1], np.full(max(ny - 2, 0), xs[0])))
+    by = np.concatenate((np.full(nx, ys[0]), ys[1:], np.full(nx - 1, ys[-1]), ys[-2:0:-1]))
+    if len(bx) < 3:
+        return np.empty((0, 3, 3), dtype=np.float32)
+    loop = np.stack((bx, by, np.full(len(bx), zmin)), axis=-1).astype(np.float32)
+    center = np.array([(xs[0] + xs[-1]) / 2.0, (ys[0] + ys[-1]) / 2.0, zmin], dtype=np.float32)
+    nxt = np.roll(loop, -1, axis=0)
+    return np.stack((np.broadcast_to(center, loop.shape), nxt, loop), axis=1)
@@ -0,0 +1,66 @@
+"""
+Détection des rapides qui traversent de la matière.
+
+Le programme est rejoué sur le brut en une seule passe : les cellules
+couvertes par tous les segments (coupes et rapides) sont produites par blocs
+dans l'ordre du programme (Heightmap._swept_cells). Dans un bloc, la hauteur
+du brut vue par un segment est le minimum de la hauteur avant le bloc et des
+passages des segments précédents du bloc sur la même cellule (minimum
+cumulé par cellule, vectorisé) ; le bloc est ensuite appliqué au brut d'un
+coup. Le coût ne dépend pas du nombre d'alternances coupe / rapide.
+
+  crashes = rapid_crashes(heightmap, p0, p1, rapid, radius, profile)
+  lines = store.lines[crashes]
+"""
+import numpy as np
+
+# matière tolérée sous l'outil en rapide (mm) : écarts de discrétisation du brut
+CRASH_TOLERANCE = 0.01
+
+
+def _stock_before(flat, seg, idx, z):
+    """
+    Hauteur du brut sur la cellule idx juste avant le segment seg, pour chaque passage
+    (seg, idx, z) d'un bloc, flat étant le brut avant le bloc.
+    """
+    order = np.lexsort((seg, idx))
+    s_seg, s_idx = seg[order], idx[order]
+    s_z = z[order].astype(np.float64)
+    n = len(order)
+    new_cell = np.ones(n, dtype=bool)
+    new_cell[1:] = s_idx[1:] != s_idx[:-1]
+    new_run = new_cell.copy()
+    new_run[1:] |= s_seg[1:] != s_seg[:-1]
+    # minimum cumulé par cellule : chaque cellule est décalée sous les précédentes
+    group = np.cumsum(new_cell) - 1
+    span = float(s_z.max() - s_z.min()) + 1.0
+    shifted = s_z - group * span
+    running = np.minimum.accumulate(shifted) + group * span
+    # passages des segments strictement antérieurs : minimum cumulé avant le début du segment courant
+    run_start = np.flatnonzero(new_run)[np.cumsum(new_run) - 1]
+    previous = np.where(new_cell[run_start], np.inf, running[np.maximum(run_start - 1, 0)])
+    before = np.empty(n)
+    before[order] = np.minimum(flat[s_idx], previous)
+    return before
+
+
+def rapid_crashes(heightmap, p0, p1, rapid, radius, profile=None, tolerance=CRASH_TOLERANCE):
+    """
+    Indices des segments rapides (rapid[i] vrai) en collision avec le brut laissé par les
+    segments qui les précèdent. Le brut est modifié : il contient à la fin le volume balayé
+    par tout le programme.
+    """
+    p0 = np.atleast_2d(np.asarray(p0, dtype=np.float64))
+    p1 = np.atleast_2d(np.asarray(p1, dtype=np.float64))
+    rapid = np.asarray(rapid, dtype=bool)
+    hit = np.zeros(len(p0), dtype=bool)
+    if len(p0) == 0:
+        return np.empty(0, dtype=np.int64)
+    flat = heightmap.z.reshape(-1)
+    for seg, idx, z in heightmap._swept_cells(p0, p1, radius, profile):
+        check = rapid[seg]
+        if check.any():
+            before = _stock_before(flat, seg, idx, z)
+            hit[seg[check & (before > z + tolerance)]] = True
+        np.minimum.at(flat, idx, z)
+    return np.flatnonzero(hit)
@@ -0,0 +1,131 @@
+"""
+Instantanés compressés du brut simulé, pour revenir en arrière.
+
+Les instantanés sont pris à intervalle de temps régulier sur la ligne de
+temps de l'animation : l'instantané k est l'état du brut à l'instant
+k * interval. Seules les tuiles modifiées depuis l'instantané précédent
+sont conservées (hauteurs float32 compressées par zlib) : pour chaque tuile,
+une liste de versions (indice d'instantané, données).
+
+Restaurer l'instantané k ne réécrit que les tuiles qui diffèrent entre
+l'état courant et k. Les instantanés forment une plage contiguë
+[first, last] ; au-delà de max_bytes, les plus anciens sont abandonnés
+(anneau) : on ne peut plus revenir avant first qu'en repartant du brut
+initial. Le dernier instantané est toujours gardé, même s'il dépasse
+max_bytes à lui seul.
+
+  snapshots = StockSnapshots(heightmap, interval)
+  ...                                  # brut amené à l'instant (snapshots.last + 1) * interval
+  snapshots.record()
+  snapshots.restore(k)                 # first <= k <= last
+"""
+import bisect
+import zlib
+
+import numpy as np
+
+TILE_CELLS = 64
+DEFAULT_MAX_BYTES = 64 << 20
+# niveau zlib : la vitesse de compression prime, les hauteurs se compressent déjà bien
+COMPRESSION_LEVEL = 1
+
+
+class StockSnapshots:
+    def __init__(self, heightmap, interval, tile_cells=TILE_CELLS, max_bytes=DEFAULT_MAX_BYTES):
+        hm = self.heightmap = heightmap
+        self.interval = float(interval)
+        self.tile_cells = tile_cells
+        self.max_bytes = int(max_bytes)
+        self.tx = -(-hm.nx // tile_cells)
+        self.ty = -(-hm.ny // tile_cells)
+        # état de l'instantané 0 ; référence : état de l'instantané base
+        self.initial = hm.z.copy()
+        self.reference = hm.z.copy()
+        self.first = 0
+        self.last = 0
+        self.base = 0
+        self.nbytes = 0
+        # tuile -> (indices d'instantanés croissants, données compressées)
+        self._versions = {}
+
+    def __len__(self):
+        return self.last - self.first + 1
+
+    def time(self, index):
+        return index * self.interval
+
+    def index(self, t):
+        """Dernier instantané (théorique) à l'instant t ou avant"""
+        if self.interval <= 0:
+            return 0
+        return max(int(t // self.interval), 0)
+
+    def _tile(self, tile):
+        j, i = divmod(tile, self.tx)
+        n = self.tile_cells
+        return slice(j * n, (j + 1) * n), slice(i * n, (i + 1) * n)
+
+    def _changed_tiles(self, a, b):
+        """Tuiles dont une hauteur diffère entre les tableaux a et b"""
+        n = self.tile_cells
+        hm = self.heightmap
+        pad = np.zeros((self.ty * n, self.tx * n), dtype=bool)
+        pad[:hm.ny, :hm.nx] = a != b
+        return np.flatnonzero(pad.reshape(self.ty, n, self.tx, n).any(axis=(1, 3)))
+
+    def record(self):
+        """Le brut est dans l'état de l'instantané last + 1 : mémorise les tuiles modifiées"""
+        if self.base != self.last:
+            raise ValueError("record() attend un brut dans l'état du dernier instantané")
+        index = self.last + 1
+        z = self.heightmap.z
+        for tile in self._changed_tiles(z, self.reference):
+            rows, cols = self._tile(int(tile))
+            data = zlib.compress(np.ascontiguousarray(z[rows, cols]).tobytes(), COMPRESSION_LEVEL)
+            indices, blobs = self._versions.setdefault(int(tile), ([], []))
+            indices.append(index)
+            blobs.append(data)
+            self.nbytes += len(data)
+            self.reference[rows, cols] = z[rows, cols]
+        self.last = self.base = index
+        self._evict()
+
+    def _tile_state(self, tile, index):
+        """Hauteurs de la tuile à l'instantané index"""
+        rows, cols = self._tile(tile)
+        versions = self._versions.get(tile)
+        if versions is not None:
+            k = bisect.bisect_right(versions[0], index) - 1
+            if k >= 0:
+                shape = self.initial[rows, cols].shape
+                return np.frombuffer(zlib.decompress(versions[1][k]), dtype=np.float32).reshape(shape)
+        return self.initial[rows, cols]
+
+    def restore(self, index):
+        """Remet le brut dans l'état de l'instantané index (first <= index <= last)"""
+        if not self.first <= index <= self.last:
+            raise IndexError("instantané {} hors de [{}, {}]".format(index, self.first, self.last))
+        lo, hi = min(index, self.base), max(index, self.base)
+        # tuiles modifiées depuis la référence, et tuiles ayant une version entre les deux instantanés
+        tiles = set(self._changed_tiles(self.heightmap.z, self.reference).tolist())
+        for tile, (indices, _) in self._versions.items():
+            if bisect.bisect_right(indices, hi) > bisect.bisect_right(indices, lo):
+                tiles.add(tile)
+        for tile in tiles:
+            rows, cols = self._tile(tile)
+            state = self._tile_state(tile, index)
+            self.heightmap.z[rows, cols] = state
+            self.reference[rows, cols] = state
+        self.base = index
+
+    def _evict(self):
+        """Abandonne les plus anciens instantanés tant que la mémoire dépasse max_bytes"""
+        while self.nbytes > self.max_bytes and self.first < self.last:
+            self.first += 1
+            # par tuile, seule la dernière version antérieure ou égale à first reste utile
+            for indices, blobs in self._versions.values():
+                k = bisect.bisect_right(indices, self.first) - 1
+                if k > 0:
+                    self.nbytes -= sum(len(b) for b in blobs[:k])
+                    del indices[:k]
+                    del blobs[:k]
@@ -0,0 +1,124 @@
+"""
+Maillage du brut simulé découpé en tuiles, mis à jour par morceaux.
+
+Chaque tuile de tile_cells x tile_cells cellules a une topologie fixe : sa
+grille de sommets (qui reprend la première rangée de la tuile voisine pour
+rester jointive) et, en bord de brut, les côtés qui descendent jusqu'au fond.
+Seules les hauteurs changent : après une coupe, on ne recalcule que les
+sommets des tuiles dont une hauteur a changé depuis le dernier affichage.
+
+  tiles = StockTiles(heightmap)
+  for t in tiles.take_dirty():          # tuiles modifiées depuis le dernier appel
+      vertices = tiles.vertices(t)      # float32 (k, 3), même ordre à chaque appel
+  tiles.coord_index(t)                  # int32, triangles [a, b, c, -1] (fixe)
+  tiles.bottom_triangles()              # fond (fixe)
+
+Les triangles des tuiles et du fond forment exactement heightmap_triangles().
+"""
+import numpy as np
+
+from Sim.Heightmap import bottom_triangles
+
+TILE_CELLS = 64
+
+
+class StockTiles:
+    def __init__(self, heightmap, tile_cells=TILE_CELLS):
+        hm = self.heightmap = heightmap
+        self.tile_cells = tile_cells
+        # tile_cells x tile_cells quadrilatères par tuile (sommets aux centres des cellules)
+        self.tx = max(-(-(hm.nx - 1) // tile_cells), 1)
+        self.ty = max(-(-(hm.ny - 1) // tile_cells), 1)
+        # hauteurs affichées : référence pour détecter les tuiles modifiées
+        self.shown = hm.z.copy()
+        self._layouts = {}
+
+    def __len__(self):
+        return self.tx * self.ty
+
+    def window(self, tile):
+        """Plage (i0, i1, j0, j1) des sommets de la tuile (une rangée en commun avec les voisines)"""
+        j, i = divmod(int(tile), self.tx)
+        n = self.tile_cells
+        return (i * n, min((i + 1) * n + 1, self.heightmap.nx),
+                j * n, min((j + 1) * n + 1, self.heightmap.ny))
+
+    def take_dirty(self):
+        """Tuiles dont une hauteur a changé depuis le dernier appel (et les marque à jour)"""
+        hm, n = self.heightmap, self.tile_cells
+        changed = hm.z != self.shown
+        if not changed.any():
+            return np.empty(0, dtype=np.int64)
+        # la tuile (i, j) a les sommets des rangées j * n à j * n + n incluses (idem en colonnes)
+        pad = np.zeros((self.ty * n + 1, self.tx * n + 1), dtype=bool)
+        pad[:hm.ny, :hm.nx] = changed
+        tiles = pad[:-1, :-1].reshape(self.ty, n, self.tx, n).any(axis=(1, 3))
+        tiles |= pad[:-1, n::n].reshape(self.ty, n, self.tx).any(axis=1)
+        tiles |= pad[n::n, :-1].reshape(self.ty, self.tx, n).any(axis=2)
+        tiles |= pad[n::n, n::n]
+        np.copyto(self.shown, hm.z, where=changed)
+        return np.flatnonzero(tiles.ravel())
+
+    def _layout(self, tile):
+        """Topologie de la tuile : (sommets du dessus repris au fond pour chaque côté, coord_index)"""
+        layout = self._layouts.get(tile)
+        if layout is not None:
+            return layout
+        hm = self.heightmap
+        i0, i1, j0, j1 = self.window(tile)
+        w, h = i1 - i0, j1 - j0
+        grid = np.arange(h * w, dtype=np.int32).reshape(h, w)
+        tris = []
+        if w > 1 and h > 1:
+            a, b = grid[:-1, :-1], grid[:-1, 1:]
+            c, d = grid[1:, 1:], grid[1:, :-1]
+            tris.append(np.stack((a, b, c), axis=-1).reshape(-1, 3))
+            tris.append(np.stack((a, c, d), axis=-1).reshape(-1, 3))
+
+        # côtés sur les bords du brut, orientés comme dans heightmap_triangles
+        edges = []
+        next_index = h * w
+        for on_border, edge, flip in ((j0 == 0, grid[0, :], False), (j1 == hm.ny, grid[-1, :], True),
+                                      (i0 == 0, grid[:, 0], True), (i1 == hm.nx, grid[:, -1], False)):
+            if not on_border or len(edge) < 2:
+                continue
+            below = np.arange(next_index, next_index + len(edge), dtype=np.int32)
+            next_index += len(edge)
+            edges.append(edge)
+            p, q, pb, qb = edge[:-1], edge[1:], below[:-1], below[1:]
+            if flip:
+                p, q, pb, qb = q, p, qb, pb
+            tris.append(np.stack((p, pb, qb), axis=1))
+            tris.append(np.stack((p, qb, q), axis=1))
+
+        tris = np.concatenate(tris, axis=0) if tris else np.empty((0, 3), dtype=np.int32)
+        index = np.empty((len(tris), 4), dtype=np.int32)
+        index[:, :3] = tris
+        index[:, 3] = -1
+        layout = self._layouts[tile] = (edges, index.ravel())
+        return layout
+
+    def coord_index(self, tile):
+        return self._layout(tile)[1]
+
+    def vertices(self, tile):
+        """Sommets de la tuile à partir des hauteurs courantes du brut"""
+        hm = self.heightmap
+        edges, _ = self._layout(tile)
+        i0, i1, j0, j1 = self.window(tile)
+        gx, gy = np.meshgrid(hm.x0 + hm.cell * np.arange(i0, i1), hm.y0 + hm.cell * np.arange(j0, j1))
+        top = np.stack((gx, gy, hm.z[j0:j1, i0:i1]), axis=-1).reshape(-1, 3).astype(np.float32)
+        if not edges:
+            return top
+        below = top[np.concatenate(edges)]
+        below[:, 2] = hm.zmin
+        return np.concatenate((top, below))
+
+    def triangles(self, tile):
+        """Triangles (k, 3, 3) de la tuile"""
+        index = self.coord_index(tile).reshape(-1, 4)[:, :3]
+        return self.vertices(tile)[index]
+
+    def bottom_triangles(self):
+        return bottom_triangles(self.heightmap)
+
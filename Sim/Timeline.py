@@ -0,0 +1,75 @@
+"""
+Ligne de temps d'une animation de parcours.
+
+Longueurs et durées cumulées des segments animés, calculées une fois au
+chargement : placer l'outil à un instant quelconque est une recherche
+dichotomique, sans rejouer les segments précédents.
+
+  timeline = Timeline(p0, p1, rapid, rapid_factor=4.0)
+  index, fraction = timeline.locate(t)     # segment et position dans le segment
+  point = timeline.point(t)
+  a, b = timeline.path(t0, t1)             # segments parcourus entre t0 et t1 (pour le brut)
+
+Le temps est exprimé en mm parcourus à la vitesse d'avance : un segment
+rapide dure sa longueur divisée par rapid_factor.
+"""
+import numpy as np
+
+
+class Timeline:
+    def __init__(self, p0, p1, rapid=None, rapid_factor=1.0):
+        self.p0 = np.asarray(p0, dtype=np.float64).reshape(-1, 3)
+        self.p1 = np.asarray(p1, dtype=np.float64).reshape(-1, 3)
+        lengths = np.linalg.norm(self.p1 - self.p0, axis=1)
+        durations = lengths.copy()
+        if rapid is not None and rapid_factor != 1.0:
+            durations[np.asarray(rapid, dtype=bool)] /= rapid_factor
+        self.cum_length = np.concatenate(([0.0], np.cumsum(lengths)))
+        self.cum_time = np.concatenate(([0.0], np.cumsum(durations)))
+        self.durations = durations
+
+    def __len__(self):
+        return len(self.p0)
+
+    @property
+    def total_time(self):
+        return float(self.cum_time[-1])
+
+    @property
+    def total_length(self):
+        return float(self.cum_length[-1])
+
+    def clamp(self, t):
+        return min(max(float(t), 0.0), self.total_time)
+
+    def locate(self, t):
+        """(indice du segment, fraction 0..1) à l'instant t ; les segments de durée nulle sont sautés"""
+        n = len(self.p0)
+        if n == 0:
+            return 0, 0.0
+        t = self.clamp(t)
+        index = min(int(np.searchsorted(self.cum_time, t, side="right")) - 1, n - 1)
+        d = self.durations[index]
+        fraction = (t - self.cum_time[index]) / d if d > 0 else 1.0
+        return index, min(max(fraction, 0.0), 1.0)
+
+    def point(self, t):
+        index, fraction = self.locate(t)
+        return self.p0[index] + fraction * (self.p1[index] - self.p0[index])
+
+    def distance(self, t):
+        """Longueur parcourue à l'instant t"""
+        index, fraction = self.locate(t)
+        return float(self.cum_length[index] + fraction * (self.cum_length[index + 1] - self.cum_length[index]))
+
+    def path(self, t0, t1):
+        """Segments (a, b) (k, 3) parcourus entre t0 et t1 (t0 <= t1), extrémités coupées aux instants"""
+        if len(self.p0) == 0 or t1 <= t0:
+            return np.empty((0, 3)), np.empty((0, 3))
+        i0, f0 = self.locate(t0)
+        i1, f1 = self.locate(t1)
+        a = self.p0[i0:i1 + 1].copy()
+        b = self.p1[i0:i1 + 1].copy()
+        a[0] = self.p0[i0] + f0 * (self.p1[i0] - self.p0[i0])
+        b[-1] = self.p0[i1] + f1 * (self.p1[i1] - self.p0[i1])
+        return a, b
@@ -0,0 +1,108 @@
+"""
+Profils d'outils pour la simulation d'enlèvement de matière.
+
+Un outil de révolution est décrit par sa hauteur au-dessus du bout h(rho) en
+fonction de la distance rho à l'axe (0 <= rho <= rayon). Le brut Z-dexel
+évalue ce profil directement sur les cellules, sans maillage ni BRep d'outil :
+une cellule à la distance rho de l'axe d'un outil dont le bout est en z est
+abaissée à z + h(rho).
+
+  profile = profile_from_tool(ToolDatabase().get_tool_by_id(obj.Tool.Id))
+  profile = tool_profile(BALL, radius=3.0)
+  profile.height(rho)            # tableau : hauteur au-dessus du bout, inf hors de l'outil
+
+Les profils sont immuables et mis en cache par paramètres : toutes les
+opérations qui utilisent le même outil partagent le même objet.
+"""
+import math
+from functools import lru_cache
+
+import numpy as np
+
+FLAT = "flat"
+BALL = "ball"
+BULL = "bull"
+DRILL = "drill"
+
+
+class ToolProfile:
+    """
+    kind         : FLAT, BALL, BULL ou DRILL
+    radius       : rayon de l'outil
+    torus_radius : rayon du tore (BULL)
+    point_angle  : angle de pointe en degrés (DRILL)
+    length       : hauteur du profil (h(radius)), 0 pour une fraise plate
+    """
+    def __init__(self, kind, radius, torus_radius=0.0, point_angle=118.0):
+        self.kind = kind
+        self.radius = float(radius)
+        self.torus_radius = float(torus_radius)
+        self.point_angle = float(point_angle)
+        if kind == BALL:
+            self.length = self.radius
+        elif kind == BULL:
+            self.length = self.torus_radius
+        elif kind == DRILL:
+            self.length = self.radius / math.tan(math.radians(self.point_angle) / 2.0)
+        else:
+            self.length = 0.0
+
+    @property
+    def is_flat(self):
+        return self.kind == FLAT
+
+    def height(self, rho):
+        """Hauteur du profil au-dessus du bout à la distance rho de l'axe (inf au-delà du rayon)"""
+        rho = np.asarray(rho, dtype=np.float64)
+        r = self.radius
+        if self.kind == BALL:
+            h = r - np.sqrt(np.maximum(r * r - rho * rho, 0.0))
+        elif self.kind == BULL:
+            tr = self.torus_radius
+            u = np.maximum(rho - (r - tr), 0.0)
+            h = tr - np.sqrt(np.maximum(tr * tr - u * u, 0.0))
+        elif self.kind == DRILL:
+            h = rho * (self.length / r) if r > 0 else np.zeros_like(rho)
+        else:
+            h = np.zeros_like(rho)
+        return np.where(rho <= r, h, np.inf)
+
+    def __repr__(self):
+        return "ToolProfile({}, radius={}, torus_radius={}, point_angle={})".format(
+            self.kind, self.radius, self.torus_radius, self.point_angle)
+
+
+@lru_cache(maxsize=128)
+def tool_profile(kind, radius, torus_radius=0.0, point_angle=118.0):
+    """Profil partagé pour ces paramètres ; les cas dégénérés sont ramenés au profil équivalent"""
+    radius = float(radius)
+    torus_radius = float(torus_radius)
+    if kind == BULL:
+        if torus_radius <= 0.0:
+            return tool_profile(FLAT, radius)
+        if torus_radius >= radius:
+            return tool_profile(BALL, radius)
+    if kind == DRILL and not 0.0 < point_angle < 180.0:
+        return tool_profile(FLAT, radius)
+    if kind not in (BALL, BULL, DRILL):
+        return ToolProfile(FLAT, radius)
+    return ToolProfile(kind, radius, torus_radius if kind == BULL else 0.0,
+                       point_angle if kind == DRILL else 118.0)
+
+
+def profile_from_tool(tool):
+    """
+    Profil d'un outil de la base (BaptTools.Tool) d'après son type :
+    "Fraise" (plate, ou boule si le rayon de tore vaut le rayon), "Fraise torique",
+    "Fraise boule", "Foret" ; "Taraud" et les autres types sont simulés comme un cylindre.
+    """
+    radius = float(tool.diameter) / 2.0
+    kind = (tool.type or "").strip().lower()
+    torus_radius = float(getattr(tool, "torus_radius", 0.0) or 0.0)
+    if kind == "foret":
+        return tool_profile(DRILL, radius, point_angle=float(tool.point_angle or 118.0))
+    if "boule" in kind:
+        return tool_profile(BALL, radius)
+    if kind.startswith("fraise") and torus_radius > 0.0:
+        return tool_profile(BULL, radius, torus_radius)
+    return tool_profile(FLAT, radius)
@@ -8,3 +8,32 @@ import TestApp
 
 from tests.BaptTestPocket import TestNode
 from tests.BaptTestPocket import TestShiftWire
+
+from tests.BaptTestCamProject import TestMergedBackplotProvider
+
+from tests.BaptTestBackplot import TestSegmentStore
+from tests.BaptTestBackplot import TestBackplotInterpreter
+from tests.BaptTestBackplot import TestTokenizer
+from tests.BaptTestBackplot import TestIncrementalBackplot
+from tests.BaptTestBackplot import TestTessellation
+from tests.BaptTestBackplot import TestSpatialIndex
+from tests.BaptTestBackplot import TestRepeat
+from tests.BaptTestBackplot import TestLineIndex
+from tests.BaptTestBackplot import TestMergedBackplot
+from tests.BaptTestBackplot import TestBackplotWorker
+from tests.BaptTestBackplot import TestBackplotCache
+
+from tests.BaptTestSimulation import TestHeightmap
+from tests.BaptTestSimulation import TestSweep
+from tests.BaptTestSimulation import TestToolProfile
+from tests.BaptTestSimulation import TestBatch
+from tests.BaptTestSimulation import TestStockTiles
+from tests.BaptTestSimulation import TestTimeline
+from tests.BaptTestSimulation import TestSnapshots
+from tests.BaptTestSimulation import TestRapids
+from tests.BaptTestSimulation import TestChain
+from tests.BaptTestPocketEngine import TestOffset
+from tests.BaptTestPocketEngine import TestRings
+from tests.BaptTestPocketEngine import TestScanline
+from tests.BaptTestPocketEngine import TestLayers
+from tests.BaptTestPocketEngine import TestSpiral
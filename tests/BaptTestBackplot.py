@@ -0,0 +1,390 @@
+import unittest
+
+import numpy as np
+
+from Backplot.Cache import BackplotCache, CachedBackplot
+from Backplot.Interpreter import BackplotCancelled, BackplotInterpreter
+from Backplot.LineIndex import LineIndex
+from Backplot.Merge import MergedBackplot, packed_colors
+from Backplot.SegmentStore import MOTION_FEED, MOTION_RAPID, SegmentStore
+from Backplot.SpatialIndex import SegmentGrid, ray_segment_distance
+from Backplot.Tessellation import arc_segment_counts
+from Backplot.Tokenizer import tokenize
+from Backplot.Worker import BackplotWorker
+
+
+class TestSegmentStore(unittest.TestCase):
+    def test01(self):
+        """
+        les segments consécutifs partagent leur sommet commun
+        """
+        store = SegmentStore(capacity=1)
+        store.add((0, 0, 0), (10, 0, 0), MOTION_RAPID, 0)
+        store.add((10, 0, 0), (10, 10, 0), MOTION_FEED, 1)
+        store.add((5, 5, 5), (0, 0, 0), MOTION_FEED, 2)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.n_vertices, 5)
+        self.assertEqual(store.endpoint(1), ((10.0, 0.0, 0.0), (10.0, 10.0, 0.0)))
+        self.assertEqual(list(store.line_set_index(MOTION_FEED)), [1, 2, -1, 3, 4, -1])
+        self.assertEqual(list(store.segment_ids(MOTION_FEED)), [1, 2])
+
+
+class TestBackplotInterpreter(unittest.TestCase):
+    def test01(self):
+        """
+        lignes source et types de mouvement
+        """
+        store = BackplotInterpreter().run("G0 X0 Y0 Z10\n\nG1 Z0 F100\nG1 X10\nG0 Z10\n")
+        self.assertEqual(list(store.kinds), [MOTION_RAPID, MOTION_FEED, MOTION_FEED, MOTION_RAPID])
+        self.assertEqual(list(store.lines), [0, 2, 3, 4])
+        p0, p1 = store.endpoints()
+        self.assertTrue(np.allclose(p1[-1], (10, 0, 10)))
+
+    def test02(self):
+        """
+        arc G3 : tous les points sont sur le cercle et l'arc finit au point programmé
+        """
+        store = BackplotInterpreter().run("G0 X10 Y0 Z0\nG3 X-10 Y0 I-10 J0\n")
+        p0, p1 = store.endpoints(store.segment_ids(MOTION_FEED))
+        self.assertTrue(np.allclose(np.hypot(p1[:, 0], p1[:, 1]), 10.0, atol=1e-4))
+        self.assertTrue(np.allclose(p1[-1], (-10, 0, 0)))
+        self.assertTrue(np.all(p1[:, 1] >= -1e-4))
+
+    def test03(self):
+        """
+        REPEAT entre deux labels en G91
+        """
+        gcode = "G0 X0 Y0 Z0\nDEBUT:\nG91\nG1 X1\nFIN:\nREPEAT DEBUT FIN P=3\nG90\nG1 Y5\n"
+        store = BackplotInterpreter().run(gcode)
+        p0, p1 = store.endpoints(store.segment_ids(MOTION_FEED))
+        self.assertTrue(np.allclose(p1[:, 0], [1, 2, 3, 4, 4]))
+        self.assertEqual(list(store.lines[1:]), [3, 3, 3, 3, 7])
+
+
+
+class TestTokenizer(unittest.TestCase):
+    def test01(self):
+        """
+        mots, commentaires et fragments non reconnus, par ligne source
+        """
+        table = tokenize("G0X10 y-2.5 Z.5 ; approche\n\nDEBUT:\ng1 z-1 (plongee)\nREPEAT DEBUT P=2")
+        self.assertEqual(table.n_lines, 5)
+        self.assertEqual(table.words(0), {"G": 0.0, "X": 10.0, "Y": -2.5, "Z": 0.5})
+        self.assertEqual(table.words(1), {})
+        self.assertEqual(table.comments, {0: " approche", 3: "plongee"})
+        self.assertEqual(table.others, {2: ["DEBUT:"], 4: ["REPEAT", "DEBUT", "P=2"]})
+        self.assertEqual(table.items(3), [("G", 1.0), ("Z", -1.0)])
+        self.assertEqual(list(table.lines), [0, 0, 0, 0, 3, 3])
+
+    def test02(self):
+        """
+        G01 est une avance (et non un rapide)
+        """
+        store = BackplotInterpreter().run("G00 X5\nG01 X10\n")
+        self.assertEqual(list(store.kinds), [MOTION_RAPID, MOTION_FEED])
+
+
+class TestTessellation(unittest.TestCase):
+    def test01(self):
+        """
+        le nombre de cordes dépend du rayon et de la tolérance
+        """
+        counts = arc_segment_counts([0.5, 500.0, 500.0], [np.pi / 2, np.pi / 2, -np.pi / 2], 0.01)
+        self.assertEqual(counts[1], counts[2])
+        self.assertLess(counts[0], counts[1])
+        step = np.pi / 2 / counts
+        self.assertTrue(np.all(np.array([0.5, 500.0]) * (1 - np.cos(step[:2] / 2)) <= 0.01 + 1e-12))
+
+    def test02(self):
+        """
+        écart de corde respecté sur un arc hélicoïdal, extrémités exactes
+        """
+        gcode = "G0 X10 Y0 Z0\nG3 X10 Y0 Z-2 I-10 J0\nG1 X20\n"
+        for tolerance in (0.1, 0.01):
+            interpreter = BackplotInterpreter(tolerance=tolerance)
+            store = interpreter.run(gcode)
+            ids = np.flatnonzero(store.lines == 1)
+            p0, p1 = store.endpoints(ids)
+            mid = (p0 + p1)[:, :2] / 2
+            sagitta = 10.0 - np.hypot(mid[:, 0], mid[:, 1])
+            self.assertTrue(np.all(sagitta <= tolerance + 1e-5))
+            self.assertTrue(np.allclose(p1[-1], (10, 0, -2)))
+            self.assertEqual(store.n_vertices, len(store) + 1)
+
+    def test03(self):
+        """
+        changer la tolérance rediscrétise sans réinterpréter
+        """
+        gcode = "G0 X10 Y0 Z0\nG2 X-10 Y0 R10\nG0 Z5\n"
+        interpreter = BackplotInterpreter(tolerance=0.5)
+        n = len(interpreter.run(gcode))
+        interpreter.set_tolerance(0.001)
+        self.assertGreater(len(interpreter.store), n)
+        self.assertEqual(interpreter.store.kinds[-1], MOTION_RAPID)
+        self.assertTrue(np.all(interpreter.store.endpoints()[1][1:-1, 1] <= 1e-4))
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def test01(self):
+        """
+        même segment que la recherche exhaustive (le plus proche de la caméra à moins de radius)
+        """
+        rng = np.random.default_rng(0)
+        pts = np.cumsum(rng.normal(size=(2001, 3)), axis=0)
+        p0, p1 = pts[:-1], pts[1:]
+        grid = SegmentGrid(p0, p1)
+        lo, hi = pts.min(axis=0), pts.max(axis=0)
+        for _ in range(100):
+            direction = rng.normal(size=3)
+            direction /= np.linalg.norm(direction)
+            origin = lo + (hi - lo) * rng.random(3) - 500 * direction
+            hit = grid.query(origin, direction, 0.5)
+            dist, t, _ = ray_segment_distance(origin, direction, p0, p1)
+            inside = np.flatnonzero(dist <= 0.5)
+            if len(inside) == 0:
+                self.assertIsNone(hit)
+            else:
+                self.assertAlmostEqual(hit[1], t[inside].min())
+
+    def test02(self):
+        """
+        rayon vertical sur un parcours plan, rayon hors de la grille
+        """
+        store = BackplotInterpreter().run("G0 X0 Y0 Z5\nG1 Z0\nG1 X10\nG1 Y10\n")
+        grid = SegmentGrid(*store.endpoints())
+        seg, t, dist = grid.query((5, 0.1, 100), (0, 0, -1), 0.2)
+        self.assertEqual(int(store.lines[seg]), 2)
+        self.assertAlmostEqual(t, 100.0)
+        self.assertIsNone(grid.query((50, 50, 100), (0, 0, -1), 0.2))
+        self.assertIsNone(SegmentGrid(np.empty((0, 3)), np.empty((0, 3))).query((0, 0, 0), (0, 0, 1), 1))
+
+
+class TestIncrementalBackplot(unittest.TestCase):
+    PROGRAM = "\n".join(
+        ["G0 X0 Y0 Z5", "R1=3", "G91"]
+        + ["G1 X1 Y{}".format(i % 3) for i in range(40)]
+        + ["DEBUT:", "G1 Z-1", "G1 X2", "FIN:", "REPEAT DEBUT FIN P=R1", "G90"]
+        + ["G1 X{} Y5".format(i) for i in range(40)]
+        + ["G2 X{} Y5 R3".format(40 + 2 * i) if i % 2 else "G3 X{} Y5 I1 J0".format(40 + 2 * i) for i in range(6)]
+        + ["G81 Z-5 R2", "G0 X1 Y1", "G80", "M30"]
+    )
+
+    def assertSameStore(self, a, b):
+        self.assertEqual(len(a), len(b))
+        self.assertTrue(np.array_equal(a.vertices, b.vertices))
+        self.assertTrue(np.array_equal(a.starts, b.starts))
+        self.assertTrue(np.array_equal(a.kinds, b.kinds))
+        self.assertTrue(np.array_equal(a.lines, b.lines))
+
+    def test01(self):
+        """
+        après chaque modification, le résultat est identique à une évaluation complète
+        """
+        interpreter = BackplotInterpreter(checkpoint_every=7)
+        interpreter.run(self.PROGRAM)
+        self.assertEqual(interpreter.update(self.PROGRAM), None)
+
+        lines = self.PROGRAM.split("\n")
+        edits = [
+            (60, "G1 X{} Y7"),      # programme absolu, après le REPEAT
+            (20, "G1 X3 Y{}"),      # partie incrémentale, avant le REPEAT
+            (1, "R1=2"),            # variable utilisée par le REPEAT
+            (45, "G1 Z-{}"),        # corps du REPEAT
+        ]
+        for line, text in edits:
+            lines[line] = text.format(line)
+            text = "\n".join(lines)
+            first_segment, first_vertex = interpreter.update(text)
+            self.assertSameStore(interpreter.store, BackplotInterpreter().run(text))
+            self.assertLessEqual(first_segment, len(interpreter.store))
+
+    def test02(self):
+        """
+        une modification en fin de programme ne réévalue pas le début
+        """
+        interpreter = BackplotInterpreter(checkpoint_every=10)
+        interpreter.run(self.PROGRAM)
+        n = len(interpreter.store)
+        first_segment, first_vertex = interpreter.update(self.PROGRAM.replace("G0 X1 Y1", "G0 X2 Y2"))
+        self.assertGreater(first_segment, n // 2)
+        self.assertEqual(interpreter.store.endpoint(first_segment - 1)[1], interpreter.store.endpoint(first_segment)[0])
+
+    def test03(self):
+        """
+        les avertissements des lignes avant la modification sont conservés
+        """
+        lines = self.PROGRAM.split("\n")
+        lines[2:2] = ["G17"]
+        lines[-4:-4] = ["G54"]
+        text = "\n".join(lines)
+        interpreter = BackplotInterpreter(checkpoint_every=10)
+        interpreter.run(text)
+        self.assertEqual(len(interpreter.warnings), 2)
+        text = text.replace("G0 X1 Y1", "G0 X2 Y2")
+        interpreter.update(text)
+        full = BackplotInterpreter()
+        full.run(text)
+        self.assertEqual(interpreter.warnings, full.warnings)
+
+
+class TestRepeat(unittest.TestCase):
+    def assertSamePath(self, a, b):
+        self.assertEqual(len(a), len(b))
+        self.assertEqual(a.n_vertices, b.n_vertices)
+        self.assertTrue(np.allclose(a.vertices, b.vertices, atol=1e-4))
+        self.assertTrue(np.array_equal(a.kinds, b.kinds))
+
+    def test01(self):
+        """
+        REPEAT imbriqués (corps G91 translaté, corps G90 avec arc) : identique au programme déroulé
+        """
+        program = "\n".join([
+            "G0 X0 Y0 Z5", "G91",
+            "DEB:", "G1 X1", "IN:", "G1 Y1", "G3 X2 Y0 I1 J0", "FINI:", "REPEAT IN FINI P=3", "FIN:",
+            "REPEAT DEB FIN P=2",
+            "G90", "BOUCLE:", "G1 X0 Y0", "G2 X10 Y0 R5", "REPEAT BOUCLE P=2", "M30",
+        ])
+        inner = ["G1 Y1", "G3 X2 Y0 I1 J0"]
+        unrolled = "\n".join(
+            ["G0 X0 Y0 Z5", "G91"]
+            + (["G1 X1"] + inner * 4) * 3
+            + ["G90"] + ["G1 X0 Y0", "G2 X10 Y0 R5"] * 3
+        )
+        self.assertSamePath(BackplotInterpreter().run(program), BackplotInterpreter().run(unrolled))
+
+    def test02(self):
+        """
+        le nombre de passes ne limite ni la pile ni le temps (copies des mouvements)
+        """
+        program = "\n".join(["G91", "R2=50000", "A:", "G1 X0.1 Y0.1", "G1 Y-0.1", "REPEAT A P=R2"])
+        interpreter = BackplotInterpreter()
+        store = interpreter.run(program)
+        self.assertEqual(len(store), 2 * 50001)
+        self.assertEqual(store.n_vertices, 2 * 50001 + 1)
+        self.assertAlmostEqual(interpreter.cur[0], 0.1 * 50001, places=6)
+
+
+class TestLineIndex(unittest.TestCase):
+    def test01(self):
+        """
+        segments d'une ligne de corps de REPEAT (non contigus) et d'une plage de lignes
+        """
+        program = "G0 X0 Y0\nDEB:\nG1 X1\nG1 Y1\nREPEAT DEB P=2\nG1 X5"
+        store = BackplotInterpreter().run(program)
+        index = LineIndex(store.lines, 6)
+        self.assertEqual(list(index.segments(2)), [1, 3, 5])
+        self.assertEqual(list(index.segments(2, 3)), [1, 3, 5, 2, 4, 6])
+        self.assertEqual(index.ranges(2, 3).tolist(), [[1, 7]])
+        self.assertEqual(index.ranges(3).tolist(), [[2, 3], [4, 5], [6, 7]])
+        self.assertEqual(len(index.segments(1)), 0)
+        self.assertEqual(len(index.segments(10)), 0)
+        self.assertEqual(index.line_of(7), 5)
+
+
+class TestMergedBackplot(unittest.TestCase):
+    def test01(self):
+        """
+        sommets bout à bout, indices décalés, matériau = 2 * opération + type de mouvement
+        """
+        a = BackplotInterpreter().run("G0 X10 Y0\nG1 X10 Y10")
+        b = BackplotInterpreter().run("G1 X5 Y5 Z-1")
+        merged = MergedBackplot([a, b])
+        self.assertEqual(len(merged), len(a) + len(b))
+        self.assertEqual(len(merged.vertices), a.n_vertices + b.n_vertices)
+        self.assertEqual(list(merged.material_index), [0, 1, 3])
+        s = merged.coord_index[-3]
+        self.assertEqual(tuple(merged.vertices[s + 1]), (5.0, 5.0, -1.0))
+        self.assertEqual(merged.operation_of(2), 1)
+        self.assertEqual(packed_colors([(1.0, 0.0, 0.0)]), [0xFF0000FF])
+
+
+class TestBackplotWorker(unittest.TestCase):
+    PROGRAM = TestIncrementalBackplot.PROGRAM
+
+    def test01(self):
+        """
+        une modification ne renvoie que la fin du parcours, relative au résultat précédent
+        """
+        results = []
+        worker = BackplotWorker(results.append, threaded=False, checkpoint_every=10)
+        worker.submit(self.PROGRAM, 0.01)
+        edited = self.PROGRAM.replace("G0 X1 Y1", "G0 X2 Y2")
+        worker.submit(edited, 0.01, coarse_tolerance=0.5)
+        first, second = results
+        self.assertIsNone(second.error)
+        self.assertEqual(second.base_generation, first.generation)
+        self.assertGreater(second.first_segment, 0)
+        TestIncrementalBackplot.assertSameStore(self, second.store, BackplotInterpreter().run(edited))
+        self.assertGreater(len(second.coarse_store), 0)
+        # la copie remise au thread principal n'est pas modifiée par les évaluations suivantes
+        n = len(first.store)
+        worker.submit("G0 X1", 0.01)
+        self.assertEqual(len(first.store), n)
+
+    def test02(self):
+        """
+        une évaluation interrompue laisse l'interpréteur dans un état réutilisable
+        """
+        interpreter = BackplotInterpreter(checkpoint_every=5)
+        interpreter.run(self.PROGRAM)
+        edited = self.PROGRAM.replace("G1 X1 Y2", "G1 X2 Y2", 1)
+        with self.assertRaises(BackplotCancelled):
+            interpreter.update(edited.replace("G0 X1 Y1", "G0 X9 Y9"), cancelled=lambda: True)
+        interpreter.update(edited)
+        TestIncrementalBackplot.assertSameStore(self, interpreter.store, BackplotInterpreter().run(edited))
+
+    def test03(self):
+        """
+        seul le résultat de la dernière demande est à jour
+        """
+        results = []
+        worker = BackplotWorker(results.append, checkpoint_every=5)
+        for i in range(5):
+            worker.submit(self.PROGRAM.replace("G0 X1 Y1", "G0 X{} Y1".format(i)), 0.01)
+        worker._executor.shutdown(wait=True)
+        current = [r for r in results if not worker.is_stale(r.generation)]
+        self.assertEqual(len(current), 1)
+        self.assertEqual(current[0].generation, 5)
+        TestIncrementalBackplot.assertSameStore(self, current[0].store,
+                                                BackplotInterpreter().run(self.PROGRAM.replace("G0 X1 Y1", "G0 X4 Y1")))
+
+
+class TestBackplotCache(unittest.TestCase):
+    def test01(self):
+        """
+        éviction du moins récemment utilisé au-delà de la taille maximale
+        """
+        stores = [BackplotInterpreter().run("G0 X{} Y0\nG1 X0 Y{}".format(i, i)) for i in range(3)]
+        entries = [CachedBackplot(store, None, ["G0"], []) for store in stores]
+        cache = BackplotCache(max_bytes=2 * entries[0].nbytes)
+        keys = [BackplotCache.key("programme {}".format(i), 0.01) for i in range(3)]
+        cache.put(keys[0], entries[0])
+        cache.put(keys[1], entries[1])
+        self.assertIs(cache.get(keys[0]), entries[0])
+        cache.put(keys[2], entries[2])
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIs(cache.get(keys[2]), entries[2])
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+        self.assertNotEqual(BackplotCache.key("programme 0", 0.01), BackplotCache.key("programme 0", 0.02))
+
+    def test02(self):
+        """
+        deux workers (copies liées d'une opération) : le programme n'est évalué qu'une fois
+        """
+        cache = BackplotCache()
+        results = []
+        for _ in range(2):
+            worker = BackplotWorker(results.append, threaded=False, cache=cache)
+            worker.submit(TestIncrementalBackplot.PROGRAM, 0.01, coarse_tolerance=0.5)
+        first, second = results
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertIsNone(second.base_generation)
+        self.assertIs(second.store, first.store)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,15 @@
+import FreeCAD as App
+import FreeCADGui as Gui
+import unittest
+from BaptCamProject import ViewProviderCamProject, ViewProviderStock
+
+
+class TestMergedBackplotProvider(unittest.TestCase):
+    def test01(self):
+        """
+        le backplot fusionné est porté par le view provider du projet, pas par celui du brut
+        """
+        for name in ("backplotOperations", "scheduleBackplot", "refreshBackplot"):
+            self.assertTrue(callable(getattr(ViewProviderCamProject, name, None)), name)
+            self.assertFalse(hasattr(ViewProviderStock, name), name)
+        self.assertIn("Backplot", ViewProviderCamProject.getDisplayModes(None, None))
@@ -0,0 +1,166 @@
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from Backplot.Cache import BackplotCache
+from Pocket.Offset import nest_rings, offset_loops, offset_rings, orient_loops, signed_area
+from Pocket.Layers import LayerCost, depth_levels
+from Pocket.Rings import pocket_rings
+from Pocket.Scanline import scanline_spans, zigzag_segments
+from Pocket.Spiral import spiral_path
+
+
+def circle(cx, cy, r, n=200):
+    th = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    return np.column_stack((cx + r * np.cos(th), cy + r * np.sin(th)))
+
+
+class TestOffset(unittest.TestCase):
+    def test01(self):
+        """
+        rectangle : passes exactes jusqu'à disparition, dans le sens trigonométrique
+        """
+        rect = np.array([(0, 0), (100, 0), (100, 60), (0, 60)], dtype=float)
+        rings = offset_rings(orient_loops([rect[::-1]]), 3.0)
+        self.assertEqual(len(rings), 9)
+        self.assertTrue(all(len(level) == 1 for level in rings))
+        first = rings[0][0]
+        self.assertTrue(np.allclose(np.sort(first, axis=0)[[0, -1]], [(3, 3), (97, 57)]))
+        self.assertAlmostEqual(signed_area(first), 94 * 54)
+        self.assertEqual(nest_rings(rings)[1:], [[0]] * 8)
+
+    def test02(self):
+        """
+        L avec îlot : coin rentrant arrondi, îlot contourné puis absorbé, bras séparés à la fin
+        """
+        contour = np.array([(0, 0), (80, 0), (80, 30), (30, 30), (30, 80), (0, 80)], dtype=float)
+        loops = orient_loops([contour, circle(15, 15, 5, 400)])
+        self.assertLess(signed_area(loops[1]), 0)
+
+        outer, island = offset_loops(loops, 2.0)
+        self.assertAlmostEqual(-signed_area(island), np.pi * 49, delta=0.1)
+        # coin rentrant en (30, 30) : arc de rayon 2, tous les points à 2 mm au moins du contour
+        corner = outer[np.linalg.norm(outer - (30, 30), axis=1) < 2.5]
+        self.assertTrue(len(corner) > 2)
+        self.assertTrue(np.allclose(np.linalg.norm(corner - (30, 30), axis=1), 2.0, atol=0.01))
+
+        rings = offset_rings(loops, 2.0)
+        self.assertEqual(len(rings[-1]), 2)
+        self.assertAlmostEqual(signed_area(rings[-1][0]), signed_area(rings[-1][1]))
+
+
+class TestRings(unittest.TestCase):
+    def test01(self):
+        """
+        passes reprises du cache : plus de générations ne calcule que les nouvelles
+        """
+        cache = BackplotCache(1 << 20)
+        loops = orient_loops([np.array([(0, 0), (100, 0), (100, 60), (0, 60)], dtype=float)])
+        rings = pocket_rings(loops, 3.0, max_rings=2, cache=cache)
+        self.assertEqual((len(rings), cache.misses), (2, 2))
+        again = pocket_rings(loops, 3.0, cache=cache)
+        self.assertEqual(len(again), 9)
+        self.assertTrue(np.array_equal(again[1][0], rings[1][0]))
+        # 7 passes nouvelles et la passe vide qui arrête le calcul
+        self.assertEqual(cache.misses, 10)
+        pocket_rings(loops, 3.0, cache=cache)
+        self.assertEqual(cache.misses, 10)
+
+    def test02(self):
+        """
+        passes calculées par vagues dans un pool de processus lancés par spawn : même résultat qu'en série
+        """
+        th = np.linspace(0, 2 * np.pi, 2000, endpoint=False)
+        radius = 50 + 3 * np.sin(12 * th)
+        loops = orient_loops([np.column_stack((radius * np.cos(th), radius * np.sin(th)))])
+        serial = offset_rings(loops, 10.0)
+        rings = pocket_rings(loops, 10.0, workers=2, cache=BackplotCache(1 << 20),
+                             mp_context=multiprocessing.get_context("spawn"))
+        self.assertEqual(len(rings), len(serial))
+        for level, expected in zip(rings, serial):
+            self.assertTrue(all(np.array_equal(a, b) for a, b in zip(level, expected)))
+
+
+class TestScanline(unittest.TestCase):
+    def setUp(self):
+        rect = np.array([(0, 0), (100, 0), (100, 60), (0, 60)], dtype=float)
+        self.loops = orient_loops([rect, circle(50, 30, 10, 400)])
+
+    def test01(self):
+        """
+        lignes horizontales : intervalles coupés par l'îlot, sens alterné d'une ligne à l'autre
+        """
+        y, row, x0, x1 = scanline_spans(self.loops, 6.0)
+        self.assertTrue(np.allclose(y, np.arange(3, 60, 6)))
+        self.assertEqual(row.tolist(), [0, 1, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 8, 9])
+        self.assertTrue(np.allclose(x0[3:5], [0, 50 + np.sqrt(100 - 81)], atol=0.01))
+        p0, p1 = zigzag_segments(y, row, x0, x1)
+        self.assertTrue(np.allclose(p0[:2], [(0, 3), (100, 9)]))
+        # ligne 3 à rebours : d'abord l'intervalle de droite
+        self.assertTrue(np.allclose(p0[3:5, 0], [100, x1[3]]))
+
+    def test02(self):
+        """
+        balayage incliné : même surface couverte, segments dans le repère d'origine
+        """
+        angle = np.radians(30)
+        y, row, x0, x1 = scanline_spans(self.loops, 0.1, angle)
+        self.assertTrue(len(y) > 500)
+        self.assertAlmostEqual((x1 - x0).sum() * (y[1] - y[0]), 6000 - np.pi * 100, delta=1.0)
+        p0, p1 = zigzag_segments(y, row, x0, x1, angle)
+        direction = (p1 - p0) / np.linalg.norm(p1 - p0, axis=1)[:, None]
+        self.assertTrue(np.allclose(np.abs(direction), [np.cos(angle), np.sin(angle)]))
+        self.assertTrue(np.all((p0 > -1e-9) & (p0 < (100 + 1e-9, 60 + 1e-9))))
+
+
+class TestLayers(unittest.TestCase):
+    def test01(self):
+        """
+        niveaux tous les step_down, le dernier exactement à la profondeur finale
+        """
+        self.assertTrue(np.allclose(depth_levels(0, -10, 2), [-2, -4, -6, -8, -10]))
+        self.assertTrue(np.allclose(depth_levels(0, -10, 3), [-3, -6, -9, -10]))
+        self.assertTrue(np.allclose(depth_levels(5, 4.5, 2), [4.5]))
+        self.assertEqual(len(depth_levels(0, 0, 2)), 0)
+        with self.assertRaises(ValueError):
+            depth_levels(0, -10, 0)
+
+    def test02(self):
+        """
+        gain : le motif n'est calculé qu'une fois au lieu d'une fois par niveau
+        """
+        cost = LayerCost(5, 0.1, 0.002, 0.01)
+        self.assertAlmostEqual(cost.recomputed, 0.51)
+        self.assertAlmostEqual(cost.saved, 0.4 - 0.002)
+
+
+class TestSpiral(unittest.TestCase):
+    def test01(self):
+        """
+        cercles concentriques : une seule polyligne continue, le rayon décroît d'un pas par tour
+        """
+        rings = [circle(0, 0, r, 50 + 10 * r) for r in (30, 27, 24, 21)]
+        points = spiral_path(rings, 0.5)
+        count = int(np.ceil(2 * np.pi * 30 / 0.5))
+        self.assertEqual(len(points), 5 * count + 1)
+        steps = np.hypot(*np.diff(points, axis=0).T)
+        self.assertTrue(steps.max() < 0.6)
+        radius = np.hypot(points[:, 0], points[:, 1])
+        self.assertTrue(np.allclose(radius[:count], 30, atol=0.01))
+        self.assertTrue(np.all(np.diff(radius[count:4 * count]) < 1e-3))
+        self.assertAlmostEqual(radius[2 * count], 27, delta=0.01)
+
+    def test02(self):
+        """
+        boucles de sens opposés : remises dans le sens de la première
+        """
+        rings = [circle(0, 0, 10, 200), circle(0, 0, 7, 200)[::-1]]
+        points = spiral_path(rings, 0.2)
+        angle = np.unwrap(np.arctan2(points[:, 1], points[:, 0]))
+        self.assertTrue(np.all(np.diff(angle) > 0))
+        self.assertAlmostEqual(angle[-1] - angle[0], 6 * np.pi, delta=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,391 @@
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from Backplot.Cache import BackplotCache
+from Sim.Batch import bucket_segments, simulate
+from Sim.Chain import ChainStep, program_key, simulate_chain
+from Sim.Heightmap import Heightmap, heightmap_triangles
+from Sim.Rapids import rapid_crashes
+from Sim.Snapshots import StockSnapshots
+from Sim.StockMesh import StockTiles
+from Sim.Timeline import Timeline
+from Sim.ToolProfile import BALL, BULL, DRILL, FLAT, profile_from_tool, tool_profile
+
+
+class TestHeightmap(unittest.TestCase):
+    def test01(self):
+        """
+        une fraise plate enlève la matière des cellules sous son disque, jusqu'à son bout
+        """
+        hm = Heightmap(0, 0, 10, 10, -5, 0, cell=0.5)
+        self.assertEqual((hm.nx, hm.ny), (20, 20))
+        hm.stamp(5, 5, -2, 1.0)
+        self.assertAlmostEqual(float(hm.z.min()), -2.0)
+        # cellule de centre (5.25, 5.25) coupée, (6.75, 5.25) intacte
+        self.assertEqual(hm.z[10, 10], -2.0)
+        self.assertEqual(hm.z[10, 13], 0.0)
+        # une passe moins profonde ne remet pas de matière
+        hm.stamp(5, 5, -1, 2.0)
+        self.assertEqual(hm.z[10, 10], -2.0)
+        self.assertEqual(hm.z[10, 12], -1.0)
+        # hors du brut et au-dessus : rien
+        hm.stamp(50, 50, -3, 1.0)
+        hm.stamp(5, 5, 1, 1.0)
+        self.assertGreater(hm.removed_volume(), 0.0)
+
+    def test02(self):
+        """
+        taille de cellule augmentée au-delà de max_cells, maillage fermé du brut
+        """
+        hm = Heightmap(0, 0, 100, 100, 0, 10, cell=0.01, max_cells=10000)
+        self.assertLessEqual(hm.nx * hm.ny, 10000)
+        hm = Heightmap(0, 0, 4, 3, 0, 1, cell=1.0)
+        tris = heightmap_triangles(hm)
+        # dessus 2 * 3 * 2, côtés 2 * (3 + 3 + 2 + 2), fond en éventail sur les 10 sommets du contour
+        self.assertEqual(tris.shape, (12 + 20 + 10, 3, 3))
+        # chaque arête est partagée par exactement deux triangles
+        edges = {}
+        for t in tris.round(4):
+            for a, b in ((0, 1), (1, 2), (2, 0)):
+                key = tuple(sorted((tuple(t[a]), tuple(t[b]))))
+                edges[key] = edges.get(key, 0) + 1
+        self.assertTrue(all(n == 2 for n in edges.values()))
+
+
+class TestSweep(unittest.TestCase):
+    def test01(self):
+        """
+        volume balayé = limite des positions échantillonnées, indépendant du découpage
+        """
+        a, b, c = (1.0, 2.0, 0.5), (8.0, 6.0, -2.0), (3.0, 9.0, -1.0)
+        swept = Heightmap(0, 0, 10, 10, -5, 0, cell=0.25)
+        swept.sweep([a, b], [b, c], 1.5)
+        split = Heightmap(0, 0, 10, 10, -5, 0, cell=0.25)
+        for p, q in ((a, b), (b, c)):
+            t = np.linspace(0.0, 1.0, 8)[:, None]
+            points = np.array(p) + t * (np.array(q) - np.array(p))
+            split.sweep(points[:-1], points[1:], 1.5)
+        self.assertTrue(np.allclose(swept.z, split.z, atol=1e-5))
+
+        sampled = Heightmap(0, 0, 10, 10, -5, 0, cell=0.25)
+        for p, q in ((a, b), (b, c)):
+            for t in np.linspace(0.0, 1.0, 2000):
+                x, y, z = np.array(p) + t * (np.array(q) - np.array(p))
+                sampled.stamp(x, y, z, 1.5)
+        self.assertTrue(np.allclose(swept.z, sampled.z, atol=0.01))
+        # une plongée verticale ne coupe que sous l'outil
+        swept.sweep((5.0, 1.0, 0.0), (5.0, 1.0, -4.0), 0.5)
+        self.assertAlmostEqual(float(swept.z.min()), -4.0)
+
+
+class FakeTool:
+    def __init__(self, type, diameter, torus_radius=0.0, point_angle=118.0):
+        self.type = type
+        self.diameter = diameter
+        self.torus_radius = torus_radius
+        self.point_angle = point_angle
+
+
+class TestToolProfile(unittest.TestCase):
+    def test01(self):
+        """
+        profils des types d'outils de la base, partagés par paramètres
+        """
+        self.assertEqual(profile_from_tool(FakeTool("Fraise", 6.0)).kind, FLAT)
+        self.assertEqual(profile_from_tool(FakeTool("Fraise", 6.0, torus_radius=3.0)).kind, BALL)
+        self.assertEqual(profile_from_tool(FakeTool("Fraise torique", 6.0, torus_radius=1.0)).kind, BULL)
+        self.assertEqual(profile_from_tool(FakeTool("Foret", 6.0)).kind, DRILL)
+        self.assertEqual(profile_from_tool(FakeTool("Taraud", 6.0)).kind, FLAT)
+        self.assertIs(profile_from_tool(FakeTool("Fraise", 6.0)), tool_profile(FLAT, 3.0))
+
+        ball = tool_profile(BALL, 3.0)
+        self.assertTrue(np.allclose(ball.height([0.0, 3.0]), [0.0, 3.0]))
+        bull = tool_profile(BULL, 3.0, 1.0)
+        self.assertTrue(np.allclose(bull.height([0.0, 2.0, 3.0]), [0.0, 0.0, 1.0]))
+        drill = tool_profile(DRILL, 3.0, point_angle=90.0)
+        self.assertTrue(np.allclose(drill.height([0.0, 1.5, 3.0]), [0.0, 1.5, 3.0]))
+        self.assertTrue(np.isinf(drill.height(3.5)))
+
+    def test02(self):
+        """
+        balayage avec profil = limite des positions échantillonnées ; profil plat = fraise plate
+        """
+        a, b, c = (1.0, 2.0, 0.5), (8.0, 6.0, -2.0), (3.0, 6.0, -2.0)
+        for profile in (tool_profile(BALL, 1.5), tool_profile(BULL, 1.5, 0.5), tool_profile(DRILL, 1.5)):
+            swept = Heightmap(0, 0, 10, 10, -5, 0, cell=0.25)
+            swept.sweep([a, b], [b, c], 1.0, profile)
+            sampled = Heightmap(0, 0, 10, 10, -5, 0, cell=0.25)
+            for p, q in ((a, b), (b, c)):
+                for t in np.linspace(0.0, 1.0, 2000):
+                    x, y, z = np.array(p) + t * (np.array(q) - np.array(p))
+                    sampled.stamp(x, y, z, 1.0, profile)
+            # segment horizontal exact, plongée à une demi-cellule de descente près
+            self.assertTrue(np.allclose(swept.z, sampled.z, atol=0.13), profile)
+            self.assertAlmostEqual(float(swept.z.min()), float(sampled.z.min()), places=2)
+
+        flat = Heightmap(0, 0, 10, 10, -5, 0, cell=0.25)
+        flat.sweep([a, b], [b, c], 1.5, tool_profile(FLAT, 1.5))
+        plain = Heightmap(0, 0, 10, 10, -5, 0, cell=0.25)
+        plain.sweep([a, b], [b, c], 1.5)
+        self.assertTrue(np.array_equal(flat.z, plain.z))
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        points = np.column_stack((rng.uniform(0, 40, 301), rng.uniform(0, 30, 301), rng.uniform(-3, 0.5, 301)))
+        self.p0, self.p1 = points[:-1], points[1:]
+
+    def test01(self):
+        """
+        découpage en tuiles : même brut que le balayage direct, en processus ou non
+        """
+        profile = tool_profile(BALL, 1.5)
+        direct = Heightmap(0, 0, 40, 30, -5, 0, cell=0.25)
+        direct.sweep(self.p0, self.p1, 1.5, profile)
+        for workers in (0, 2):
+            hm = Heightmap(0, 0, 40, 30, -5, 0, cell=0.25)
+            steps = []
+            self.assertTrue(simulate(hm, self.p0, self.p1, 1.5, profile, workers=workers, tile_cells=32,
+                                     progress=lambda n, total: steps.append((n, total))))
+            self.assertTrue(np.allclose(hm.z, direct.z, atol=1e-5))
+            self.assertEqual(steps[-1][0], steps[-1][1])
+        # 160 x 120 cellules : 5 x 4 tuiles, chaque segment rangé au moins une fois
+        order, offsets = bucket_segments(hm, self.p0, self.p1, 1.5, tile_cells=32)
+        self.assertEqual(len(offsets), 5 * 4 + 1)
+        self.assertEqual(set(order.tolist()), set(range(len(self.p0))))
+
+    def test02(self):
+        """
+        interruption : les tuiles restantes sont abandonnées
+        """
+        hm = Heightmap(0, 0, 40, 30, -5, 0, cell=0.25)
+        steps = []
+        self.assertFalse(simulate(hm, self.p0, self.p1, 1.5, workers=0, tile_cells=32,
+                                  progress=lambda n, total: steps.append(n), cancelled=lambda: len(steps) > 2))
+        self.assertEqual(steps, [0, 1, 2])
+
+    def test03(self):
+        """
+        pool lancé par spawn : les tuiles sont balayées par des processus neufs
+        """
+        profile = tool_profile(BALL, 1.5)
+        direct = Heightmap(0, 0, 40, 30, -5, 0, cell=0.25)
+        direct.sweep(self.p0, self.p1, 1.5, profile)
+        hm = Heightmap(0, 0, 40, 30, -5, 0, cell=0.25)
+        self.assertTrue(simulate(hm, self.p0, self.p1, 1.5, profile, workers=2, tile_cells=32,
+                                 mp_context=multiprocessing.get_context("spawn")))
+        self.assertTrue(np.allclose(hm.z, direct.z, atol=1e-5))
+
+
+class TestStockTiles(unittest.TestCase):
+    def test01(self):
+        """
+        tuiles + fond = maillage complet du brut, quel que soit le découpage
+        """
+        for width, depth in ((10.0, 6.0), (8.5, 4.5), (0.5, 3.0)):
+            hm = Heightmap(0, 0, width, depth, -2, 0, cell=0.5)
+            hm.stamp(3.0, 2.0, -1.0, 1.2)
+            tiles = StockTiles(hm, tile_cells=4)
+            parts = [tiles.triangles(t) for t in range(len(tiles))] + [tiles.bottom_triangles()]
+            ours = np.concatenate(parts).reshape(-1, 9)
+            full = heightmap_triangles(hm).reshape(-1, 9)
+            self.assertEqual(ours.shape, full.shape, (width, depth))
+            self.assertTrue(np.array_equal(ours[np.lexsort(ours.T)], full[np.lexsort(full.T)]))
+
+    def test02(self):
+        """
+        seules les tuiles dont un sommet a changé sont à refaire
+        """
+        hm = Heightmap(0, 0, 20, 20, -2, 0, cell=0.5)
+        tiles = StockTiles(hm, tile_cells=8)
+        self.assertEqual((tiles.tx, tiles.ty), (5, 5))
+        self.assertEqual(len(tiles.take_dirty()), 0)
+        before = [tiles.vertices(t) for t in range(len(tiles))]
+        hm.stamp(2.1, 2.1, -1.0, 0.3)
+        dirty = set(tiles.take_dirty().tolist())
+        self.assertEqual(dirty, {0})
+        # cellule (8, 8) : sommet commun aux tuiles 0, 1, 5 et 6
+        hm.z[8, 8] = -1.5
+        self.assertEqual(set(tiles.take_dirty().tolist()), {0, 1, 5, 6})
+        self.assertEqual(len(tiles.take_dirty()), 0)
+        for t in range(len(tiles)):
+            if t not in (0, 1, 5, 6):
+                self.assertTrue(np.array_equal(before[t], tiles.vertices(t)))
+
+
+class TestTimeline(unittest.TestCase):
+    def test01(self):
+        """
+        instants -> segment et point ; rapides plus rapides ; segments nuls sautés
+        """
+        p0 = [(0, 0, 0), (10, 0, 0), (10, 0, 0), (10, 10, 0)]
+        p1 = [(10, 0, 0), (10, 0, 0), (10, 10, 0), (10, 10, -5)]
+        timeline = Timeline(p0, p1, rapid=[False, False, True, False], rapid_factor=2.0)
+        self.assertEqual(timeline.total_length, 25.0)
+        self.assertEqual(timeline.total_time, 20.0)
+        self.assertEqual(timeline.locate(5.0), (0, 0.5))
+        self.assertEqual(timeline.locate(10.0), (2, 0.0))
+        self.assertTrue(np.allclose(timeline.point(12.5), (10, 5, 0)))
+        self.assertAlmostEqual(timeline.distance(12.5), 15.0)
+        self.assertTrue(np.allclose(timeline.point(100.0), (10, 10, -5)))
+        self.assertTrue(np.allclose(timeline.point(-1.0), (0, 0, 0)))
+
+    def test02(self):
+        """
+        brut balayé par morceaux de la ligne de temps = brut balayé d'un coup
+        """
+        rng = np.random.default_rng(5)
+        points = np.column_stack((rng.uniform(0, 20, 60), rng.uniform(0, 20, 60), rng.uniform(-3, 0, 60)))
+        timeline = Timeline(points[:-1], points[1:])
+        whole = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        whole.sweep(*timeline.path(0.0, timeline.total_time), 1.0)
+        steps = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        times = np.linspace(0.0, timeline.total_time, 37)
+        for t0, t1 in zip(times[:-1], times[1:]):
+            steps.sweep(*timeline.path(t0, t1), 1.0)
+        self.assertTrue(np.allclose(whole.z, steps.z, atol=1e-4))
+
+
+class TestSnapshots(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        points = np.column_stack((rng.uniform(0, 30, 41), rng.uniform(0, 30, 41), rng.uniform(-3, 0, 41)))
+        self.timeline = Timeline(points[:-1], points[1:])
+
+    def simulate(self, snapshots, hm, count):
+        """Balaye la ligne de temps en prenant count instantanés ; renvoie les états de référence"""
+        states = [hm.z.copy()]
+        for k in range(1, count + 1):
+            hm.sweep(*self.timeline.path(snapshots.time(k - 1), snapshots.time(k)), 1.0)
+            snapshots.record()
+            states.append(hm.z.copy())
+        return states
+
+    def test01(self):
+        """
+        restauration d'un instantané quelconque, depuis un état intermédiaire
+        """
+        hm = Heightmap(0, 0, 30, 30, -5, 0, cell=0.25)
+        snapshots = StockSnapshots(hm, self.timeline.total_time / 10, tile_cells=16)
+        states = self.simulate(snapshots, hm, 10)
+        self.assertEqual((snapshots.first, snapshots.last), (0, 10))
+        for k in (3, 7, 0, 10, 5, 5):
+            # état quelconque : restauration puis un bout de balayage
+            hm.sweep(*self.timeline.path(snapshots.time(snapshots.base), snapshots.time(snapshots.base) + 2.0), 1.0)
+            snapshots.restore(k)
+            self.assertTrue(np.array_equal(hm.z, states[k]), k)
+        self.assertLess(snapshots.nbytes, 11 * hm.z.nbytes)
+
+    def test02(self):
+        """
+        mémoire bornée : les plus anciens instantanés sont abandonnés
+        """
+        hm = Heightmap(0, 0, 30, 30, -5, 0, cell=0.25)
+        snapshots = StockSnapshots(hm, self.timeline.total_time / 20, tile_cells=16, max_bytes=60000)
+        states = self.simulate(snapshots, hm, 20)
+        self.assertLessEqual(snapshots.nbytes, 60000)
+        self.assertGreater(snapshots.first, 0)
+        self.assertEqual(snapshots.last, 20)
+        for k in (snapshots.first, 20, snapshots.first + 1):
+            snapshots.restore(k)
+            self.assertTrue(np.array_equal(hm.z, states[k]), k)
+        with self.assertRaises(IndexError):
+            snapshots.restore(snapshots.first - 1)
+
+
+class TestRapids(unittest.TestCase):
+    def test01(self):
+        """
+        collisions : matière au-dessus du bas de l'outil, brut non modifié
+        """
+        hm = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        hm.sweep((2, 10, -2), (18, 10, -2), 1.0)
+        z = hm.z.copy()
+        hit = hm.collisions([(2, 10, -1), (2, 10, -1), (2, 3, 1), (2, 3, -0.5)],
+                            [(18, 10, -1), (2, 15, -1), (18, 3, 1), (2, 3, -0.5)], 1.0)
+        self.assertEqual(hit.tolist(), [False, True, False, True])
+        self.assertTrue(np.array_equal(hm.z, z))
+        ball = tool_profile(BALL, 1.0)
+        self.assertFalse(hm.collisions((2, 10, -1.5), (18, 10, -1.5), 1.0, ball)[0])
+
+    def test02(self):
+        """
+        programme rejoué : un rapide est testé contre le brut laissé par les passes précédentes
+        """
+        p = np.array([(2, 10, 2), (2, 10, -2), (18, 10, -2), (18, 10, -1), (2, 10, -1),
+                      (2, 10, 2), (2, 3, -1), (18, 3, -1)], dtype=float)
+        rapid = [False, False, False, True, True, True, False]
+        hm = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        crashes = rapid_crashes(hm, p[:-1], p[1:], rapid, 1.0)
+        # retour à z -1 dans la rainure : libre ; descente rapide en (2, 3) dans la matière
+        self.assertEqual(crashes.tolist(), [5])
+        self.assertAlmostEqual(float(hm.z.min()), -2.0)
+
+    def test03(self):
+        """
+        une seule passe sur le programme : mêmes rapides que le rejeu segment par segment
+        """
+        rng = np.random.default_rng(1)
+        points = np.column_stack((rng.uniform(0, 20, 300), rng.uniform(0, 20, 300), rng.uniform(-3, 0.5, 300)))
+        p0, p1 = points[:-1], points[1:]
+        rapid = rng.random(len(p0)) < 0.4
+        for profile in (None, tool_profile(BALL, 1.0)):
+            hm = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+            crashes = rapid_crashes(hm, p0, p1, rapid, 1.0, profile)
+            expected = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+            reference = []
+            for i in range(len(p0)):
+                if rapid[i] and expected.collisions(p0[i], p1[i], 1.0, profile, 0.01)[0]:
+                    reference.append(i)
+                expected.sweep(p0[i], p1[i], 1.0, profile)
+            self.assertEqual(crashes.tolist(), reference)
+            self.assertTrue(np.array_equal(hm.z, expected.z))
+
+
+class TestChain(unittest.TestCase):
+    def steps(self, depth):
+        ball = tool_profile(BALL, 1.5)
+        flat = tool_profile(FLAT, 1.0)
+        return [ChainStep("ebauche", program_key("G1 Z-2", 2.0), [(2, 10, -2)], [(18, 10, -2)], tool_profile(FLAT, 2.0)),
+                ChainStep("poche", program_key("G1 Z%g" % depth, 1.5), [(4, 4, depth)], [(16, 16, depth)], ball),
+                ChainStep("finition", program_key("G1 Z-1", 1.0), [(10, 2, -1)], [(10, 18, -1)], flat)]
+
+    def test01(self):
+        """
+        la chaîne donne le brut des balayages successifs ; une opération modifiée ne resimule que la suite
+        """
+        cache = BackplotCache(1 << 20)
+        hm = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        self.assertEqual(simulate_chain(hm, self.steps(-3), cache), 3)
+        expected = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        for step in self.steps(-3):
+            expected.sweep(step.p0, step.p1, step.profile.radius, step.profile)
+        self.assertTrue(np.array_equal(hm.z, expected.z))
+
+        hm = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        self.assertEqual(simulate_chain(hm, self.steps(-3), cache), 0)
+        self.assertTrue(np.array_equal(hm.z, expected.z))
+
+        hm = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        self.assertEqual(simulate_chain(hm, self.steps(-4), cache), 2)
+        self.assertAlmostEqual(float(hm.z.min()), -4.0)
+
+    def test02(self):
+        """
+        annulation : pas de résultat, les étapes terminées restent en cache
+        """
+        cache = BackplotCache(1 << 20)
+        hm = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        calls = []
+        self.assertIsNone(simulate_chain(hm, self.steps(-3), cache,
+                                         progress=lambda n, total: calls.append(n),
+                                         cancelled=lambda: len(calls) > 1))
+        hm = Heightmap(0, 0, 20, 20, -5, 0, cell=0.25)
+        self.assertEqual(simulate_chain(hm, self.steps(-3), cache), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
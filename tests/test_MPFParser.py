@@ -1,6 +1,6 @@
 import unittest
 
-from .MPFParser import MPFParser
+from MPFParser import MPFParser
 
 
 class TestMPFParser(unittest.TestCase):
@@ -12,6 +12,21 @@ class TestMPFParser(unittest.TestCase):
         self.assertEqual(operations[0]['Type'], 'mcode')
         self.assertEqual(operations[0]['M'], ['M30'])
 
+    def test_parse_program(self):
+        content = ';Fraise D10\nT1 S1200\nN10 G54\nG0 X10 Y-5.5 Z.5\nG2 X0 Y0 I-5 J0\nM5 M9\n'
+        operations = MPFParser(content).parse()
+        self.assertEqual([op['Type'] for op in operations],
+                         ['commentaire', 'toolCall', 'gcode', 'gcode', 'gcode', 'mcode'])
+        self.assertEqual(operations[0]['Commentaire'], 'Fraise D10')
+        self.assertEqual(operations[1], {"Type": "toolCall", "T": 1, "S": 1200})
+        self.assertEqual(operations[2]['G'], 54)
+        self.assertEqual(operations[3], {"Type": "gcode", "G": 0, "X": 10.0, "Y": -5.5, "Z": 0.5})
+        self.assertEqual(operations[4]['I'], -5.0)
+        self.assertEqual(operations[5]['M'], ['M5', 'M9'])
+
+    def test_parse_invalid(self):
+        with self.assertRaises(Exception):
+            MPFParser('G1 X1 X2').parse()
+
 if __name__ == '__main__':
     unittest.main()
-